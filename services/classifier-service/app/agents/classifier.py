@@ -1,45 +1,214 @@
-from typing import Dict, List, Any
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Any, Mapping, Optional, Set, Tuple
+import os
+import re
+import threading
+import time
 import structlog
 import asyncio
 
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional, precompiled regexes are used instead
+    ahocorasick = None
+
 from ..models.schemas import ClassificationResponse, MessageContext
 from ..ai.model_manager import model_manager
+from ..ai.batcher import batcher
 
 logger = structlog.get_logger()
 
+# Keyword sets used by the fallback classifier; read-only so instances can be shared freely
+FALLBACK_KEYWORDS: Mapping[str, FrozenSet[str]] = MappingProxyType({
+    "urgent": frozenset(["urgente", "no funciona", "cerrado", "sistema caído", "no pueden vender", "error", "crítico"]),
+    "technical": frozenset(["pos", "sistema", "software", "aplicación", "red", "internet", "servidor", "base de datos"]),
+    "operational": frozenset(["tienda", "inventario", "producto", "cliente", "venta", "caja", "personal"]),
+    "billing": frozenset(["factura", "cobro", "pago", "precio", "descuento", "promoción"]),
+    "general": frozenset(["pregunta", "consulta", "información", "horario", "ubicación"])
+})
+
+# Extra words that flag a support incident without being trigger words themselves
+INCIDENT_INDICATORS = frozenset(["problema", "ayuda", "falla", "no puede", "error", "roto"])
+
+# Results produced without a real model answer are never cached
+UNCACHEABLE_METHODS = ("keyword_fallback", "default")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Fallback decision rules in priority order: (matched keyword category, category, urgency)
+FALLBACK_RULES = (
+    ("urgent", "technical", "critical"),
+    ("technical", "technical", "medium"),
+    ("billing", "billing", "medium"),
+    ("operational", "general_inquiry", "low"),
+    ("incident", "technical", "medium"),
+)
+
+# A model answer missing any of these is not trusted and falls back to keywords
+REQUIRED_AI_FIELDS = ("is_support_incident", "confidence", "category")
+
+# Expected types of model answer fields; well-typed answers skip Pydantic validation
+_AI_FIELD_TYPES = {
+    "is_support_incident": bool,
+    "confidence": (int, float),
+    "category": str,
+    "urgency": str,
+    "summary": str,
+    "requires_followup": bool,
+    "suggested_response": str,
+    "extracted_info": dict,
+}
+
+def _build_fallback_decisions() -> Tuple[Tuple[str, str], ...]:
+    """Precompute (category, urgency) for every combination of matched categories"""
+    decisions = []
+    for mask in range(1 << len(FALLBACK_RULES)):
+        decision = ("not_support", "low")
+        for bit, (_, category, urgency) in enumerate(FALLBACK_RULES):
+            if mask & (1 << bit):
+                decision = (category, urgency)
+                break
+        decisions.append(decision)
+    return tuple(decisions)
+
+# Indexed by a bitmask with bit i set when FALLBACK_RULES[i] matched
+_FALLBACK_DECISIONS = _build_fallback_decisions()
+_FALLBACK_BITS = {name: 1 << bit for bit, (name, _, _) in enumerate(FALLBACK_RULES)}
+_INCIDENT_MASK = _FALLBACK_BITS["urgent"] | _FALLBACK_BITS["incident"]
+
 class MessageClassifier:
     def __init__(self):
-        self.fallback_keywords = {
-            "urgent": ["urgente", "no funciona", "cerrado", "sistema caído", "no pueden vender", "error", "crítico"],
-            "technical": ["pos", "sistema", "software", "aplicación", "red", "internet", "servidor", "base de datos"],
-            "operational": ["tienda", "inventario", "producto", "cliente", "venta", "caja", "personal"],
-            "billing": ["factura", "cobro", "pago", "precio", "descuento", "promoción"],
-            "general": ["pregunta", "consulta", "información", "horario", "ubicación"]
+        self.fallback_keywords = FALLBACK_KEYWORDS
+        
+        # AI results cached by normalized message text: key -> (expires_at, ai_result)
+        self.cache_max_size = int(os.getenv('CLASSIFICATION_CACHE_SIZE', '4096'))
+        self.cache_ttl = float(os.getenv('CLASSIFICATION_CACHE_TTL', '3600'))
+        self._ai_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # The cache is the only mutable state; guard it so handlers may run on several threads
+        self._cache_lock = threading.Lock()
+        
+        # Validate every AI result through Pydantic instead of only malformed ones (debugging aid)
+        self.strict_validation = os.getenv('CLASSIFICATION_STRICT_VALIDATION', 'false').lower() == 'true'
+        
+        # All keyword categories are matched in a single pass over the text
+        # (or one precompiled regex per category without pyahocorasick)
+        self._keyword_automaton = None
+        self._keyword_patterns = None
+        self._min_keyword_length = min(
+            len(keyword) for keywords in self._keywords_by_category().values() for keyword in keywords
+        )
+        if ahocorasick is not None:
+            self._keyword_automaton = self._build_keyword_automaton()
+        else:
+            self._keyword_patterns = self._build_keyword_patterns()
+    
+    def _keywords_by_category(self) -> Dict[str, List[str]]:
+        """Lowercased fallback keywords plus the incident-only indicators"""
+        keywords = {
+            category: [keyword.lower() for keyword in words]
+            for category, words in self.fallback_keywords.items()
         }
+        keywords["incident"] = [keyword.lower() for keyword in INCIDENT_INDICATORS]
+        return keywords
+    
+    def _build_keyword_automaton(self) -> "ahocorasick.Automaton":
+        """Build an Aho-Corasick automaton over the fallback keywords"""
+        categories_by_word: Dict[str, List[str]] = {}
+        for category, keywords in self._keywords_by_category().items():
+            for keyword in keywords:
+                categories_by_word.setdefault(keyword, []).append(category)
+        
+        automaton = ahocorasick.Automaton()
+        for word, categories in categories_by_word.items():
+            automaton.add_word(word, (word, tuple(categories)))
+        automaton.make_automaton()
+        return automaton
+    
+    def _build_keyword_patterns(self) -> Dict[str, "re.Pattern[str]"]:
+        """Compile one alternation regex per keyword category.
+        
+        The lookahead reports overlapping hits like the automaton does. Longer
+        keywords come first, so when two keywords of the same category start at
+        the same position only the longer one is reported.
+        """
+        return {
+            category: re.compile(
+                "(?=(" + "|".join(map(re.escape, sorted(keywords, key=len, reverse=True))) + "))"
+            )
+            for category, keywords in self._keywords_by_category().items()
+        }
+    
+    def _match_keywords(self, text: str) -> Dict[str, Set[str]]:
+        """Return the keywords found in text, grouped by category"""
+        text_lower = text.lower()
+        if len(text_lower) < self._min_keyword_length:
+            return {}
+        
+        matches: Dict[str, Set[str]] = {}
+        
+        if self._keyword_automaton is not None:
+            # Dedupe hits first: long texts repeat the same keywords many times
+            for word, categories in {value for _, value in self._keyword_automaton.iter(text_lower)}:
+                for category in categories:
+                    matches.setdefault(category, set()).add(word)
+            return matches
+        
+        for category, pattern in self._keyword_patterns.items():
+            found = set(pattern.findall(text_lower))
+            if found:
+                matches[category] = found
+        return matches
+    
+    def _trigger_words_from_matches(self, matches: Dict[str, Set[str]]) -> List[str]:
+        """Collect unique fallback keywords from a category match map"""
+        found_words = set()
+        for category, words in matches.items():
+            if category in self.fallback_keywords:
+                found_words.update(words)
+        return list(found_words)
     
     async def classify(self, text: str, context: MessageContext = None) -> ClassificationResponse:
         """
         Classify a message using AI models with fallback to keyword-based classification
         """
+        # Nothing for a model to read: answer from keywords without an AI call
+        if not text.strip() and not (context and context.has_media):
+            return self._fallback_classification(text)
+        
         try:
-            # Prepare context for AI model
-            ai_context = {}
-            if context:
-                ai_context = {
-                    "message_id": context.message_id,
-                    "sender": context.sender,
-                    "timestamp": context.timestamp.isoformat() if context.timestamp else None,
-                    "group_id": context.group_id,
-                    "has_media": context.has_media,
-                    "message_type": context.message_type
-                }
+            # Media messages can't be judged from their text alone, so skip the cache
+            cache_key = None if context and context.has_media else self._normalize_text(text)
+            ai_result = self._get_cached_ai_result(cache_key) if cache_key is not None else None
             
-            # Call AI model for classification
-            ai_result = await model_manager.classify_message(text, ai_context)
+            if ai_result is None:
+                # Prepare context for AI model
+                ai_context = {}
+                if context:
+                    ai_context = {
+                        "message_id": context.message_id,
+                        "sender": context.sender,
+                        "timestamp": context.timestamp.isoformat() if context.timestamp else None,
+                        "group_id": context.group_id,
+                        "has_media": context.has_media,
+                        "message_type": context.message_type
+                    }
+                
+                # Call AI model for classification, batched with concurrent messages when running
+                if batcher.running:
+                    ai_result = await batcher.submit(text, ai_context)
+                else:
+                    ai_result = await model_manager.classify_message(text, ai_context)
+            else:
+                logger.debug("Classification cache hit", text=text[:100])
+                cache_key = None  # Already cached, don't refresh the TTL
             
             # Convert AI result to our schema
             result = self._convert_ai_result(ai_result, text)
             
+            if cache_key is not None and result.extracted_info.get("classification_method") not in UNCACHEABLE_METHODS:
+                self._cache_ai_result(cache_key, ai_result)
+            
             logger.info(
                 "Message classified with AI",
                 text=text[:100],
@@ -55,58 +224,84 @@ class MessageClassifier:
             # Fallback to keyword-based classification
             return self._fallback_classification(text)
     
+    @staticmethod
+    def _normalize_text(text: str) -> str:
+        """Cache key for a message: lowercased with whitespace collapsed"""
+        return _WHITESPACE_RE.sub(" ", text.strip().lower())
+    
+    def _get_cached_ai_result(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached AI result if present and not expired"""
+        with self._cache_lock:
+            entry = self._ai_cache.get(key)
+            if entry is None:
+                return None
+            
+            expires_at, ai_result = entry
+            if time.monotonic() >= expires_at:
+                del self._ai_cache[key]
+                return None
+            
+            self._ai_cache.move_to_end(key)
+            return ai_result
+    
+    def _cache_ai_result(self, key: str, ai_result: Dict[str, Any]):
+        """Store an AI result, evicting the least recently used entries"""
+        if self.cache_max_size <= 0:
+            return
+        
+        with self._cache_lock:
+            self._ai_cache[key] = (time.monotonic() + self.cache_ttl, ai_result)
+            self._ai_cache.move_to_end(key)
+            while len(self._ai_cache) > self.cache_max_size:
+                self._ai_cache.popitem(last=False)
+    
     def _convert_ai_result(self, ai_result: Dict[str, Any], original_text: str) -> ClassificationResponse:
         """Convert AI model result to our response schema"""
+        missing = [field for field in REQUIRED_AI_FIELDS if field not in ai_result]
+        if missing:
+            logger.error("AI result missing required fields", missing=missing, ai_result=ai_result)
+            return self._fallback_classification(original_text)
+        
+        fields = {
+            "is_support_incident": ai_result["is_support_incident"],
+            "confidence": ai_result["confidence"],
+            "category": ai_result["category"],
+            "urgency": ai_result.get("urgency", "low"),
+            "summary": ai_result.get("summary", ""),
+            "requires_followup": ai_result.get("requires_followup", True),
+            "suggested_response": ai_result.get("suggested_response", ""),
+            # Copied: ai_result may be a cached object shared by every later hit
+            "extracted_info": dict(ai_result.get("extracted_info") or {}),
+            "trigger_words": self._extract_trigger_words(original_text),
+            "processing_time": 0.0  # Will be set by the caller
+        }
+        
+        # Well-typed answers are trusted as-is; anything else goes through full validation
+        if not self.strict_validation and all(
+            isinstance(fields[field], expected) for field, expected in _AI_FIELD_TYPES.items()
+        ):
+            fields["confidence"] = float(fields["confidence"])
+            return ClassificationResponse.model_construct(**fields)
+        
         try:
-            return ClassificationResponse(
-                is_support_incident=ai_result.get("is_support_incident", False),
-                confidence=float(ai_result.get("confidence", 0.0)),
-                category=ai_result.get("category", "general_inquiry"),
-                urgency=ai_result.get("urgency", "low"),
-                summary=ai_result.get("summary", ""),
-                requires_followup=ai_result.get("requires_followup", True),
-                suggested_response=ai_result.get("suggested_response", ""),
-                extracted_info=ai_result.get("extracted_info", {}),
-                trigger_words=self._extract_trigger_words(original_text),
-                processing_time=0.0  # Will be set by the caller
-            )
+            return ClassificationResponse(**fields)
         except Exception as e:
             logger.error("Failed to convert AI result", error=str(e), ai_result=ai_result)
             return self._fallback_classification(original_text)
     
     def _fallback_classification(self, text: str) -> ClassificationResponse:
         """Keyword-based fallback classification when AI fails"""
-        text_lower = text.lower()
+        matches = self._match_keywords(text)
         
         # Detect trigger words
-        trigger_words = self._extract_trigger_words(text)
+        trigger_words = self._trigger_words_from_matches(matches)
         
-        # Determine if it's a support incident
-        incident_indicators = (
-            self.fallback_keywords["urgent"] + 
-            ["problema", "ayuda", "falla", "no puede", "error", "roto"]
-        )
-        is_incident = any(keyword in text_lower for keyword in incident_indicators)
-        
-        # Determine category and urgency
-        category = "not_support"
-        urgency = "low"
-        
-        if any(keyword in text_lower for keyword in self.fallback_keywords["urgent"]):
-            category = "technical"
-            urgency = "critical"
-        elif any(keyword in text_lower for keyword in self.fallback_keywords["technical"]):
-            category = "technical"
-            urgency = "medium"
-        elif any(keyword in text_lower for keyword in self.fallback_keywords["billing"]):
-            category = "billing"
-            urgency = "medium"
-        elif any(keyword in text_lower for keyword in self.fallback_keywords["operational"]):
-            category = "general_inquiry"
-            urgency = "low"
-        elif is_incident:
-            category = "technical"
-            urgency = "medium"
+        # Determine incident, category and urgency from the matched categories
+        mask = 0
+        for name in matches:
+            mask |= _FALLBACK_BITS.get(name, 0)
+        is_incident = bool(mask & _INCIDENT_MASK)
+        category, urgency = _FALLBACK_DECISIONS[mask]
         
         # Calculate confidence based on trigger words
         confidence = min(0.8, len(trigger_words) * 0.2) if is_incident else 0.3
@@ -135,15 +330,7 @@ class MessageClassifier:
     
     def _extract_trigger_words(self, text: str) -> List[str]:
         """Extract relevant trigger words from text"""
-        text_lower = text.lower()
-        found_words = []
-        
-        for category, keywords in self.fallback_keywords.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    found_words.append(keyword)
-        
-        return list(set(found_words))  # Remove duplicates
+        return self._trigger_words_from_matches(self._match_keywords(text))
 
 # Global instance
 classifier = MessageClassifier()
\ No newline at end of file
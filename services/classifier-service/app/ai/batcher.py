@@ -0,0 +1,115 @@
+import asyncio
+import os
+from typing import Dict, Any, List, Optional, Set, Tuple
+import structlog
+
+from .model_manager import AIModelManager, model_manager
+
+logger = structlog.get_logger()
+
+PendingClassification = Tuple[str, Dict[str, Any], asyncio.Future]
+
+class ClassificationBatcher:
+    """Coalesce concurrent classification requests into multi-message model calls"""
+
+    def __init__(self, manager: AIModelManager):
+        self.manager = manager
+        self.max_batch_size = int(os.getenv('CLASSIFICATION_BATCH_SIZE', '16'))
+        self.max_wait = int(os.getenv('CLASSIFICATION_BATCH_WAIT_MS', '50')) / 1000
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the background batching loop (batch size <= 1 disables batching)"""
+        if self.running or self.max_batch_size <= 1:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Classification batcher started",
+                   max_batch_size=self.max_batch_size,
+                   max_wait_ms=self.max_wait * 1000)
+
+    async def stop(self):
+        """Stop the loop and classify anything still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def submit(self, text: str, context: Dict[str, Any] = None) -> asyncio.Future:
+        """Queue a message; the returned future resolves to its AI classification"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, context or {}, future))
+        return future
+
+    async def flush(self):
+        """Classify everything currently queued without waiting for the batch window"""
+        if self._queue is not None:
+            pending = []
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+
+            for i in range(0, len(pending), self.max_batch_size):
+                await self._dispatch(pending[i:i + self.max_batch_size])
+
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self._dispatch_in_background(await self._drain())
+
+    def _dispatch_in_background(self, batch: List[PendingClassification]):
+        task = asyncio.create_task(self._dispatch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _drain(self) -> List[PendingClassification]:
+        """Wait for one message, then collect more until the batch is full or the window closes"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        try:
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            # Stopped mid-window: the batch is already off the queue, so send it
+            # now; stop() waits for it through flush()
+            self._dispatch_in_background(batch)
+            raise
+
+        return batch
+
+    async def _dispatch(self, batch: List[PendingClassification]):
+        try:
+            results = await self.manager.classify_messages([(text, context) for text, context, _ in batch])
+        except Exception as e:
+            logger.error("Batch classification failed", batch_size=len(batch), error=str(e))
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+# Global instance
+batcher = ClassificationBatcher(model_manager)
@@ -0,0 +1,77 @@
+import os
+from typing import List, Optional, Tuple
+import structlog
+
+try:
+    import numpy as np
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+except ImportError:  # Optional: the local tier stays disabled without them
+    np = None
+    ort = None
+    Tokenizer = None
+
+logger = structlog.get_logger()
+
+class LocalClassifier:
+    """Quantized ONNX text classifier that answers confident cases before any cloud LLM"""
+
+    def __init__(self):
+        self.model_path = os.getenv('LOCAL_MODEL_PATH', '')
+        self.tokenizer_path = os.getenv('LOCAL_TOKENIZER_PATH', '')
+        self.labels: List[str] = [
+            label.strip()
+            for label in os.getenv('LOCAL_MODEL_LABELS', 'not_support,technical,billing').split(',')
+        ]
+        self.threshold = float(os.getenv('LOCAL_MODEL_THRESHOLD', '0.85'))
+        self.max_length = int(os.getenv('LOCAL_MODEL_MAX_LENGTH', '128'))
+
+        self.session = None
+        self.tokenizer = None
+        self._input_names = set()
+
+    @property
+    def available(self) -> bool:
+        return self.session is not None
+
+    def load(self):
+        """Load the ONNX model and tokenizer when LOCAL_MODEL_PATH is configured"""
+        if not self.model_path:
+            return
+        if ort is None:
+            logger.warning("Local model configured but onnxruntime/tokenizers are not installed")
+            return
+
+        try:
+            tokenizer = Tokenizer.from_file(self.tokenizer_path)
+            tokenizer.enable_truncation(self.max_length)
+            session = ort.InferenceSession(self.model_path, providers=["CPUExecutionProvider"])
+            outputs = session.get_outputs()[0].shape
+            if outputs and isinstance(outputs[-1], int) and outputs[-1] != len(self.labels):
+                raise ValueError(f"Model has {outputs[-1]} classes but {len(self.labels)} labels are configured")
+
+            self._input_names = {model_input.name for model_input in session.get_inputs()}
+            self.tokenizer = tokenizer
+            self.session = session
+            logger.info("Local classification model loaded",
+                       model=self.model_path,
+                       labels=self.labels,
+                       threshold=self.threshold)
+        except Exception as e:
+            logger.error("Failed to load local classification model", error=str(e))
+
+    def infer(self, text: str) -> Tuple[str, float]:
+        """Return the most likely label and its softmax probability"""
+        encoding = self.tokenizer.encode(text)
+        feeds = {
+            "input_ids": np.array([encoding.ids], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids], dtype=np.int64),
+        }
+        feeds = {name: value for name, value in feeds.items() if name in self._input_names}
+
+        logits = self.session.run(None, feeds)[0][0]
+        exp = np.exp(logits - logits.max())
+        probabilities = exp / exp.sum()
+        index = int(probabilities.argmax())
+        return self.labels[index], float(probabilities[index])
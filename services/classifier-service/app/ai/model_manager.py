@@ -1,20 +1,71 @@
 import asyncio
-import json
+import importlib.util
+import orjson
 import os
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from enum import Enum
 import structlog
-import aiohttp
+import httpx
 from openai import AsyncOpenAI
 import google.generativeai as genai
 
+from .semantic_cache import SemanticCache
+from .local_model import LocalClassifier
+
+# httpx needs the h2 extra for HTTP/2, otherwise it falls back to HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
 logger = structlog.get_logger()
 
+# Response schema, part of the static prompt prefix shared by single and batch calls
+CLASSIFICATION_FORMAT = """{
+    "is_support_incident": boolean,
+    "confidence": float (0.0 to 1.0),
+    "category": string ("technical", "billing", "general_inquiry", "complaint", "compliment", "not_support"),
+    "urgency": string ("low", "medium", "high", "critical"),
+    "summary": string (brief summary of the issue),
+    "requires_followup": boolean,
+    "suggested_response": string (suggested initial response),
+    "extracted_info": {
+        "user_type": string ("customer", "potential_customer", "internal", "unknown"),
+        "product_mentioned": string or null,
+        "error_code": string or null,
+        "contact_info": string or null
+    }
+}
+
+Guidelines:
+- is_support_incident: true if this needs technical support attention
+- confidence: how certain you are about the classification
+- category: the type of support request
+- urgency: based on business impact and tone
+- summary: concise description in Spanish
+- requires_followup: true if more information is needed
+- suggested_response: appropriate initial response in Spanish
+- extracted_info: any relevant details found in the message"""
+
+# Static prompt prefix, built once at import so every call sends identical bytes
+_PROMPT_PREFIX = f"""You are an expert support ticket classifier. Analyze WhatsApp messages and determine if they represent a technical support incident that requires assistance.
+
+Classify each message and respond with a JSON object containing:
+
+{CLASSIFICATION_FORMAT}
+
+Respond only with valid JSON.
+"""
+
 class ModelProvider(Enum):
     OPENAI = "openai"
     GOOGLE = "google"
     ANTHROPIC = "anthropic"
 
+# Largest output budget each provider's model accepts for one completion
+MAX_OUTPUT_TOKENS = {
+    ModelProvider.OPENAI: 16384,     # gpt-4o-mini
+    ModelProvider.GOOGLE: 8192,      # gemini (budget not sent, kept for completeness)
+    ModelProvider.ANTHROPIC: 4096,   # claude-3-haiku
+}
+
 class AIModelManager:
     def __init__(self):
         self.primary_model = ModelProvider(os.getenv('PRIMARY_AI_MODEL', 'openai'))
@@ -27,6 +78,15 @@ class AIModelManager:
         self.google_client = None
         self.anthropic_client = None
         
+        # One pooled (HTTP/2 when available) client shared by the OpenAI SDK and REST providers
+        self.http_client = self._create_http_client()
+        
+        # Optional embedding cache for near-duplicate messages
+        self.semantic_cache = SemanticCache()
+        
+        # Optional local model tried before any cloud provider
+        self.local_model = LocalClassifier()
+        
         self._initialize_clients()
     
     def _initialize_clients(self):
@@ -35,7 +95,7 @@ class AIModelManager:
             # OpenAI
             openai_key = os.getenv('OPENAI_API_KEY')
             if openai_key:
-                self.openai_client = AsyncOpenAI(api_key=openai_key)
+                self.openai_client = AsyncOpenAI(api_key=openai_key, http_client=self.http_client)
                 logger.info("OpenAI client initialized")
             
             # Google Gemini
@@ -59,13 +119,24 @@ class AIModelManager:
         """
         Classify if a message is a support incident and extract relevant information
         """
-        prompt = self._build_classification_prompt(message_text, context)
+        local = await self._classify_locally(message_text)
+        if local:
+            return local
+        
+        embedding = await self.semantic_cache.embed(message_text)
+        cached = await self.semantic_cache.lookup(embedding)
+        if cached:
+            logger.info("Message classified from semantic cache")
+            return cached
+        
+        prompt = self._dynamic_suffix(message_text, context)
         
         # Try primary model first
         try:
             result = await self._call_model(self.primary_model, prompt)
             if result:
                 logger.info("Message classified successfully", model=self.primary_model.value)
+                await self.semantic_cache.store(message_text, embedding, result)
                 return result
         except Exception as e:
             logger.warning("Primary model failed, trying fallback", 
@@ -76,6 +147,7 @@ class AIModelManager:
             result = await self._call_model(self.fallback_model, prompt)
             if result:
                 logger.info("Message classified with fallback", model=self.fallback_model.value)
+                await self.semantic_cache.store(message_text, embedding, result)
                 return result
         except Exception as e:
             logger.error("All models failed for classification", error=str(e))
@@ -83,56 +155,120 @@ class AIModelManager:
         # Return default classification if all models fail
         return self._default_classification()
     
-    def _build_classification_prompt(self, message_text: str, context: Dict[str, Any] = None) -> str:
-        """Build the classification prompt"""
-        prompt = f"""
-Analyze the following WhatsApp message and determine if it represents a technical support incident that requires assistance.
-
+    async def classify_messages(self, messages: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Classify several messages with a single model call, one result per message in order
+        """
+        if len(messages) == 1:
+            text, context = messages[0]
+            return [await self.classify_message(text, context)]
+        
+        results = list(await asyncio.gather(*(self._classify_locally(text) for text, _ in messages)))
+        remaining = [i for i, result in enumerate(results) if not result]
+        
+        embeddings = dict(zip(remaining, await asyncio.gather(
+            *(self.semantic_cache.embed(messages[i][0]) for i in remaining)
+        )))
+        cached = await asyncio.gather(*(self.semantic_cache.lookup(embeddings[i]) for i in remaining))
+        for i, result in zip(remaining, cached):
+            results[i] = result
+        pending = [i for i in remaining if not results[i]]
+        
+        if pending:
+            prompt = self._batch_dynamic_suffix([messages[i] for i in pending])
+            batch_results = await self._call_batch(prompt, len(pending))
+            
+            if batch_results is None:
+                # Batch answer unusable, classify the remaining messages one by one
+                batch_results = await asyncio.gather(
+                    *(self.classify_message(*messages[i]) for i in pending)
+                )
+            else:
+                await asyncio.gather(*(
+                    self.semantic_cache.store(messages[i][0], embeddings[i], result)
+                    for i, result in zip(pending, batch_results)
+                ))
+            
+            for i, result in zip(pending, batch_results):
+                results[i] = result
+        
+        return results
+    
+    async def _classify_locally(self, message_text: str) -> Optional[Dict[str, Any]]:
+        """Answer from the local model when it is loaded and confident enough"""
+        if not self.local_model.available:
+            return None
+        
+        try:
+            label, confidence = await asyncio.get_running_loop().run_in_executor(
+                None, self.local_model.infer, message_text
+            )
+        except Exception as e:
+            logger.warning("Local model inference failed", error=str(e))
+            return None
+        
+        if confidence < self.local_model.threshold:
+            return None
+        
+        logger.info("Message classified by local model", category=label, confidence=confidence)
+        return self._local_classification(label, confidence)
+    
+    async def _call_batch(self, prompt: str, expected: int) -> Optional[List[Dict[str, Any]]]:
+        """Call primary then fallback model with a batch prompt"""
+        for provider in (self.primary_model, self.fallback_model):
+            try:
+                # Output grows with the batch, so scale the token budget with it up to the provider limit
+                max_tokens = min(self.max_tokens * expected, MAX_OUTPUT_TOKENS[provider])
+                result = await self._call_model(provider, prompt, max_tokens=max_tokens)
+                classifications = result.get("classifications") if isinstance(result, dict) else None
+                if isinstance(classifications, list) and len(classifications) == expected:
+                    logger.info("Message batch classified", model=provider.value, batch_size=expected)
+                    return classifications
+                if result is not None:
+                    logger.warning("Batch classification returned wrong shape", model=provider.value)
+            except Exception as e:
+                logger.warning("Batch classification failed", model=provider.value, error=str(e))
+        return None
+    
+    def _static_prefix(self) -> str:
+        """Instructions and response schema, identical on every call so providers can cache them"""
+        return _PROMPT_PREFIX
+    
+    def _dynamic_suffix(self, message_text: str, context: Dict[str, Any] = None) -> str:
+        """Per-message part of the prompt"""
+        return f"""
 Message: "{message_text}"
 
-Context: {json.dumps(context or {}, indent=2)}
-
-Classify this message and respond with a JSON object containing:
-
-{{
-    "is_support_incident": boolean,
-    "confidence": float (0.0 to 1.0),
-    "category": string ("technical", "billing", "general_inquiry", "complaint", "compliment", "not_support"),
-    "urgency": string ("low", "medium", "high", "critical"),
-    "summary": string (brief summary of the issue),
-    "requires_followup": boolean,
-    "suggested_response": string (suggested initial response),
-    "extracted_info": {{
-        "user_type": string ("customer", "potential_customer", "internal", "unknown"),
-        "product_mentioned": string or null,
-        "error_code": string or null,
-        "contact_info": string or null
-    }}
-}}
-
-Guidelines:
-- is_support_incident: true if this needs technical support attention
-- confidence: how certain you are about the classification
-- category: the type of support request
-- urgency: based on business impact and tone
-- summary: concise description in Spanish
-- requires_followup: true if more information is needed
-- suggested_response: appropriate initial response in Spanish
-- extracted_info: any relevant details found in the message
+Context: {orjson.dumps(context or {}).decode()}
+"""
+    
+    def _build_classification_prompt(self, message_text: str, context: Dict[str, Any] = None) -> str:
+        """Build the full classification prompt (static prefix first)"""
+        return self._static_prefix() + self._dynamic_suffix(message_text, context)
+    
+    def _batch_dynamic_suffix(self, messages: List[Tuple[str, Dict[str, Any]]]) -> str:
+        """Per-batch part of the prompt classifying several messages at once"""
+        numbered = [
+            {"index": i, "message": text, "context": context or {}}
+            for i, (text, context) in enumerate(messages)
+        ]
+        return f"""
+Classify each of the following {len(messages)} messages independently. Respond with a JSON object of the form {{"classifications": [...]}} containing exactly one classification per message, in the same order.
 
-Respond only with valid JSON.
+Messages: {orjson.dumps(numbered).decode()}
 """
-        return prompt
     
-    async def _call_model(self, provider: ModelProvider, prompt: str) -> Optional[Dict[str, Any]]:
-        """Call specific AI model provider"""
+    async def _call_model(self, provider: ModelProvider, prompt: str,
+                          max_tokens: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Call specific AI model provider; prompt is the dynamic part sent after the static prefix"""
+        max_tokens = max_tokens or self.max_tokens
         try:
             if provider == ModelProvider.OPENAI and self.openai_client:
-                return await self._call_openai(prompt)
+                return await self._call_openai(prompt, max_tokens)
             elif provider == ModelProvider.GOOGLE and self.google_client:
                 return await self._call_google(prompt)
             elif provider == ModelProvider.ANTHROPIC and self.anthropic_client:
-                return await self._call_anthropic(prompt)
+                return await self._call_anthropic(prompt, max_tokens)
             else:
                 logger.warning("Model provider not available", provider=provider.value)
                 return None
@@ -140,39 +276,35 @@ Respond only with valid JSON.
             logger.error("Model call failed", provider=provider.value, error=str(e))
             raise
     
-    async def _call_openai(self, prompt: str) -> Dict[str, Any]:
+    async def _call_openai(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
         """Call OpenAI API"""
         model_name = os.getenv('MODEL_NAME', 'gpt-4o-mini')
         
         response = await self.openai_client.chat.completions.create(
             model=model_name,
             messages=[
-                {"role": "system", "content": "You are an expert support ticket classifier. Always respond with valid JSON."},
+                # OpenAI caches repeated prompt prefixes automatically
+                {"role": "system", "content": self._static_prefix()},
                 {"role": "user", "content": prompt}
             ],
             temperature=self.temperature,
-            max_tokens=self.max_tokens,
+            max_tokens=max_tokens or self.max_tokens,
             response_format={"type": "json_object"}
         )
         
         content = response.choices[0].message.content
-        return json.loads(content)
+        return orjson.loads(content)
     
     async def _call_google(self, prompt: str) -> Dict[str, Any]:
         """Call Google Gemini API"""
-        # Note: This is a simplified implementation
-        # In production, you'd want to use async version
-        response = await asyncio.get_event_loop().run_in_executor(
-            None, 
-            lambda: self.google_client.generate_content(
-                f"Respond only with valid JSON. {prompt}"
-            )
+        response = await self.google_client.generate_content_async(
+            self._static_prefix() + prompt
         )
         
         content = response.text
-        return json.loads(content)
+        return orjson.loads(content)
     
-    async def _call_anthropic(self, prompt: str) -> Dict[str, Any]:
+    async def _call_anthropic(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
         """Call Anthropic Claude API"""
         headers = {
             "Content-Type": "application/json",
@@ -182,25 +314,70 @@ Respond only with valid JSON.
         
         data = {
             "model": "claude-3-haiku-20240307",
-            "max_tokens": self.max_tokens,
+            "max_tokens": max_tokens or self.max_tokens,
             "temperature": self.temperature,
             "messages": [
                 {
                     "role": "user",
-                    "content": f"Respond only with valid JSON. {prompt}"
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": self._static_prefix(),
+                            "cache_control": {"type": "ephemeral"}
+                        },
+                        {"type": "text", "text": prompt}
+                    ]
                 }
             ]
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=data
-            ) as response:
-                result = await response.json()
-                content = result["content"][0]["text"]
-                return json.loads(content)
+        response = await self.http_client.post(
+            "https://api.anthropic.com/v1/messages",
+            headers=headers,
+            json=data
+        )
+        response.raise_for_status()
+        result = response.json()
+        content = result["content"][0]["text"]
+        return orjson.loads(content)
+    
+    @staticmethod
+    def _create_http_client() -> httpx.AsyncClient:
+        """Build the shared provider HTTP client"""
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    
+    async def close(self):
+        """Close the shared HTTP client"""
+        await self.http_client.aclose()
+    
+    def _local_classification(self, label: str, confidence: float) -> Dict[str, Any]:
+        """Build a full classification from a local model label"""
+        is_incident = label != "not_support"
+        if is_incident:
+            suggested_response = "Hemos recibido tu reporte y será atendido por nuestro equipo técnico. Te mantendremos informado del progreso."
+        else:
+            suggested_response = "Gracias por tu mensaje. ¿En qué podemos ayudarte?"
+        
+        return {
+            "is_support_incident": is_incident,
+            "confidence": confidence,
+            "category": label,
+            "urgency": "medium" if is_incident else "low",
+            "summary": "Mensaje clasificado por modelo local",
+            "requires_followup": is_incident,
+            "suggested_response": suggested_response,
+            "extracted_info": {
+                "user_type": "unknown",
+                "product_mentioned": None,
+                "error_code": None,
+                "contact_info": None,
+                "classification_method": "local_model"
+            }
+        }
     
     def _default_classification(self) -> Dict[str, Any]:
         """Return default classification when all models fail"""
@@ -216,7 +393,8 @@ Respond only with valid JSON.
                 "user_type": "unknown",
                 "product_mentioned": None,
                 "error_code": None,
-                "contact_info": None
+                "contact_info": None,
+                "classification_method": "default"
             }
         }
 
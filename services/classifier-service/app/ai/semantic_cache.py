@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import orjson
+import os
+from typing import Dict, Any, Optional
+import structlog
+from redis.exceptions import ResponseError
+from redis.commands.search.field import TagField, VectorField
+from redis.commands.search.query import Query
+
+try:
+    from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+except ImportError:  # redis-py >= 6 renamed the module
+    from redis.commands.search.index_definition import IndexDefinition, IndexType
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = None
+    SentenceTransformer = None
+
+logger = structlog.get_logger()
+
+# Classifications below this confidence are never reused for other messages
+DEFAULT_CONFIDENCE_FLOOR = 0.8
+
+class SemanticCache:
+    """Reuse AI classifications for near-duplicate messages via a RediSearch HNSW index"""
+
+    def __init__(self):
+        self.enabled = os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+        self.model_name = os.getenv('SEMANTIC_CACHE_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+        self.threshold = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+        self.ttl = int(os.getenv('SEMANTIC_CACHE_TTL', '86400'))
+        self.index_name = os.getenv('SEMANTIC_CACHE_INDEX', 'idx:classification_cache')
+        self.key_prefix = 'classification_cache:'
+        self.confidence_floors = self._parse_confidence_floors(
+            os.getenv('SEMANTIC_CACHE_CONFIDENCE_FLOORS', '')
+        )
+
+        self.redis = None
+        self.model = None
+
+    @staticmethod
+    def _parse_confidence_floors(raw: str) -> Dict[str, float]:
+        """Parse 'category=floor,...' overrides"""
+        floors = {}
+        for item in raw.split(','):
+            category, _, value = item.partition('=')
+            if category.strip() and value.strip():
+                floors[category.strip()] = float(value)
+        return floors
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None and self.redis is not None
+
+    async def initialize(self, redis_connection):
+        """Load the embedding model and make sure the vector index exists"""
+        if not self.enabled:
+            return
+        if SentenceTransformer is None:
+            logger.warning("Semantic cache enabled but sentence-transformers is not installed")
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+            model = await loop.run_in_executor(None, SentenceTransformer, self.model_name)
+            await self._ensure_index(redis_connection, model.get_sentence_embedding_dimension())
+            self.model = model
+            self.redis = redis_connection
+            logger.info("Semantic cache initialized", model=self.model_name, threshold=self.threshold)
+        except Exception as e:
+            logger.error("Failed to initialize semantic cache", error=str(e))
+
+    async def _ensure_index(self, redis_connection, dimension: int):
+        index = redis_connection.ft(self.index_name)
+        try:
+            await index.info()
+        except ResponseError:
+            await index.create_index(
+                [
+                    TagField('category'),
+                    VectorField('embedding', 'HNSW', {
+                        'TYPE': 'FLOAT32',
+                        'DIM': dimension,
+                        'DISTANCE_METRIC': 'COSINE',
+                    }),
+                ],
+                definition=IndexDefinition(prefix=[self.key_prefix], index_type=IndexType.HASH),
+            )
+            logger.info("Created semantic cache index", index=self.index_name)
+
+    async def embed(self, text: str) -> Optional[bytes]:
+        """Embed text as a FLOAT32 vector blob, or None when the cache is unavailable"""
+        if not self.available:
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+            vector = await loop.run_in_executor(
+                None, lambda: self.model.encode(text, normalize_embeddings=True)
+            )
+            return np.asarray(vector, dtype=np.float32).tobytes()
+        except Exception as e:
+            logger.warning("Failed to embed message", error=str(e))
+            return None
+
+    async def lookup(self, embedding: bytes) -> Optional[Dict[str, Any]]:
+        """Return the nearest cached classification if it is similar enough"""
+        if not self.available or embedding is None:
+            return None
+        try:
+            query = (
+                Query('*=>[KNN 1 @embedding $vec AS distance]')
+                .return_fields('classification', 'distance')
+                .dialect(2)
+            )
+            result = await self.redis.ft(self.index_name).search(query, query_params={'vec': embedding})
+            if not result.docs:
+                return None
+
+            doc = result.docs[0]
+            similarity = 1.0 - float(doc.distance)
+            if similarity < self.threshold:
+                return None
+
+            logger.debug("Semantic cache hit", similarity=round(similarity, 4))
+            return orjson.loads(doc.classification)
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed", error=str(e))
+            return None
+
+    def is_reusable(self, classification: Dict[str, Any]) -> bool:
+        """Only confident model answers may be served to other messages"""
+        method = (classification.get('extracted_info') or {}).get('classification_method')
+        if method == 'default':
+            return False
+        floor = self.confidence_floors.get(classification.get('category'), DEFAULT_CONFIDENCE_FLOOR)
+        return classification.get('confidence', 0.0) >= floor
+
+    async def store(self, text: str, embedding: bytes, classification: Dict[str, Any]):
+        """Index a classification under the message embedding"""
+        if not self.available or embedding is None or not self.is_reusable(classification):
+            return
+        try:
+            key = self.key_prefix + hashlib.sha1(text.encode('utf-8')).hexdigest()
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping={
+                    'embedding': embedding,
+                    'category': classification.get('category', 'unknown'),
+                    'classification': orjson.dumps(classification),
+                })
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("Failed to store semantic cache entry", error=str(e))
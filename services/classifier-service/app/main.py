@@ -1,13 +1,17 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from contextlib import asynccontextmanager
 import structlog
+import asyncio
 import os
-import json
+import orjson
 import time
 from datetime import datetime
+from typing import List, Optional
 from dotenv import load_dotenv
 
 from .agents.classifier import classifier
+from .ai.model_manager import model_manager
+from .ai.batcher import batcher
 from .utils.redis_client import RedisClient
 from .models.schemas import ClassificationRequest, ClassificationResponse, HealthResponse, MessageData, MessageContext
 
@@ -35,12 +39,28 @@ logger = structlog.get_logger()
 redis_client = RedisClient()
 message_subscriber = None
 
+# Inbound messages are queued for a fixed pool of workers; the bound applies backpressure
+# to the subscriber. Keep the pool at least as large as the classification batch size.
+WORKER_COUNT = int(os.getenv('CLASSIFIER_WORKERS', '16'))
+QUEUE_SIZE = int(os.getenv('CLASSIFIER_QUEUE_SIZE', '256'))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('CLASSIFIER_SHUTDOWN_TIMEOUT', '30'))
+message_queue: Optional[asyncio.Queue] = None
+message_workers: List[asyncio.Task] = []
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await redis_client.connect()
+    model_manager.local_model.load()
+    await model_manager.semantic_cache.initialize(redis_client.redis)
+    batcher.start()
     
-    # Start Redis message subscriber
+    # Start message workers, then the Redis subscriber feeding them
+    global message_queue
+    message_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    message_workers[:] = [
+        asyncio.create_task(message_worker(message_queue)) for _ in range(WORKER_COUNT)
+    ]
     subscriber_task = await start_message_subscriber()
     
     logger.info("Classifier service started")
@@ -49,6 +69,15 @@ async def lifespan(app: FastAPI):
     # Shutdown
     if subscriber_task:
         subscriber_task.cancel()
+    try:
+        await asyncio.wait_for(message_queue.join(), SHUTDOWN_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Shutdown with unprocessed messages", pending=message_queue.qsize())
+    for worker in message_workers:
+        worker.cancel()
+    await asyncio.gather(*message_workers, return_exceptions=True)
+    await batcher.stop()
+    await model_manager.close()
     await redis_client.disconnect()
     logger.info("Classifier service shutdown")
 
@@ -63,7 +92,6 @@ async def start_message_subscriber():
     try:
         pubsub = await redis_client.subscribe_to_channel('whatsapp:messages:inbound')
         if pubsub:
-            import asyncio
             task = asyncio.create_task(process_incoming_messages(pubsub))
             return task
     except Exception as e:
@@ -76,17 +104,28 @@ async def process_incoming_messages(pubsub):
         async for message in pubsub.listen():
             if message['type'] == 'message':
                 try:
-                    data = json.loads(message['data'])
-                    await handle_whatsapp_message(data)
+                    data = orjson.loads(message['data'])
+                    await message_queue.put(data)
                 except Exception as e:
                     logger.error("Failed to process message", error=str(e), raw_data=message.get('data', ''))
     except Exception as e:
         logger.error("Message subscriber error", error=str(e))
 
+async def message_worker(queue: asyncio.Queue):
+    """Classify queued inbound messages; workers run concurrently so the batcher can coalesce them"""
+    while True:
+        message_data = await queue.get()
+        try:
+            await handle_whatsapp_message(message_data)
+        except Exception as e:
+            logger.error("Message worker error", error=str(e))
+        finally:
+            queue.task_done()
+
 async def handle_whatsapp_message(message_data: dict):
     """Handle incoming WhatsApp message for classification"""
     try:
-        start_time = time.time()
+        start_ns = time.monotonic_ns()
         
         # Create message context
         context = MessageContext(
@@ -105,20 +144,21 @@ async def handle_whatsapp_message(message_data: dict):
         )
         
         # Set processing time
-        classification.processing_time = time.time() - start_time
+        classification.processing_time = (time.monotonic_ns() - start_ns) / 1e9
         
-        # Prepare response data
+        # Prepare response data; pydantic serializes the classification straight to
+        # JSON and orjson splices those bytes in instead of walking a dict copy
         response_data = {
             "message_id": message_data.get('id'),
             "group_id": message_data.get('groupId'),
-            "classification": classification.dict(),
+            "classification": orjson.Fragment(classification.model_dump_json()),
             "timestamp": datetime.now().isoformat()
         }
         
         # Publish classification result
         if classification.is_support_incident:
             # Send to ticket service for incident processing
-            await redis_client.publish_message('tickets:classify:result', response_data)
+            outgoing = [('tickets:classify:result', response_data)]
             
             # If high confidence, send suggested response back to WhatsApp
             if classification.confidence > 0.7 and classification.suggested_response:
@@ -128,7 +168,10 @@ async def handle_whatsapp_message(message_data: dict):
                     "response": classification.suggested_response,
                     "responseType": "classification_response"
                 }
-                await redis_client.publish_message('agents:responses', response_msg)
+                outgoing.append(('agents:responses', response_msg))
+            
+            # Both publishes share a single Redis round trip
+            await redis_client.publish_messages(outgoing)
         else:
             # Non-incident, log and optionally respond
             logger.info("Non-incident message classified", 
@@ -168,7 +211,7 @@ async def health_check():
 async def classify_message_endpoint(request: ClassificationRequest):
     """Manual classification endpoint for testing"""
     try:
-        start_time = time.time()
+        start_ns = time.monotonic_ns()
         
         logger.info("Manual classification request", message_id=request.message.id)
         
@@ -187,7 +230,7 @@ async def classify_message_endpoint(request: ClassificationRequest):
             context=context
         )
         
-        result.processing_time = time.time() - start_time
+        result.processing_time = (time.monotonic_ns() - start_ns) / 1e9
         
         logger.info("Manual classification completed",
                    message_id=request.message.id,
@@ -206,6 +206,11 @@ class ConversationTracker:
                         error=str(e))
             return None
 
+    @staticmethod
+    def _decode_key(key) -> str:
+        """La conexión Redis devuelve bytes (decode_responses=False)"""
+        return key.decode('utf-8') if isinstance(key, bytes) else key
+
     async def _scan_keys(self, pattern: str) -> List[str]:
         """
         Scan Redis keys by pattern (más eficiente que KEYS)
@@ -221,12 +226,12 @@ class ConversationTracker:
             if hasattr(self.redis.redis, 'scan_iter'):
                 keys = []
                 async for key in self.redis.redis.scan_iter(match=pattern):
-                    keys.append(key)
+                    keys.append(self._decode_key(key))
                 return keys
             else:
                 # Fallback a keys() si scan no está disponible
                 if hasattr(self.redis.redis, 'keys'):
-                    return await self.redis.redis.keys(pattern)
+                    return [self._decode_key(key) for key in await self.redis.redis.keys(pattern)]
                 return []
         except Exception as e:
             logger.error("Error scanning Redis keys", error=str(e), pattern=pattern)
@@ -1,11 +1,39 @@
 import redis.asyncio as redis
-import json
+from redis.asyncio.connection import _AsyncHiredisParser
+from redis.utils import HIREDIS_AVAILABLE
+import msgpack
+import orjson
 import os
 import structlog
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 
 logger = structlog.get_logger()
 
+# Approximate cap applied to streams on every XADD
+STREAM_MAXLEN = int(os.getenv('REDIS_STREAM_MAXLEN', '100000'))
+
+# Connection pools shared process-wide, keyed by Redis URL
+_pools: Dict[str, redis.BlockingConnectionPool] = {}
+
+def _get_pool(url: str) -> redis.BlockingConnectionPool:
+    """Return the shared bounded pool for a Redis URL, creating it on first use"""
+    pool = _pools.get(url)
+    if pool is None:
+        if HIREDIS_AVAILABLE:
+            # Pin the C reply parser instead of relying on redis-py's auto-detection
+            kwargs = {'parser_class': _AsyncHiredisParser}
+        else:
+            kwargs = {}
+            logger.warning("hiredis is not installed, using the pure-Python Redis parser")
+        pool = redis.BlockingConnectionPool.from_url(
+            url,
+            max_connections=int(os.getenv('REDIS_POOL_SIZE', '32')),
+            decode_responses=False,
+            **kwargs
+        )
+        _pools[url] = pool
+    return pool
+
 class RedisClient:
     def __init__(self):
         self.redis = None
@@ -18,16 +46,31 @@ class RedisClient:
             self.url = f"redis://:{self.password}@{self.host}:{self.port}"
         else:
             self.url = f"redis://{self.host}:{self.port}"
+        
+        # Cache entries are stored as native JSON when the server has RedisJSON
+        self._use_rejson = False
     
     async def connect(self):
         try:
-            self.redis = redis.from_url(self.url, decode_responses=True)
+            self.redis = redis.Redis(connection_pool=_get_pool(self.url))
             await self.redis.ping()
-            logger.info("Connected to Redis", host=self.host, port=self.port)
+            self._use_rejson = await self._detect_rejson()
+            logger.info("Connected to Redis", host=self.host, port=self.port, rejson=self._use_rejson)
         except Exception as e:
             logger.error("Failed to connect to Redis", error=str(e))
             raise
     
+    async def _detect_rejson(self) -> bool:
+        """Check MODULE LIST for RedisJSON; servers that refuse the command fall back to msgpack"""
+        try:
+            for module in await self.redis.module_list():
+                name = module.get(b'name') or module.get('name') or b''
+                if (name.decode() if isinstance(name, bytes) else name) == 'ReJSON':
+                    return True
+        except Exception as e:
+            logger.debug("Could not list Redis modules", error=str(e))
+        return False
+    
     async def disconnect(self):
         if self.redis:
             await self.redis.close()
@@ -36,7 +79,7 @@ class RedisClient:
     async def publish_message(self, channel: str, message: Dict[str, Any]) -> bool:
         """Publish a message to a Redis channel"""
         try:
-            message_json = json.dumps(message)
+            message_json = orjson.dumps(message)
             result = await self.redis.publish(channel, message_json)
             logger.info("Message published", channel=channel, subscribers=result)
             return True
@@ -44,6 +87,23 @@ class RedisClient:
             logger.error("Failed to publish message", channel=channel, error=str(e))
             return False
     
+    async def publish_messages(self, messages: List[Tuple[str, Dict[str, Any]]]) -> bool:
+        """Publish several (channel, message) pairs in one pipelined round trip"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for channel, message in messages:
+                    pipe.publish(channel, orjson.dumps(message))
+                results = await pipe.execute()
+            logger.info("Messages published",
+                       channels=[channel for channel, _ in messages],
+                       subscribers=results)
+            return True
+        except Exception as e:
+            logger.error("Failed to publish messages",
+                        channels=[channel for channel, _ in messages],
+                        error=str(e))
+            return False
+    
     async def subscribe_to_channel(self, channel: str):
         """Subscribe to a Redis channel"""
         try:
@@ -58,27 +118,73 @@ class RedisClient:
     async def set_cache(self, key: str, value: Dict[str, Any], ttl: int = 3600) -> bool:
         """Cache a value with TTL"""
         try:
-            await self.redis.setex(key, ttl, json.dumps(value))
+            if self._use_rejson:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.execute_command('JSON.SET', key, '$', orjson.dumps(value))
+                    pipe.expire(key, ttl)
+                    await pipe.execute()
+            else:
+                await self.redis.setex(key, ttl, msgpack.packb(value, use_bin_type=True))
             return True
         except Exception as e:
             logger.error("Failed to set cache", error=str(e), key=key)
             return False
     
-    async def get_cache(self, key: str) -> Optional[Dict[str, Any]]:
-        """Get cached value"""
+    async def get_cache(self, key: str, path: Optional[str] = None) -> Optional[Any]:
+        """Get cached value, or only the part selected by a JSONPath like '$.field'"""
         try:
+            if self._use_rejson:
+                value = await self.redis.execute_command('JSON.GET', key, path or '$')
+                matches = orjson.loads(value) if value else None
+                return matches[0] if matches else None
+            
             value = await self.redis.get(key)
-            return json.loads(value) if value else None
+            if not value:
+                return None
+            data = msgpack.unpackb(value, raw=False)
+            return self._select_path(data, path) if path else data
         except Exception as e:
             logger.error("Failed to get cache", error=str(e), key=key)
             return None
 
-    async def add_to_stream(self, stream_name: str, data: Dict[str, Any]) -> Optional[str]:
-        """Add message to Redis Stream"""
+    @staticmethod
+    def _select_path(data: Any, path: str) -> Any:
+        """Resolve a dotted '$.a.b' path client-side for the msgpack fallback"""
+        for part in path.removeprefix('$').split('.'):
+            if not part:
+                continue
+            if not isinstance(data, dict) or part not in data:
+                return None
+            data = data[part]
+        return data
+
+    async def add_to_stream(self, stream_name: str, data: Dict[str, Any],
+                            maxlen: int = STREAM_MAXLEN) -> Optional[str]:
+        """Add message to Redis Stream, trimmed to roughly maxlen entries"""
         try:
-            message_id = await self.redis.xadd(stream_name, data)
+            message_id = await self.redis.xadd(stream_name, data, maxlen=maxlen, approximate=True)
+            if isinstance(message_id, bytes):
+                message_id = message_id.decode()
             logger.info("Message added to stream", stream=stream_name, message_id=message_id)
             return message_id
+        except Exception as e:
+            logger.error("Failed to add to stream", stream=stream_name, error=str(e))
+            return None
+    
+    async def add_to_stream_batch(self, stream_name: str, entries: List[Dict[str, Any]],
+                                  maxlen: int = STREAM_MAXLEN) -> Optional[List[str]]:
+        """Add several messages to a Redis Stream in one pipelined round trip"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for data in entries:
+                    pipe.xadd(stream_name, data, maxlen=maxlen, approximate=True)
+                message_ids = await pipe.execute()
+            message_ids = [
+                message_id.decode() if isinstance(message_id, bytes) else message_id
+                for message_id in message_ids
+            ]
+            logger.info("Messages added to stream", stream=stream_name, count=len(message_ids))
+            return message_ids
         except Exception as e:
             logger.error("Failed to add to stream", stream=stream_name, error=str(e))
             return None
\ No newline at end of file
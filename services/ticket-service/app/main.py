@@ -10,7 +10,11 @@ from dotenv import load_dotenv
 from .services.zoho_client import ZohoClient
 from .services.ticket_queue import TicketQueue
 from .utils.redis_client import RedisClient
-from .models.schemas import TicketRequest, TicketResponse, TicketStatus, HealthResponse
+from typing import List, Optional
+from .models.schemas import (
+    TicketRequest, TicketResponse, TicketStatus, HealthResponse,
+    CustomerTicketCreate, CustomerTicketResult
+)
 
 load_dotenv()
 
@@ -32,10 +36,13 @@ structlog.configure(
 
 logger = structlog.get_logger()
 
+# Largest /tickets/customer/batch request accepted, in line with Zoho request-size limits
+MAX_CUSTOMER_TICKET_BATCH = 50
+
 # Global services
 redis_client = RedisClient()
 zoho_client = ZohoClient()
-ticket_queue = TicketQueue(redis_client)
+ticket_queue = TicketQueue(redis_client, zoho_client)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -70,6 +77,7 @@ async def lifespan(app: FastAPI):
         queue_processor_task.cancel()
     if redis_client.redis:
         await redis_client.disconnect()
+    await zoho_client.aclose()
     logger.info("Ticket service shutdown")
 
 app = FastAPI(
@@ -409,45 +417,13 @@ async def create_customer_ticket(
 ):
     """Create ticket with proper customer contact workflow"""
     try:
-        logger.info("Creating customer ticket", 
-                   customer_email=customer_email, 
-                   subject=subject)
-        
-        # Step 1: Get or create customer contact
-        contact_id = await zoho_client.get_or_create_contact(customer_email, customer_name)
-        logger.info("Customer contact resolved", 
-                   contact_id=contact_id, 
-                   email=customer_email)
-        
-        # Step 2: Create ticket under customer's contact
-        ticket_request = TicketRequest(
+        return await create_ticket_for_customer(CustomerTicketCreate(
+            customer_email=customer_email,
+            customer_name=customer_name,
             subject=subject,
             description=description,
-            priority=priority,
-            contact_id=contact_id,
-            department_id="813934000000006907",  # Soporte TI
-            classification="Problem"
-        )
-        
-        ticket_id = await zoho_client.create_ticket(ticket_request)
-        
-        # Step 3: Publish success event
-        await redis_client.publish_message("tickets:created", {
-            "ticket_id": ticket_id,
-            "customer_email": customer_email,
-            "customer_name": customer_name,
-            "subject": subject,
-            "priority": priority,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        return {
-            "success": True,
-            "ticket_id": ticket_id,
-            "customer_email": customer_email,
-            "contact_id": contact_id,
-            "message": f"Ticket created for customer {customer_name}"
-        }
+            priority=priority
+        ))
         
     except Exception as e:
         logger.error("Failed to create customer ticket", 
@@ -455,6 +431,93 @@ async def create_customer_ticket(
                     customer_email=customer_email)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/tickets/customer/batch", response_model=List[CustomerTicketResult])
+async def create_customer_tickets_batch(tickets: List[CustomerTicketCreate]):
+    """Create several customer tickets in one request; results follow the input order"""
+    if len(tickets) > MAX_CUSTOMER_TICKET_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_CUSTOMER_TICKET_BATCH} tickets per batch"
+        )
+    
+    logger.info("Creating customer ticket batch", batch_size=len(tickets))
+    
+    # Contact lookup is search-then-create, so each distinct sender is resolved once;
+    # concurrent lookups for a new sender would both miss and create duplicate contacts
+    names = {}
+    for ticket in tickets:
+        names.setdefault(ticket.customer_email, ticket.customer_name)
+    contact_ids = dict(zip(names, await asyncio.gather(
+        *(zoho_client.get_or_create_contact(email, name) for email, name in names.items()),
+        return_exceptions=True
+    )))
+    
+    async def create(ticket: CustomerTicketCreate) -> dict:
+        contact_id = contact_ids[ticket.customer_email]
+        if isinstance(contact_id, Exception):
+            raise contact_id
+        return await create_ticket_for_customer(ticket, contact_id)
+    
+    outcomes = await asyncio.gather(*(create(ticket) for ticket in tickets), return_exceptions=True)
+    
+    results = []
+    for ticket, outcome in zip(tickets, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error("Failed to create customer ticket", 
+                        error=str(outcome), 
+                        customer_email=ticket.customer_email)
+            results.append({
+                "success": False,
+                "customer_email": ticket.customer_email,
+                "error": str(outcome)
+            })
+        else:
+            results.append(outcome)
+    return results
+
+async def create_ticket_for_customer(ticket: CustomerTicketCreate, contact_id: Optional[str] = None) -> dict:
+    """Create the ticket under the customer's contact (resolved here unless given) and announce it"""
+    logger.info("Creating customer ticket", 
+               customer_email=ticket.customer_email, 
+               subject=ticket.subject)
+    
+    # Step 1: Get or create customer contact
+    if contact_id is None:
+        contact_id = await zoho_client.get_or_create_contact(ticket.customer_email, ticket.customer_name)
+    logger.info("Customer contact resolved", 
+               contact_id=contact_id, 
+               email=ticket.customer_email)
+    
+    # Step 2: Create ticket under customer's contact
+    ticket_request = TicketRequest(
+        subject=ticket.subject,
+        description=ticket.description,
+        priority=ticket.priority,
+        contact_id=contact_id,
+        department_id="813934000000006907",  # Soporte TI
+        classification="Problem"
+    )
+    
+    ticket_id = await zoho_client.create_ticket(ticket_request)
+    
+    # Step 3: Publish success event
+    await redis_client.publish_message("tickets:created", {
+        "ticket_id": ticket_id,
+        "customer_email": ticket.customer_email,
+        "customer_name": ticket.customer_name,
+        "subject": ticket.subject,
+        "priority": ticket.priority,
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    return {
+        "success": True,
+        "ticket_id": ticket_id,
+        "customer_email": ticket.customer_email,
+        "contact_id": contact_id,
+        "message": f"Ticket created for customer {ticket.customer_name}"
+    }
+
 @app.post("/debug/ticket")
 async def debug_ticket_creation(request: TicketRequest):
     """Debug endpoint that shows the exact Zoho error"""
@@ -37,6 +37,21 @@ class TicketResponse(BaseModel):
     message: str
     created_at: Optional[datetime] = None
 
+class CustomerTicketCreate(BaseModel):
+    customer_email: str
+    customer_name: str
+    subject: str
+    description: str
+    priority: str = "Medium"
+
+class CustomerTicketResult(BaseModel):
+    success: bool
+    customer_email: str
+    ticket_id: Optional[str] = None
+    contact_id: Optional[str] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+
 class TicketStatus(BaseModel):
     ticket_id: str
     status: str
@@ -1,47 +1,106 @@
-import json
-import uuid
+import asyncio
+import itertools
+import os
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+import msgpack
 import structlog
+from redis.exceptions import ResponseError
+
+from .zoho_client import ZohoClient
+from ..models.schemas import TicketRequest
 
 logger = structlog.get_logger()
 
+# Queue ids are a per-process random prefix plus a 16-bit counter. The prefix is not
+# the pid because containers restart as pid 1 and would reuse ids of stored envelopes.
+# The counter wraps after 65,536 ids, so an id can come round again while its envelope
+# is still stored; the enqueue script refuses to overwrite it and a new prefix is drawn.
+_ID_PREFIX = int.from_bytes(os.urandom(2), 'big')
+_ID_COUNTER = itertools.count(1)
+_MAX_ID_ATTEMPTS = 5
+
+# Redis layout: a list of queue ids plus one envelope hash per ticket
+_QUEUE_KEY = "pending_tickets"
+_ITEM_PREFIX = "ticket:"
+_ITEM_TTL = 7 * 24 * 3600  # Pending envelopes
+_STATUS_TTL = 3600  # Envelopes kept for status lookups once finished
+
+# Stores a new envelope and queues its id in one round trip, unless the key already holds
+# an envelope. KEYS: envelope hash, queue list. ARGV: ttl, queue id, field/value pairs.
+_ENQUEUE_SCRIPT = """
+if redis.call('HSETNX', KEYS[1], 'id', ARGV[2]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('LPUSH', KEYS[2], ARGV[2])
+return 1
+"""
+
+def _next_queue_id() -> str:
+    return f"queue_{_ID_PREFIX:04x}{next(_ID_COUNTER) & 0xFFFF:04x}"
+
+def _renew_id_prefix():
+    """Move to a fresh random prefix after an id turned out to be taken"""
+    global _ID_PREFIX
+    previous = _ID_PREFIX
+    while _ID_PREFIX == previous:
+        _ID_PREFIX = int.from_bytes(os.urandom(2), 'big')
+
+# Envelope fields exposed by get_ticket_status
+STATUS_FIELDS = ('status', 'ticket_id', 'attempts', 'error', 'created_at', 'last_updated')
+
 class TicketQueue:
-    def __init__(self, redis_client):
+    __slots__ = ('redis', '_zoho', '_zoho_lock', 'concurrency', '_zoho_slots', '_enqueue')
+    
+    def __init__(self, redis_client, zoho_client: Optional[ZohoClient] = None):
         self.redis = redis_client
-        self.queue_key = "pending_tickets"
-        self.status_key = "ticket_status"
+        
+        # One long-lived Zoho client serves every queued ticket
+        self._zoho = zoho_client
+        self._zoho_lock = asyncio.Lock()
+        
+        # Caps concurrent Zoho calls while a popped batch is processed
+        self.concurrency = int(os.getenv('TICKET_QUEUE_CONCURRENCY', '8'))
+        self._zoho_slots = asyncio.Semaphore(self.concurrency)
+        
+        # Registered on first add_ticket, once the Redis connection exists
+        self._enqueue = None
     
     async def add_ticket(self, ticket_request) -> str:
         """Add a ticket to the processing queue"""
         try:
-            queue_id = f"queue_{uuid.uuid4().hex[:8]}"
-            
-            queue_item = {
-                'id': queue_id,
-                'ticket_data': ticket_request.dict(),
-                'attempts': 0,
-                'max_attempts': 10,
-                'created_at': datetime.now().isoformat(),
-                'status': 'queued',
-                'error': None
-            }
+            if self._enqueue is None:
+                self._enqueue = self.redis.redis.register_script(_ENQUEUE_SCRIPT)
             
-            # Add to queue
-            await self.redis.redis.lpush(self.queue_key, json.dumps(queue_item))
+            now = datetime.now().isoformat()
             
-            # Store status separately for quick lookup
-            await self.redis.set_cache(
-                f"{self.status_key}:{queue_id}",
-                {
-                    'status': 'queued',
-                    'created_at': queue_item['created_at'],
-                    'last_updated': datetime.now().isoformat()
-                }
-            )
+            # The envelope lives in a hash; the list only holds the short id. The ticket
+            # is serialized once here and never rewritten by retries.
+            fields = [
+                'ticket_data', msgpack.packb(ticket_request.model_dump(), use_bin_type=True),
+                'attempts', 0,
+                'max_attempts', 10,
+                'created_at', now,
+                'status', 'queued',
+                'last_updated', now
+            ]
             
-            logger.info("Ticket added to queue", queue_id=queue_id, subject=ticket_request.subject)
-            return queue_id
+            for _ in range(_MAX_ID_ATTEMPTS):
+                queue_id = _next_queue_id()
+                stored = await self._enqueue(
+                    keys=[_ITEM_PREFIX + queue_id, _QUEUE_KEY],
+                    args=[_ITEM_TTL, queue_id, *fields]
+                )
+                if stored:
+                    logger.info("Ticket added to queue", queue_id=queue_id, subject=ticket_request.subject)
+                    return queue_id
+                
+                logger.warning("Queue id already in use, drawing a new prefix", queue_id=queue_id)
+                _renew_id_prefix()
+            
+            raise RuntimeError(f"No free queue id after {_MAX_ID_ATTEMPTS} attempts")
             
         except Exception as e:
             logger.error("Failed to add ticket to queue", error=str(e))
@@ -50,15 +109,16 @@ class TicketQueue:
     async def get_ticket_status(self, queue_id: str) -> Dict:
         """Get status of a queued ticket"""
         try:
-            status = await self.redis.get_cache(f"{self.status_key}:{queue_id}")
+            envelope = await self.redis.redis.hgetall(_ITEM_PREFIX + queue_id)
             
-            if not status:
+            if not envelope:
                 return {
                     'status': 'not_found',
                     'last_updated': datetime.now().isoformat()
                 }
             
-            return status
+            item = self._decode_envelope(envelope)
+            return {field: item[field] for field in STATUS_FIELDS if field in item}
             
         except Exception as e:
             logger.error("Failed to get ticket status", error=str(e), queue_id=queue_id)
@@ -67,106 +127,70 @@ class TicketQueue:
                 'last_updated': datetime.now().isoformat()
             }
     
-    async def process_queue(self) -> int:
+    async def process_queue(self, batch_size: int = 32) -> int:
         """Process pending tickets in the queue"""
         processed_count = 0
+        requeue = []
+        # Popped ids whose outcome is not yet stored; pushed back if anything fails first
+        unsettled = []
         
         try:
             while True:
-                # Get next item from queue
-                item_json = await self.redis.redis.rpop(self.queue_key)
-                if not item_json:
+                # Get the next batch of ids from the queue in one round trip
+                queue_ids = [raw_id.decode() for raw_id in await self._pop_batch(batch_size)]
+                if not queue_ids:
                     break
+                unsettled = queue_ids
+                
+                async with self.redis.redis.pipeline(transaction=False) as pipe:
+                    for queue_id in queue_ids:
+                        pipe.hgetall(_ITEM_PREFIX + queue_id)
+                    envelopes = await pipe.execute()
                 
-                queue_item = json.loads(item_json)
-                queue_id = queue_item['id']
+                queue_items = []
+                for queue_id, envelope in zip(queue_ids, envelopes):
+                    try:
+                        queue_items.append(self._decode_envelope(envelope))
+                    except Exception as decode_error:
+                        logger.error("Discarding unreadable queue item",
+                                    queue_id=queue_id,
+                                    error=str(decode_error))
                 
-                try:
-                    # Try to process the ticket
-                    from .zoho_client import ZohoClient
-                    from ..models.schemas import TicketRequest
-                    
-                    zoho_client = ZohoClient()
-                    await zoho_client.initialize()
-                    
-                    # Reconstruct ticket request
-                    ticket_data = queue_item['ticket_data']
-                    ticket_request = TicketRequest(**ticket_data)
-                    
-                    # Create ticket in Zoho
-                    ticket_id = await zoho_client.create_ticket(ticket_request)
-                    
-                    # Update status to completed
-                    await self.redis.set_cache(
-                        f"{self.status_key}:{queue_id}",
-                        {
-                            'status': 'completed',
-                            'ticket_id': ticket_id,
-                            'created_at': queue_item['created_at'],
-                            'last_updated': datetime.now().isoformat()
-                        }
-                    )
-                    
-                    # Publish success event
-                    await self.redis.publish_message("tickets:created", {
-                        "ticket_id": ticket_id,
-                        "queue_id": queue_id,
-                        "subject": ticket_request.subject,
-                        "priority": ticket_request.priority,
-                        "contact_id": ticket_request.contact_id,
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    
-                    processed_count += 1
-                    logger.info("Queued ticket processed", queue_id=queue_id, ticket_id=ticket_id)
-                    
-                except Exception as process_error:
-                    # Increment attempts
-                    queue_item['attempts'] += 1
-                    queue_item['error'] = str(process_error)
-                    queue_item['last_attempt'] = datetime.now().isoformat()
-                    
-                    if queue_item['attempts'] < queue_item['max_attempts']:
-                        # Re-queue for retry
-                        await self.redis.redis.lpush(self.queue_key, json.dumps(queue_item))
-                        
-                        # Update status
-                        await self.redis.set_cache(
-                            f"{self.status_key}:{queue_id}",
-                            {
-                                'status': 'retrying',
-                                'attempts': queue_item['attempts'],
-                                'error': str(process_error),
-                                'created_at': queue_item['created_at'],
-                                'last_updated': datetime.now().isoformat()
-                            }
-                        )
-                        
-                        logger.warning(
-                            "Ticket processing failed, retrying",
-                            queue_id=queue_id,
-                            attempts=queue_item['attempts'],
-                            error=str(process_error)
-                        )
-                    else:
-                        # Max attempts reached, mark as failed
-                        await self.redis.set_cache(
-                            f"{self.status_key}:{queue_id}",
-                            {
-                                'status': 'failed',
-                                'attempts': queue_item['attempts'],
-                                'error': str(process_error),
-                                'created_at': queue_item['created_at'],
-                                'last_updated': datetime.now().isoformat()
-                            }
-                        )
-                        
-                        logger.error(
-                            "Ticket processing failed permanently",
-                            queue_id=queue_id,
-                            attempts=queue_item['attempts'],
-                            error=str(process_error)
-                        )
+                # Zoho calls for the batch overlap, bounded by the concurrency limit
+                results = await asyncio.gather(*(self._handle_item(item) for item in queue_items))
+                
+                events = []
+                retries = []
+                async with self.redis.redis.pipeline(transaction=False) as pipe:
+                    for queue_item, (fields, event) in zip(queue_items, results):
+                        key = _ITEM_PREFIX + queue_item['id']
+                        pipe.hset(key, mapping=fields)
+                        if event:
+                            events.append(event)
+                        else:
+                            pipe.hincrby(key, 'attempts', 1)
+                        if fields['status'] == 'retrying':
+                            retries.append(queue_item['id'])
+                        else:
+                            pipe.expire(key, _STATUS_TTL)
+                    await pipe.execute()
+                
+                # Outcomes are stored; only retries go back on the queue
+                requeue.extend(retries)
+                unsettled = []
+                
+                # Publish success events once their status is visible
+                for event in events:
+                    self.redis.publish_message_nowait("tickets:created", event)
+                
+                processed_count += len(events)
+                
+                # A short batch means the queue is drained; skip the extra empty pop
+                if len(queue_ids) < batch_size:
+                    break
+            
+            # Make sure the success events are sent before returning
+            await self.redis.flush_publishes()
             
             if processed_count > 0:
                 logger.info("Queue processing completed", processed_count=processed_count)
@@ -176,11 +200,122 @@ class TicketQueue:
         except Exception as e:
             logger.error("Failed to process queue", error=str(e))
             raise
+        
+        finally:
+            requeue.extend(unsettled)
+            if requeue:
+                # Re-queue every retry with one LPUSH; they are picked up on the next run
+                await self.redis.redis.lpush(_QUEUE_KEY, *requeue)
+    
+    @staticmethod
+    def _decode_envelope(envelope: Dict[bytes, bytes]) -> Dict:
+        """Turn a raw queue-item hash back into typed fields"""
+        if not envelope:
+            raise KeyError("queue item envelope is missing")
+        
+        item = {field.decode(): value for field, value in envelope.items()}
+        item['ticket_data'] = msgpack.unpackb(item['ticket_data'], raw=False) if 'ticket_data' in item else None
+        for field in ('attempts', 'max_attempts'):
+            if field in item:
+                item[field] = int(item[field])
+        for field, value in item.items():
+            if isinstance(value, bytes):
+                item[field] = value.decode()
+        return item
+    
+    async def _pop_batch(self, batch_size: int) -> List[bytes]:
+        """Pop up to batch_size items with LMPOP, or a pipeline of RPOPs before Redis 7"""
+        try:
+            result = await self.redis.redis.lmpop(1, _QUEUE_KEY, direction="RIGHT", count=batch_size)
+            return result[1] if result else []
+        except ResponseError:
+            async with self.redis.redis.pipeline(transaction=True) as pipe:
+                for _ in range(batch_size):
+                    pipe.rpop(_QUEUE_KEY)
+                return [item for item in await pipe.execute() if item]
+    
+    async def _get_zoho(self) -> ZohoClient:
+        """Return the shared Zoho client, initializing it once on first use"""
+        if self._zoho is not None and self._zoho.is_connected():
+            return self._zoho
+        
+        async with self._zoho_lock:
+            if self._zoho is None:
+                self._zoho = ZohoClient()
+            if not self._zoho.is_connected():
+                await self._zoho.initialize()
+        
+        return self._zoho
+    
+    async def _handle_item(self, queue_item: Dict) -> Tuple[Dict, Optional[Dict]]:
+        """Create the ticket for one queue item; returns the envelope fields to update and a success event"""
+        queue_id = queue_item['id']
+        
+        try:
+            # Try to process the ticket
+            zoho_client = await self._get_zoho()
+            
+            # Reconstruct ticket request
+            ticket_request = TicketRequest(**queue_item['ticket_data'])
+            
+            # Create ticket in Zoho
+            async with self._zoho_slots:
+                ticket_id = await zoho_client.create_ticket(ticket_request)
+            
+            logger.info("Queued ticket processed", queue_id=queue_id, ticket_id=ticket_id)
+            return (
+                {
+                    'status': 'completed',
+                    'ticket_id': ticket_id,
+                    'last_updated': datetime.now().isoformat()
+                },
+                {
+                    "ticket_id": ticket_id,
+                    "queue_id": queue_id,
+                    "subject": ticket_request.subject,
+                    "priority": ticket_request.priority,
+                    "contact_id": ticket_request.contact_id,
+                    "timestamp": datetime.now().isoformat()
+                }
+            )
+            
+        except Exception as process_error:
+            # The stored counter is incremented with HINCRBY by the caller
+            attempts = queue_item['attempts'] + 1
+            
+            if attempts < queue_item['max_attempts']:
+                logger.warning(
+                    "Ticket processing failed, retrying",
+                    queue_id=queue_id,
+                    attempts=attempts,
+                    error=str(process_error)
+                )
+                status = 'retrying'
+            else:
+                # Max attempts reached, mark as failed
+                logger.error(
+                    "Ticket processing failed permanently",
+                    queue_id=queue_id,
+                    attempts=attempts,
+                    error=str(process_error)
+                )
+                status = 'failed'
+            
+            now = datetime.now().isoformat()
+            return (
+                {
+                    'status': status,
+                    'error': str(process_error),
+                    'last_attempt': now,
+                    'last_updated': now
+                },
+                None
+            )
     
     async def get_queue_length(self) -> int:
         """Get current queue length"""
         try:
-            return await self.redis.redis.llen(self.queue_key)
+            return await self.redis.redis.llen(_QUEUE_KEY)
         except Exception as e:
             logger.error("Failed to get queue length", error=str(e))
             return 0
@@ -1,32 +1,85 @@
+import asyncio
+import functools
 import httpx
+import orjson
 import os
+import random
 import time
 import structlog
-from typing import Dict, List, Optional
+from typing import ClassVar, Dict, List, Optional
 from datetime import datetime, timedelta
 
 from ..models.schemas import TicketRequest, Department
 
 logger = structlog.get_logger()
 
+# Tokens are refreshed once fewer than this many seconds (plus jitter) remain
+TOKEN_REFRESH_MARGIN = 60
+TOKEN_REFRESH_JITTER = 30
+
+# OAuth scopes requested when generating an authorization URL
+SCOPES = ','.join(('Desk.tickets.ALL', 'Desk.contacts.ALL', 'Desk.basic.ALL'))
+
 class ZohoClient:
+    # Ticket priorities (case-insensitive) to Zoho Desk priorities; anything else is Medium
+    _PRIORITY_MAP: ClassVar[Dict[str, str]] = {
+        'urgent': 'High',
+        'high': 'High',
+        'normal': 'Medium',
+        'medium': 'Medium',
+        'low': 'Low',
+    }
+    
     def __init__(self):
         self.client_id = os.getenv('ZOHO_CLIENT_ID')
         self.client_secret = os.getenv('ZOHO_CLIENT_SECRET')
         self.redirect_uri = os.getenv('ZOHO_REDIRECT_URI')
         self.authorization_code = os.getenv('ZOHO_AUTHORIZATION_CODE')
         
+        self._reset_auth_state()
+        self._refresh_lock = asyncio.Lock()
+        
+        self.base_url = 'https://desk.zoho.com/api/v1'
+        self.auth_url = 'https://accounts.zoho.com/oauth/v2'
+        
+        # One pooled HTTP client keeps connections to Zoho alive between requests
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _reset_auth_state(self):
+        """Forget tokens and organization so the next initialize starts from scratch"""
         self.access_token = None
         self.refresh_token = None
         self.org_id = None
         self.token_expires_at = None
-        
-        self.base_url = 'https://desk.zoho.com/api/v1'
-        self.auth_url = 'https://accounts.zoho.com/oauth/v2'
+        self._token_mono_exp: Optional[float] = None  # time.monotonic() deadline
+    
+    async def __aenter__(self):
+        await self.initialize()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    def _http(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=10.0,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+            )
+        return self._client
+    
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
         
     async def initialize(self):
         """Initialize Zoho client with tokens and org ID"""
         try:
+            self._http()
+            
             # Try to load existing refresh token first
             if not await self._load_saved_tokens():
                 # If no saved tokens, get new ones from authorization code
@@ -48,78 +101,95 @@ class ZohoClient:
     
     async def _get_tokens_from_code(self):
         """Exchange authorization code for access and refresh tokens"""
-        async with httpx.AsyncClient() as client:
-            data = {
-                'grant_type': 'authorization_code',
-                'client_id': self.client_id,
-                'client_secret': self.client_secret,
-                'redirect_uri': self.redirect_uri,
-                'code': self.authorization_code
-            }
-            
-            response = await client.post(f"{self.auth_url}/token", data=data)
-            response.raise_for_status()
-            
-            token_data = response.json()
-            
-            if 'error' in token_data:
-                raise ValueError(f"OAuth error: {token_data.get('error')} - {token_data.get('error_description', 'No description')}")
-            
-            if 'access_token' not in token_data:
-                logger.error("Token response missing access_token", response_data=token_data)
-                raise KeyError(f"access_token not found in response. Got: {list(token_data.keys())}")
-            
-            self.access_token = token_data['access_token']
-            self.refresh_token = token_data.get('refresh_token')
-            
-            # Set token expiration (typically 1 hour)
-            expires_in = token_data.get('expires_in', 3600)
-            self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 300)  # 5 min buffer
-            
-            logger.info("Tokens obtained successfully")
+        data = {
+            'grant_type': 'authorization_code',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'redirect_uri': self.redirect_uri,
+            'code': self.authorization_code
+        }
+        
+        response = await self._http().post(f"{self.auth_url}/token", data=data)
+        response.raise_for_status()
+        
+        token_data = response.json()
+        
+        if 'error' in token_data:
+            raise ValueError(f"OAuth error: {token_data.get('error')} - {token_data.get('error_description', 'No description')}")
+        
+        if 'access_token' not in token_data:
+            logger.error("Token response missing access_token", response_data=token_data)
+            raise KeyError(f"access_token not found in response. Got: {list(token_data.keys())}")
+        
+        self.access_token = token_data['access_token']
+        self.refresh_token = token_data.get('refresh_token')
+        
+        # Set token expiration (typically 1 hour)
+        expires_in = token_data.get('expires_in', 3600)
+        self._set_token_expiry(expires_in - 300)  # 5 min buffer
+        
+        logger.info("Tokens obtained successfully")
     
     async def _refresh_access_token(self):
         """Refresh the access token using refresh token"""
-        async with httpx.AsyncClient() as client:
-            params = {
-                'grant_type': 'refresh_token',
-                'refresh_token': self.refresh_token,
-                'client_id': self.client_id,
-                'client_secret': self.client_secret
-            }
-            
-            response = await client.post(f"{self.auth_url}/token", params=params)
-            response.raise_for_status()
-            
-            token_data = response.json()
-            self.access_token = token_data['access_token']
-            
-            # Update expiration
-            expires_in = token_data.get('expires_in', 3600)
-            self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 300)
-            
-            logger.info("Access token refreshed")
+        params = {
+            'grant_type': 'refresh_token',
+            'refresh_token': self.refresh_token,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret
+        }
+        
+        response = await self._http().post(f"{self.auth_url}/token", params=params)
+        response.raise_for_status()
+        
+        token_data = response.json()
+        self.access_token = token_data['access_token']
+        
+        # Update expiration
+        expires_in = token_data.get('expires_in', 3600)
+        self._set_token_expiry(expires_in - 300)
+        
+        logger.info("Access token refreshed")
+    
+    def _set_token_expiry(self, seconds: float):
+        """Record when the access token expires, as wall-clock time and as a monotonic deadline"""
+        self.token_expires_at = datetime.now() + timedelta(seconds=seconds)
+        self._token_mono_exp = time.monotonic() + seconds
+    
+    def _token_expiring(self) -> bool:
+        """Whether the access token is missing or inside the jittered refresh margin"""
+        if self._token_mono_exp is not None:
+            remaining = self._token_mono_exp - time.monotonic()
+        elif self.token_expires_at:
+            remaining = (self.token_expires_at - datetime.now()).total_seconds()
+        else:
+            return True
+        return remaining < TOKEN_REFRESH_MARGIN + random.uniform(0, TOKEN_REFRESH_JITTER)
     
     async def _ensure_valid_token(self):
-        """Ensure we have a valid access token"""
-        if not self.token_expires_at or datetime.now() >= self.token_expires_at:
-            await self._refresh_access_token()
+        """Ensure we have a valid access token, refreshing it before it expires"""
+        if not self._token_expiring():
+            return
+        
+        # Concurrent callers wait for a single refresh instead of each issuing one
+        async with self._refresh_lock:
+            if self._token_expiring():
+                await self._refresh_access_token()
     
     async def _get_org_id(self):
         """Get the organization ID"""
         await self._ensure_valid_token()
         
-        async with httpx.AsyncClient() as client:
-            headers = {'Authorization': f'Zoho-oauthtoken {self.access_token}'}
-            
-            response = await client.get(f"{self.base_url}/organizations", headers=headers)
-            response.raise_for_status()
-            
-            data = response.json().get('data', [])
-            if not data:
-                raise ValueError("No organizations found")
-            
-            self.org_id = data[0]['id']
+        headers = {'Authorization': f'Zoho-oauthtoken {self.access_token}'}
+        
+        response = await self._http().get(f"{self.base_url}/organizations", headers=headers)
+        response.raise_for_status()
+        
+        data = response.json().get('data', [])
+        if not data:
+            raise ValueError("No organizations found")
+        
+        self.org_id = data[0]['id']
     
     async def _make_request(self, method: str, endpoint: str, **kwargs):
         """Make authenticated request to Zoho API"""
@@ -135,13 +205,13 @@ class ZohoClient:
             headers.update(kwargs['headers'])
         kwargs['headers'] = headers
         
-        async with httpx.AsyncClient() as client:
-            response = await getattr(client, method.lower())(
-                f"{self.base_url}{endpoint}", 
-                **kwargs
-            )
-            response.raise_for_status()
-            return response.json()
+        # Serialize JSON bodies with orjson instead of httpx's stdlib json.dumps
+        if 'json' in kwargs:
+            kwargs['content'] = orjson.dumps(kwargs.pop('json'))
+        
+        response = await self._http().request(method, f"{self.base_url}{endpoint}", **kwargs)
+        response.raise_for_status()
+        return orjson.loads(response.content)
     
     async def list_departments(self) -> List[Department]:
         """List all departments"""
@@ -241,21 +311,12 @@ class ZohoClient:
     async def create_ticket(self, ticket_request: TicketRequest) -> str:
         """Create a ticket in Zoho Desk"""
         try:
-            # Set priority based on the string value
-            priority_lower = ticket_request.priority.lower()
-            if priority_lower in ['urgent', 'high']:
-                priority = 'High'
-            elif priority_lower in ['normal', 'medium']:
-                priority = 'Medium'
-            else:
-                priority = 'Low'
-            
             payload = {
                 'subject': ticket_request.subject,
                 'description': ticket_request.description,
                 'departmentId': ticket_request.department_id,
                 'contactId': ticket_request.contact_id,
-                'priority': priority
+                'priority': self._PRIORITY_MAP.get(ticket_request.priority.lower(), 'Medium')
             }
             
             # Add optional fields if present
@@ -301,21 +362,24 @@ class ZohoClient:
             logger.error("Failed to update ticket", error=str(e), ticket_id=ticket_id)
             raise
     
-    def generate_authorization_url(self) -> str:
-        """Generate URL for obtaining new authorization code"""
-        base_url = f'{self.auth_url}/auth'
+    @functools.cached_property
+    def authorization_url(self) -> str:
+        """URL for obtaining a new authorization code, built once from the client config"""
         params = {
             'response_type': 'code',
             'client_id': self.client_id,
             'redirect_uri': self.redirect_uri,
-            'scope': 'Desk.tickets.ALL,Desk.contacts.ALL,Desk.basic.ALL',
+            'scope': SCOPES,
             'access_type': 'offline',  # This ensures we get a refresh token
             'prompt': 'consent'  # Force consent screen to ensure refresh token
         }
         
         query_string = '&'.join([f'{k}={v}' for k, v in params.items()])
-        url = f"{base_url}?{query_string}"
-        return url
+        return f"{self.auth_url}/auth?{query_string}"
+    
+    def generate_authorization_url(self) -> str:
+        """Generate URL for obtaining new authorization code"""
+        return self.authorization_url
     
     async def _save_tokens(self):
         """Save refresh token to file for persistence"""
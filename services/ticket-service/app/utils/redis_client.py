@@ -1,18 +1,50 @@
+import asyncio
 import redis.asyncio as redis
+from redis.asyncio.connection import _AsyncHiredisParser
+from redis.utils import HIREDIS_AVAILABLE
 import json
+import msgpack
 import os
 import structlog
 
 logger = structlog.get_logger()
 
+# Compact JSON encoder bound once instead of rebuilt by every json.dumps call
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+# Connection pools shared process-wide, keyed by Redis URL
+_pools = {}
+
+def _get_pool(url: str) -> redis.BlockingConnectionPool:
+    """Return the shared bounded pool for a Redis URL, creating it on first use"""
+    pool = _pools.get(url)
+    if pool is None:
+        if HIREDIS_AVAILABLE:
+            # Pin the C reply parser instead of relying on redis-py's auto-detection
+            kwargs = {'parser_class': _AsyncHiredisParser}
+        else:
+            kwargs = {}
+            logger.warning("hiredis is not installed, using the pure-Python Redis parser")
+        pool = redis.BlockingConnectionPool.from_url(
+            url,
+            max_connections=int(os.getenv("REDIS_POOL_SIZE", "32")),
+            decode_responses=False,
+            **kwargs
+        )
+        _pools[url] = pool
+    return pool
+
 class RedisClient:
+    __slots__ = ('redis', 'url', '_pending_publishes')
+    
     def __init__(self):
         self.redis = None
         self.url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self._pending_publishes = set()
     
     async def connect(self):
         try:
-            self.redis = redis.from_url(self.url, decode_responses=True)
+            self.redis = redis.Redis(connection_pool=_get_pool(self.url))
             await self.redis.ping()
             logger.info("Connected to Redis", url=self.url)
         except Exception as e:
@@ -26,7 +58,7 @@ class RedisClient:
     
     async def publish(self, channel: str, message: dict):
         try:
-            await self.redis.publish(channel, json.dumps(message))
+            await self.redis.publish(channel, _encode(message))
             logger.debug("Message published", channel=channel)
         except Exception as e:
             logger.error("Failed to publish message", error=str(e), channel=channel)
@@ -43,7 +75,7 @@ class RedisClient:
     
     async def set_cache(self, key: str, value: dict, ttl: int = 3600):
         try:
-            await self.redis.setex(key, ttl, json.dumps(value))
+            await self.redis.setex(key, ttl, msgpack.packb(value, use_bin_type=True))
         except Exception as e:
             logger.error("Failed to set cache", error=str(e), key=key)
             raise
@@ -51,7 +83,7 @@ class RedisClient:
     async def get_cache(self, key: str):
         try:
             value = await self.redis.get(key)
-            return json.loads(value) if value else None
+            return msgpack.unpackb(value, raw=False) if value else None
         except Exception as e:
             logger.error("Failed to get cache", error=str(e), key=key)
             return None
@@ -70,7 +102,27 @@ class RedisClient:
     async def publish_message(self, channel: str, message: dict):
         """Publish a message to a Redis channel"""
         try:
-            await self.redis.publish(channel, json.dumps(message))
+            await self.redis.publish(channel, _encode(message))
+            logger.debug("Message published to channel", channel=channel)
+        except Exception as e:
+            logger.error("Failed to publish message", error=str(e), channel=channel)
+    
+    def publish_message_nowait(self, channel: str, message: dict):
+        """Send a message to a Redis channel without waiting for the subscriber count"""
+        task = asyncio.create_task(self._send_publish(channel, message))
+        self._pending_publishes.add(task)
+        task.add_done_callback(self._pending_publishes.discard)
+    
+    async def flush_publishes(self):
+        """Wait until every message queued with publish_message_nowait has been sent"""
+        if self._pending_publishes:
+            await asyncio.gather(*self._pending_publishes, return_exceptions=True)
+    
+    async def _send_publish(self, channel: str, message: dict):
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.publish(channel, _encode(message))
+                await pipe.execute()
             logger.debug("Message published to channel", channel=channel)
         except Exception as e:
             logger.error("Failed to publish message", error=str(e), channel=channel)
\ No newline at end of file
@@ -24,6 +24,11 @@ class Config {
                     notifications: process.env.REDIS_CHANNEL_NOTIFICATIONS || 'whatsapp:notifications',
                     status: process.env.REDIS_CHANNEL_STATUS || 'whatsapp:status'
                 },
+                streams: {
+                    // Inbound messages are also appended here for consumer-group readers
+                    inbound: process.env.REDIS_STREAM_INBOUND || 'whatsapp:messages:inbound:stream',
+                    maxLen: parseInt(process.env.REDIS_STREAM_MAXLEN) || 100000
+                },
                 reconnectAttempts: parseInt(process.env.REDIS_RECONNECT_ATTEMPTS) || 10,
                 reconnectDelay: parseInt(process.env.REDIS_RECONNECT_DELAY) || 1000
             },
@@ -115,8 +115,22 @@ class RedisPublisher {
                 ? item.data 
                 : JSON.stringify(item.data);
 
-            // Publish to Redis
-            const result = await this.redisClient.publish(item.channel, serializedData);
+            // Publish to Redis; inbound messages are mirrored into their stream in the same round trip
+            let result;
+            if (item.channel === config.get('redis.channels.inbound') && config.get('redis.streams.inbound')) {
+                [result] = await this.redisClient.multi()
+                    .publish(item.channel, serializedData)
+                    .xAdd(config.get('redis.streams.inbound'), '*', { data: serializedData }, {
+                        TRIM: {
+                            strategy: 'MAXLEN',
+                            strategyModifier: '~',
+                            threshold: config.get('redis.streams.maxLen')
+                        }
+                    })
+                    .exec();
+            } else {
+                result = await this.redisClient.publish(item.channel, serializedData);
+            }
             
             const duration = Date.now() - startTime;
             
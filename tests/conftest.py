@@ -2,10 +2,16 @@
 
 import pytest
 import asyncio
+import functools
 import os
 import sys
 from unittest.mock import MagicMock, AsyncMock
 
+try:
+    import uvloop
+except ImportError:  # Optional: fall back to the default asyncio loop
+    uvloop = None
+
 # Add project root to Python path for imports
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
@@ -16,7 +22,7 @@ TEST_ENV = {
     'PYTHON_ENV': 'test',
     'REDIS_HOST': 'localhost',
     'REDIS_PORT': '6379',
-    'REDIS_DB': '1',  # Use different DB for tests
+    'REDIS_DB': '1',  # Use different DB for tests (offset per xdist worker)
     'LOG_LEVEL': 'debug',
     
     # Test API keys (fake)
@@ -33,14 +39,39 @@ TEST_ENV = {
 }
 
 
+def _worker_redis_db() -> int:
+    """Logical Redis DB for this xdist worker (gw0 -> 1, gw1 -> 2, ...)"""
+    worker = os.environ.get('PYTEST_XDIST_WORKER', 'gw0')
+    return 1 + int(worker.removeprefix('gw'))
+
+
+def _aret(value=None):
+    """Plain async stub returning value (use AsyncMock when calls are asserted)"""
+    async def _stub(*args, **kwargs):
+        return value
+    return _stub
+
+
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    """Run async tests on uvloop, like the services in production"""
+    return uvloop.EventLoopPolicy() if uvloop else asyncio.DefaultEventLoopPolicy()
+
+
 @pytest.fixture(scope="session")
-def event_loop():
-    """Create an instance of the default event loop for the test session."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
+def event_loop(event_loop_policy):
+    """Create one event loop for the whole test session."""
+    loop = event_loop_policy.new_event_loop()
     yield loop
     loop.close()
 
 
+@pytest.fixture(scope="session")
+def redis_test_db():
+    """Redis DB index reserved for the current test worker"""
+    return int(TEST_ENV['REDIS_DB'])
+
+
 @pytest.fixture(autouse=True)
 def setup_test_env(monkeypatch):
     """Set up test environment variables for all tests"""
@@ -54,20 +85,20 @@ def mock_redis_client():
     mock_client = MagicMock()
     
     # Mock async methods
-    mock_client.connect = AsyncMock()
-    mock_client.disconnect = AsyncMock()
-    mock_client.ping = AsyncMock(return_value=True)
-    mock_client.publish = AsyncMock(return_value=1)
-    mock_client.subscribe = AsyncMock()
-    mock_client.get = AsyncMock(return_value=None)
-    mock_client.set = AsyncMock(return_value=True)
-    mock_client.lpush = AsyncMock(return_value=1)
-    mock_client.rpop = AsyncMock(return_value=None)
-    mock_client.llen = AsyncMock(return_value=0)
+    mock_client.connect = _aret()
+    mock_client.disconnect = _aret()
+    mock_client.ping = _aret(True)
+    mock_client.publish = AsyncMock(return_value=1)  # tracked for payload assertions
+    mock_client.subscribe = _aret()
+    mock_client.get = _aret(None)
+    mock_client.set = _aret(True)
+    mock_client.lpush = _aret(1)
+    mock_client.rpop = _aret(None)
+    mock_client.llen = _aret(0)
     
     # Mock pub/sub
     mock_pubsub = MagicMock()
-    mock_pubsub.subscribe = AsyncMock()
+    mock_pubsub.subscribe = _aret()
     mock_pubsub.listen = AsyncMock()
     mock_client.pubsub = MagicMock(return_value=mock_pubsub)
     
@@ -84,7 +115,7 @@ def mock_openai_client():
     mock_response.choices = [MagicMock()]
     mock_response.choices[0].message.content = '{"is_support_incident": true, "confidence": 0.8}'
     
-    mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
+    mock_client.chat.completions.create = _aret(mock_response)
     
     return mock_client
 
@@ -95,15 +126,15 @@ def mock_zoho_client():
     mock_client = MagicMock()
     
     # Mock methods
-    mock_client.initialize = AsyncMock()
+    mock_client.initialize = _aret()
     mock_client.is_connected = MagicMock(return_value=True)
-    mock_client.list_departments = AsyncMock(return_value=[
+    mock_client.list_departments = _aret([
         MagicMock(id='DEPT-001', name='Technical Support', email='tech@test.com')
     ])
-    mock_client.create_contact = AsyncMock(return_value='CONTACT-123')
-    mock_client.create_ticket = AsyncMock(return_value='TICKET-456')
-    mock_client.get_ticket_status = AsyncMock(return_value='Open')
-    mock_client.update_ticket = AsyncMock(return_value={'id': 'TICKET-456'})
+    mock_client.create_contact = _aret('CONTACT-123')
+    mock_client.create_ticket = _aret('TICKET-456')
+    mock_client.get_ticket_status = _aret('Open')
+    mock_client.update_ticket = _aret({'id': 'TICKET-456'})
     
     return mock_client
 
@@ -117,12 +148,12 @@ def mock_whatsapp_service():
     mock_service.isConnected = True
     
     # Mock methods
-    mock_service.initialize = AsyncMock()
-    mock_service.connectWhatsApp = AsyncMock()
-    mock_service.sendMessage = AsyncMock()
-    mock_service.downloadMedia = AsyncMock(return_value=b'mock_media_data')
-    mock_service.disconnect = AsyncMock()
-    mock_service.processGroupMessage = AsyncMock()
+    mock_service.initialize = _aret()
+    mock_service.connectWhatsApp = _aret()
+    mock_service.sendMessage = _aret()
+    mock_service.downloadMedia = _aret(b'mock_media_data')
+    mock_service.disconnect = _aret()
+    mock_service.processGroupMessage = _aret()
     
     return mock_service
 
@@ -177,31 +208,44 @@ def sample_ticket_request():
 
 # Test data cleanup
 @pytest.fixture(autouse=True)
-async def cleanup_test_data():
+async def cleanup_test_data(request, redis_test_db):
     """Clean up any test data after each test"""
     yield
-    # Add cleanup logic here if needed
-    # For example, clear test Redis database
-    pass
+    # Only tests that really talk to Redis need their worker DB flushed
+    if request.node.get_closest_marker('redis') is None:
+        return
+
+    import redis.asyncio as redis
+    client = redis.Redis(
+        host=TEST_ENV['REDIS_HOST'],
+        port=int(TEST_ENV['REDIS_PORT']),
+        db=redis_test_db
+    )
+    try:
+        await client.flushdb()
+    finally:
+        await client.close()
 
 
 # Mock external services
 @pytest.fixture
 def mock_external_apis(monkeypatch):
-    """Mock all external API calls"""
+    """Mock all external API calls, returning the list of requests sent"""
     
-    # Mock HTTP clients
+    # Route every httpx.AsyncClient through an in-process transport
     import httpx
-    mock_client = MagicMock()
-    mock_response = MagicMock()
-    mock_response.json.return_value = {'status': 'ok'}
-    mock_response.raise_for_status.return_value = None
-    mock_client.__aenter__.return_value.get.return_value = mock_response
-    mock_client.__aenter__.return_value.post.return_value = mock_response
+    requests_sent = []
     
-    monkeypatch.setattr(httpx, 'AsyncClient', MagicMock(return_value=mock_client))
+    def handler(request):
+        requests_sent.append(request)
+        return httpx.Response(200, json={'status': 'ok'})
     
-    return mock_client
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(
+        httpx, 'AsyncClient', functools.partial(httpx.AsyncClient, transport=transport)
+    )
+    
+    return requests_sent
 
 
 # Performance fixtures
@@ -211,21 +255,37 @@ def performance_timer():
     import time
     
     class Timer:
+        """Monotonic high-resolution timer; use as `with performance_timer as t:`"""
+        
         def __init__(self):
             self.start_time = None
             self.end_time = None
         
+        def __enter__(self):
+            self.start()
+            return self
+        
+        def __exit__(self, *exc_info):
+            self.stop()
+        
         def start(self):
-            self.start_time = time.time()
+            self.start_time = time.perf_counter_ns()
+            self.end_time = None
         
         def stop(self):
-            self.end_time = time.time()
+            self.end_time = time.perf_counter_ns()
         
         @property
-        def elapsed(self):
-            if self.start_time and self.end_time:
+        def elapsed_ns(self):
+            if self.start_time is not None and self.end_time is not None:
                 return self.end_time - self.start_time
             return None
+        
+        @property
+        def elapsed(self):
+            """Elapsed time in seconds"""
+            elapsed_ns = self.elapsed_ns
+            return elapsed_ns / 1e9 if elapsed_ns is not None else None
     
     return Timer()
 
@@ -242,6 +302,9 @@ async def test_database():
 # Custom markers for test categorization
 def pytest_configure(config):
     """Configure custom pytest markers"""
+    # Give each xdist worker its own Redis DB so `pytest -n auto` doesn't collide
+    TEST_ENV['REDIS_DB'] = str(_worker_redis_db())
+    
     config.addinivalue_line(
         "markers", "unit: mark test as a unit test"
     )
@@ -259,4 +322,14 @@ def pytest_configure(config):
     )
     config.addinivalue_line(
         "markers", "external_api: mark test as requiring external APIs"
-    )
\ No newline at end of file
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Mark tests by directory so `-m` can select tests/unit or tests/integration"""
+    for item in items:
+        path = str(item.fspath)
+        if f"{os.sep}integration{os.sep}" in path:
+            item.add_marker(pytest.mark.integration)
+        elif f"{os.sep}unit{os.sep}" in path:
+            item.add_marker(pytest.mark.unit)
@@ -1,6 +1,10 @@
 """Test fixtures for WhatsApp messages and responses"""
 
-from datetime import datetime
+import json
+from datetime import datetime, timezone
+
+# Fixed reference time so fixture data is deterministic across runs
+FIXTURE_TIMESTAMP = datetime(2024, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
 
 # Sample WhatsApp messages for testing
 SUPPORT_MESSAGES = {
@@ -186,37 +190,65 @@ AI_RESPONSES = {
     }
 }
 
-# Expected Zoho ticket data
-ZOHO_TICKETS = {
-    "urgent_pos_failure": {
-        "subject": "Sistema POS no funciona - impide ventas",
-        "description": """
-Incidente reportado desde WhatsApp:
+# Expected Zoho ticket data, derived from the AI responses above
+TICKET_DESCRIPTION_TEMPLATE = """Incidente reportado desde WhatsApp:
 
-**Resumen:** Sistema POS no funciona - impide ventas
+**Resumen:** {summary}
 
-**Categoría:** technical
-**Urgencia:** critical
-**Confianza:** 0.95
+**Categoría:** {category}
+**Urgencia:** {urgency}
+**Confianza:** {confidence}
 
-**Mensaje ID:** test-urgent-001
-**Grupo:** 120363123456@g.us
+**Mensaje ID:** {message_id}
+**Grupo:** {group_id}
 
 **Información extraída:**
-{
-  "user_type": "customer",
-  "product_mentioned": "POS",
-  "impact": "sales_blocked"
-}
+{extracted_info}
 
 **Respuesta sugerida:**
-Hemos recibido tu reporte urgente del sistema POS. Un técnico será asignado inmediatamente.
-        """.strip(),
-        "priority": "urgent",
-        "classification": "technical",
+{suggested_response}"""
+
+URGENCY_TO_PRIORITY = {
+    "critical": "urgent",
+    "high": "urgent",
+    "medium": "normal",
+    "low": "low"
+}
+
+
+def _ticket_description(ai_response, message_id, group_id):
+    """Render the ticket description the ticket service builds for an AI response"""
+    extracted_info = {
+        key: value for key, value in ai_response["extracted_info"].items()
+        if value is not None
+    }
+    return TICKET_DESCRIPTION_TEMPLATE.format(
+        summary=ai_response["summary"],
+        category=ai_response["category"],
+        urgency=ai_response["urgency"],
+        confidence=ai_response["confidence"],
+        message_id=message_id,
+        group_id=group_id,
+        extracted_info=json.dumps(extracted_info, indent=2, ensure_ascii=False),
+        suggested_response=ai_response["suggested_response"]
+    )
+
+
+ZOHO_TICKETS = {
+    name: {
+        "subject": ai_response["summary"],
+        "description": _ticket_description(
+            ai_response,
+            SUPPORT_MESSAGES[name]["key"]["id"],
+            SUPPORT_MESSAGES[name]["key"]["remoteJid"]
+        ),
+        "priority": URGENCY_TO_PRIORITY[ai_response["urgency"]],
+        "classification": ai_response["category"],
         "contact_id": "CONTACT-123",
         "department_id": "DEPT-456"
     }
+    for name, ai_response in AI_RESPONSES.items()
+    if ai_response["is_support_incident"]
 }
 
 # Mock Redis messages
@@ -255,7 +287,7 @@ TEST_CONTEXTS = {
         "message_id": "test-001",
         "sender": "+573001234567@c.us",
         "group_id": "120363123456@g.us",
-        "timestamp": datetime.now(),
+        "timestamp": FIXTURE_TIMESTAMP,
         "has_media": False,
         "message_type": "text"
     },
@@ -264,7 +296,7 @@ TEST_CONTEXTS = {
         "message_id": "test-002", 
         "sender": "+573009876543@c.us",
         "group_id": "120363123456@g.us",
-        "timestamp": datetime.now(),
+        "timestamp": FIXTURE_TIMESTAMP,
         "has_media": True,
         "message_type": "image"
     }
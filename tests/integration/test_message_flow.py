@@ -1,17 +1,108 @@
 import pytest
 import asyncio
+import functools
 import json
 from unittest.mock import AsyncMock, patch, MagicMock
 from datetime import datetime
 
-from services.whatsapp_service.src.whatsapp_service import WhatsAppService
-from services.classifier_service.app.agents.classifier import MessageClassifier
-from services.ticket_service.app.services.zoho_client import ZohoClient
+# Test-internal JSON round-trips use orjson when available; assertions on what a
+# service published stay on stdlib json so they match the service serializer
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    _dumps = json.dumps
+    _loads = json.loads
+
+# Service modules exercised by this file. They pull in large dependency graphs,
+# so each one is imported on first use and the test is skipped if it can't be.
+WHATSAPP_SERVICE_MODULE = 'services.whatsapp_service.src.whatsapp_service'
+RESPONSE_HANDLER_MODULE = 'services.whatsapp_service.src.handlers.responseHandler'
+CLASSIFIER_MODULE = 'services.classifier_service.app.agents.classifier'
+ZOHO_CLIENT_MODULE = 'services.ticket_service.app.services.zoho_client'
+TICKET_QUEUE_MODULE = 'services.ticket_service.app.services.ticket_queue'
+TICKET_SCHEMAS_MODULE = 'services.ticket_service.app.models.schemas'
+TICKET_MAIN_MODULE = 'services.ticket_service.app.main'
+
+
+@functools.cache
+def _service_module(module_path):
+    """Import a service module once, skipping the calling test if it's unavailable"""
+    return pytest.importorskip(module_path)
+
+
+def _service_attr(module_path, name):
+    """Fetch a class or function from a lazily imported service module"""
+    return getattr(_service_module(module_path), name)
+
+
+CLASSIFIER_AI_RESULT = {
+    'is_support_incident': True,
+    'confidence': 0.95,
+    'category': 'technical',
+    'urgency': 'critical',
+    'summary': 'Sistema POS no funciona - impide ventas',
+    'requires_followup': False,
+    'suggested_response': 'Hemos recibido tu reporte urgente del sistema POS',
+    'extracted_info': {
+        'user_type': 'customer',
+        'product_mentioned': 'POS',
+        'impact': 'sales_blocked'
+    }
+}
+
+
+# Inbound payload the WhatsApp service should publish for sample_whatsapp_message,
+# compared as a parsed dict so key order in the serializer doesn't matter
+EXPECTED_INBOUND_PAYLOAD = {
+    'id': 'integration-test-123',
+    'from': '+573001234567@c.us',
+    'groupId': '120363123456@g.us',
+    'text': 'El sistema POS no funciona urgente, no podemos vender',
+    'timestamp': 1640995200,
+    'hasMedia': False,
+    'messageType': 'text',
+    'rawMessage': {
+        'conversation': 'El sistema POS no funciona urgente, no podemos vender'
+    }
+}
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    """Share a single MessageClassifier across the module"""
+    return _service_attr(CLASSIFIER_MODULE, 'MessageClassifier')()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _patched_redis():
+    """Patch redis.createClient once for the whole module"""
+    with patch('redis.createClient', create=True) as mock_redis_client:
+        yield mock_redis_client
 
 
 class TestMessageFlow:
     """Integration tests for complete message flow"""
 
+    @pytest.fixture(autouse=True)
+    def _service_patches(self):
+        """Patch the AI model manager, Zoho client and ticket-service Redis for every test"""
+        classifier_module = _service_module(CLASSIFIER_MODULE)
+        zoho_client_module = _service_module(ZOHO_CLIENT_MODULE)
+        ticket_main_module = _service_module(TICKET_MAIN_MODULE)
+        
+        with patch.object(classifier_module, 'model_manager') as mock_manager, \
+                patch.object(zoho_client_module, 'ZohoClient') as mock_zoho_class, \
+                patch.object(ticket_main_module, 'redis_client') as mock_ticket_redis:
+            self.mock_manager = mock_manager
+            self.mock_zoho_class = mock_zoho_class
+            self.mock_ticket_redis = mock_ticket_redis
+            yield
+
     @pytest.fixture
     async def mock_redis(self):
         """Mock Redis client for integration testing"""
@@ -48,67 +139,77 @@ class TestMessageFlow:
     async def test_complete_message_flow_support_incident(
         self, 
         mock_redis, 
-        sample_whatsapp_message
+        sample_whatsapp_message,
+        _patched_redis
     ):
         """Test complete flow for support incident message"""
         
         # Mock WhatsApp Service
-        with patch('redis.createClient') as mock_redis_client:
-            mock_redis_client.return_value = mock_redis
-            
-            whatsapp_service = WhatsAppService()
-            await whatsapp_service.initialize()
-            
-            # Step 1: WhatsApp receives message and publishes to Redis
-            await whatsapp_service.processGroupMessage(sample_whatsapp_message)
-            
-            # Verify message was published to inbound channel
-            mock_redis.publish.assert_called_once_with(
-                'whatsapp:messages:inbound',
-                json.dumps({
-                    'id': 'integration-test-123',
-                    'from': '+573001234567@c.us',
-                    'groupId': '120363123456@g.us',
-                    'text': 'El sistema POS no funciona urgente, no podemos vender',
-                    'timestamp': 1640995200,
-                    'hasMedia': False,
-                    'messageType': 'text',
-                    'rawMessage': sample_whatsapp_message['message']
-                })
-            )
+        _patched_redis.return_value = mock_redis
+        
+        WhatsAppService = _service_attr(WHATSAPP_SERVICE_MODULE, 'WhatsAppService')
+        whatsapp_service = WhatsAppService()
+        await whatsapp_service.initialize()
+        
+        # Step 1: WhatsApp receives message and publishes to Redis
+        await whatsapp_service.processGroupMessage(sample_whatsapp_message)
+        
+        # Verify message was published to inbound channel
+        mock_redis.publish.assert_called_once()
+        channel, payload = mock_redis.publish.call_args[0]
+        assert channel == 'whatsapp:messages:inbound'
+        assert json.loads(payload) == EXPECTED_INBOUND_PAYLOAD
 
     @pytest.mark.asyncio
-    async def test_classifier_processes_support_incident(self):
-        """Test classifier processing of support incident"""
-        
-        classifier = MessageClassifier()
+    @pytest.mark.parametrize(
+        "text,ai_result,expected_incident,expected_category,expected_urgency,expected_triggers",
+        [
+            # AI model answers
+            (
+                'El sistema POS no funciona urgente, no podemos vender',
+                CLASSIFIER_AI_RESULT, True, 'technical', 'critical', ['pos']
+            ),
+            # AI unavailable, keyword fallback on a casual message
+            ('Hola, ¿cómo están todos hoy?', None, False, 'not_support', 'low', []),
+            # AI unavailable, keyword fallback on an urgent incident
+            (
+                'El sistema POS está caído urgente',
+                None, True, 'technical', 'critical', ['urgente', 'sistema']
+            ),
+        ],
+        ids=['ai_support_incident', 'fallback_non_incident', 'fallback_support_incident']
+    )
+    async def test_classifier_flow(
+        self,
+        classifier,
+        text,
+        ai_result,
+        expected_incident,
+        expected_category,
+        expected_urgency,
+        expected_triggers
+    ):
+        """Test classifier output with the AI model answering or failing"""
         
-        # Mock AI model manager to return support incident
-        with patch('services.classifier_service.app.agents.classifier.model_manager') as mock_manager:
-            mock_manager.classify_message.return_value = {
-                'is_support_incident': True,
-                'confidence': 0.95,
-                'category': 'technical',
-                'urgency': 'critical',
-                'summary': 'Sistema POS no funciona - impide ventas',
-                'requires_followup': False,
-                'suggested_response': 'Hemos recibido tu reporte urgente del sistema POS',
-                'extracted_info': {
-                    'user_type': 'customer',
-                    'product_mentioned': 'POS',
-                    'impact': 'sales_blocked'
-                }
-            }
-            
-            result = await classifier.classify(
-                'El sistema POS no funciona urgente, no podemos vender'
+        if ai_result is None:
+            # Simulate AI failure to exercise the keyword fallback
+            self.mock_manager.classify_message = AsyncMock(
+                side_effect=Exception("AI service unavailable")
             )
-            
-            assert result.is_support_incident is True
-            assert result.confidence == 0.95
-            assert result.category == 'technical'
-            assert result.urgency == 'critical'
-            assert 'POS' in result.summary
+        else:
+            self.mock_manager.classify_message = AsyncMock(return_value=ai_result)
+        
+        result = await classifier.classify(text)
+        
+        assert result.is_support_incident is expected_incident
+        assert result.category == expected_category
+        assert result.urgency == expected_urgency
+        assert set(expected_triggers) <= set(result.trigger_words)
+        if ai_result is not None:
+            assert result.confidence == ai_result['confidence']
+            assert result.summary == ai_result['summary']
+        elif not expected_incident:
+            assert result.confidence < 0.5
 
     @pytest.mark.asyncio
     async def test_ticket_service_creates_ticket(self):
@@ -134,100 +235,81 @@ class TestMessageFlow:
         }
         
         # Mock Zoho client
-        with patch('services.ticket_service.app.services.zoho_client.ZohoClient') as mock_zoho_class:
-            mock_zoho = MagicMock()
-            mock_zoho.create_contact = AsyncMock(return_value='CONTACT-123')
-            mock_zoho.create_ticket = AsyncMock(return_value='TICKET-456')
-            mock_zoho.list_departments = AsyncMock(return_value=[
-                MagicMock(id='DEPT-789', name='Technical Support')
-            ])
-            mock_zoho_class.return_value = mock_zoho
-            
-            # Mock Redis client
-            mock_redis_client = MagicMock()
-            mock_redis_client.publish_message = AsyncMock()
-            
-            # Import and test the handler function
-            from services.ticket_service.app.main import handle_classification_result
-            
-            # Patch the global redis_client
-            with patch('services.ticket_service.app.main.redis_client', mock_redis_client):
-                await handle_classification_result(classification_data)
-                
-                # Verify contact creation
-                mock_zoho.create_contact.assert_called_once()
-                
-                # Verify ticket creation
-                mock_zoho.create_ticket.assert_called_once()
-                
-                # Verify ticket created event was published
-                mock_redis_client.publish_message.assert_called_once_with(
-                    'tickets:created',
-                    {
-                        'ticket_id': 'TICKET-456',
-                        'group_id': '120363123456@g.us',
-                        'ticket_number': '#TICKET-456',
-                        'summary': mock_redis_client.publish_message.call_args[0][1]['summary'],
-                        'priority': 'urgent',
-                        'timestamp': mock_redis_client.publish_message.call_args[0][1]['timestamp']
-                    }
-                )
+        mock_zoho = MagicMock()
+        mock_zoho.create_contact = AsyncMock(return_value='CONTACT-123')
+        mock_zoho.create_ticket = AsyncMock(return_value='TICKET-456')
+        mock_zoho.list_departments = AsyncMock(return_value=[
+            MagicMock(id='DEPT-789', name='Technical Support')
+        ])
+        self.mock_zoho_class.return_value = mock_zoho
+        
+        # Mock the ticket service's global Redis client
+        mock_redis_client = self.mock_ticket_redis
+        mock_redis_client.publish_message = AsyncMock()
+        
+        handle_classification_result = _service_attr(
+            TICKET_MAIN_MODULE, 'handle_classification_result'
+        )
+        await handle_classification_result(classification_data)
+        
+        # Verify contact creation
+        mock_zoho.create_contact.assert_called_once()
+        
+        # Verify ticket creation
+        mock_zoho.create_ticket.assert_called_once()
+        
+        # Verify ticket created event was published
+        mock_redis_client.publish_message.assert_called_once_with(
+            'tickets:created',
+            {
+                'ticket_id': 'TICKET-456',
+                'group_id': '120363123456@g.us',
+                'ticket_number': '#TICKET-456',
+                'summary': mock_redis_client.publish_message.call_args[0][1]['summary'],
+                'priority': 'urgent',
+                'timestamp': mock_redis_client.publish_message.call_args[0][1]['timestamp']
+            }
+        )
 
     @pytest.mark.asyncio
-    async def test_response_handler_sends_confirmation(self, mock_redis):
+    async def test_response_handler_sends_confirmation(self, mock_redis, _patched_redis):
         """Test response handler sending confirmation to WhatsApp"""
         
-        from services.whatsapp_service.src.handlers.responseHandler import ResponseHandler
-        
         # Mock WhatsApp service
         mock_whatsapp_service = MagicMock()
         mock_whatsapp_service.sendMessage = AsyncMock()
         
-        with patch('redis.createClient') as mock_redis_client:
-            mock_redis_client.return_value = mock_redis
-            
-            response_handler = ResponseHandler(mock_whatsapp_service)
-            await response_handler.initialize()
-            
-            # Simulate ticket created event
-            ticket_data = {
-                'groupId': '120363123456@g.us',
-                'ticketId': 'TICKET-456',
-                'ticketNumber': '#456',
-                'summary': 'Sistema POS no funciona - impide ventas'
-            }
-            
-            await response_handler.handleTicketCreated(ticket_data)
-            
-            # Verify confirmation message was sent
-            mock_whatsapp_service.sendMessage.assert_called_once()
-            call_args = mock_whatsapp_service.sendMessage.call_args
-            
-            assert call_args[0][0] == '120363123456@g.us'  # Group ID
-            assert '✅ *Ticket creado exitosamente*' in call_args[0][1]
-            assert '#456' in call_args[0][1]
-            assert 'Sistema POS no funciona' in call_args[0][1]
-
-    @pytest.mark.asyncio
-    async def test_end_to_end_non_incident_flow(self):
-        """Test complete flow for non-incident message"""
+        _patched_redis.return_value = mock_redis
+        
+        ResponseHandler = _service_attr(RESPONSE_HANDLER_MODULE, 'ResponseHandler')
+        response_handler = ResponseHandler(mock_whatsapp_service)
+        await response_handler.initialize()
+        
+        # Simulate ticket created event
+        ticket_data = {
+            'groupId': '120363123456@g.us',
+            'ticketId': 'TICKET-456',
+            'ticketNumber': '#456',
+            'summary': 'Sistema POS no funciona - impide ventas'
+        }
         
-        classifier = MessageClassifier()
+        await response_handler.handleTicketCreated(ticket_data)
         
-        # Test casual message
-        result = await classifier.classify('Hola, ¿cómo están todos hoy?')
+        # Verify confirmation message was sent
+        mock_whatsapp_service.sendMessage.assert_called_once()
+        call_args = mock_whatsapp_service.sendMessage.call_args
         
-        assert result.is_support_incident is False
-        assert result.category == 'not_support'
-        assert result.urgency == 'low'
-        assert result.confidence < 0.5
+        assert call_args[0][0] == '120363123456@g.us'  # Group ID
+        assert '✅ *Ticket creado exitosamente*' in call_args[0][1]
+        assert '#456' in call_args[0][1]
+        assert 'Sistema POS no funciona' in call_args[0][1]
 
     @pytest.mark.asyncio
     async def test_circuit_breaker_zoho_failure(self):
         """Test circuit breaker when Zoho is unavailable"""
         
-        from services.ticket_service.app.services.ticket_queue import TicketQueue
-        from services.ticket_service.app.models.schemas import TicketRequest
+        TicketQueue = _service_attr(TICKET_QUEUE_MODULE, 'TicketQueue')
+        TicketRequest = _service_attr(TICKET_SCHEMAS_MODULE, 'TicketRequest')
         
         # Mock Redis client
         mock_redis_client = MagicMock()
@@ -254,25 +336,6 @@ class TestMessageFlow:
         mock_redis_client.redis.lpush.assert_called_once()
         mock_redis_client.set_cache.assert_called_once()
 
-    @pytest.mark.asyncio
-    async def test_ai_model_fallback_flow(self):
-        """Test AI model fallback when primary model fails"""
-        
-        classifier = MessageClassifier()
-        
-        with patch('services.classifier_service.app.agents.classifier.model_manager') as mock_manager:
-            # Simulate AI failure to test keyword fallback
-            mock_manager.classify_message.side_effect = Exception("AI service unavailable")
-            
-            result = await classifier.classify('El sistema POS está caído urgente')
-            
-            # Should fall back to keyword classification
-            assert result.is_support_incident is True
-            assert result.category == 'technical'
-            assert result.urgency == 'critical'
-            assert 'urgente' in result.trigger_words
-            assert 'sistema' in result.trigger_words
-
     @pytest.mark.asyncio
     async def test_redis_channel_communication(self, mock_redis):
         """Test Redis pub/sub communication between services"""
@@ -283,7 +346,7 @@ class TestMessageFlow:
         
         def track_publish(channel, message):
             channels_used.append(channel)
-            messages_published.append(json.loads(message) if isinstance(message, str) else message)
+            messages_published.append(_loads(message) if isinstance(message, str) else message)
             return AsyncMock()
         
         mock_redis.publish.side_effect = track_publish
@@ -299,8 +362,6 @@ class TestMessageFlow:
             'messageType': 'text'
         }
         
-        await mock_redis.publish('whatsapp:messages:inbound', json.dumps(whatsapp_message))
-        
         # Step 2: Classifier → Ticket Service
         classification_result = {
             'message_id': 'test-123',
@@ -312,8 +373,6 @@ class TestMessageFlow:
             }
         }
         
-        await mock_redis.publish('tickets:classify:result', json.dumps(classification_result))
-        
         # Step 3: Ticket Service → WhatsApp (confirmation)
         ticket_created = {
             'ticket_id': 'TICKET-123',
@@ -322,7 +381,12 @@ class TestMessageFlow:
             'summary': 'Sistema no funciona'
         }
         
-        await mock_redis.publish('tickets:created', json.dumps(ticket_created))
+        # Publish all three hops concurrently, as a pipelined client would
+        await asyncio.gather(
+            mock_redis.publish('whatsapp:messages:inbound', _dumps(whatsapp_message)),
+            mock_redis.publish('tickets:classify:result', _dumps(classification_result)),
+            mock_redis.publish('tickets:created', _dumps(ticket_created))
+        )
         
         # Verify all channels were used
         expected_channels = [
@@ -0,0 +1,23 @@
+"""Shared fixtures for classifier-service unit tests"""
+
+import pytest
+
+try:
+    import fakeredis.aioredis as fake_aioredis
+except ImportError:  # Optional: tests that need it are skipped
+    fake_aioredis = None
+
+
+@pytest.fixture(scope="module")
+def fake_redis_server():
+    """In-memory Redis shared by every test in a module"""
+    if fake_aioredis is None:
+        pytest.skip("fakeredis is not installed")
+    return fake_aioredis.FakeRedis(decode_responses=False)
+
+
+@pytest.fixture
+async def fake_redis(fake_redis_server):
+    """The module's fake Redis, emptied before each test"""
+    await fake_redis_server.flushall()
+    return fake_redis_server
@@ -0,0 +1,93 @@
+import pytest
+import sys
+import os
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+# Add services to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'services', 'classifier-service'))
+
+from app.ai.batcher import ClassificationBatcher
+
+
+class TestClassificationBatcher:
+    """Test suite for ClassificationBatcher"""
+
+    @pytest.fixture
+    def manager(self):
+        """Model manager echoing one result per message"""
+        manager = MagicMock()
+        manager.classify_messages = AsyncMock(
+            side_effect=lambda messages: [{"summary": text} for text, _ in messages]
+        )
+        return manager
+
+    @pytest.fixture
+    async def batcher(self, manager):
+        batcher = ClassificationBatcher(manager)
+        batcher.max_wait = 0.05
+        batcher.start()
+        yield batcher
+        await batcher.stop()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_submissions_share_one_call(self, batcher, manager):
+        """Test messages arriving within the window are classified together"""
+        futures = [batcher.submit(f"mensaje {i}", {"message_id": str(i)}) for i in range(3)]
+
+        results = await asyncio.gather(*futures)
+
+        assert [r["summary"] for r in results] == ["mensaje 0", "mensaje 1", "mensaje 2"]
+        manager.classify_messages.assert_awaited_once()
+        assert len(manager.classify_messages.call_args[0][0]) == 3
+
+    @pytest.mark.asyncio
+    async def test_batches_are_capped(self, batcher, manager):
+        """Test a batch never exceeds max_batch_size"""
+        batcher.max_batch_size = 2
+        futures = [batcher.submit(f"mensaje {i}") for i in range(5)]
+
+        await asyncio.gather(*futures)
+
+        sizes = [len(call[0][0]) for call in manager.classify_messages.call_args_list]
+        assert sizes == [2, 2, 1]
+
+    @pytest.mark.asyncio
+    async def test_flush_and_errors(self, batcher, manager):
+        """Test flush dispatches immediately and failures reach every caller"""
+        manager.classify_messages.side_effect = Exception("AI model failed")
+        batcher.max_wait = 10
+        futures = [batcher.submit("uno"), batcher.submit("dos")]
+
+        await batcher.flush()
+
+        for future in futures:
+            with pytest.raises(Exception, match="AI model failed"):
+                await future
+
+    @pytest.mark.asyncio
+    async def test_stop_mid_batch_resolves_held_messages(self, manager):
+        """Test messages already taken off the queue are classified when the batcher stops"""
+        batcher = ClassificationBatcher(manager)
+        batcher.max_wait = 10
+        batcher.start()
+        futures = [batcher.submit("uno"), batcher.submit("dos")]
+
+        # Let the loop take both messages and wait for more inside the batch window
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert batcher._queue.empty()
+
+        await batcher.stop()
+
+        assert all(future.done() for future in futures)
+        assert [future.result()["summary"] for future in futures] == ["uno", "dos"]
+        manager.classify_messages.assert_awaited_once()
+
+    def test_batch_size_one_disables(self, manager):
+        """Test batching is off when the batch size is 1"""
+        batcher = ClassificationBatcher(manager)
+        batcher.max_batch_size = 1
+        batcher.start()
+
+        assert not batcher.running
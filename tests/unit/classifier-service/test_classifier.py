@@ -114,6 +114,18 @@ class TestMessageClassifier:
         assert result.urgency == "low"
         assert result.confidence < 0.5
 
+    @pytest.mark.parametrize("text,category,urgency", [
+        ("Urgente: revisar la factura en caja", "technical", "critical"),
+        ("Problema con el pago en la tienda", "billing", "medium"),
+        ("Hay un problema en la tienda", "general_inquiry", "low"),
+        ("Necesito ayuda", "technical", "medium"),
+    ])
+    def test_fallback_classification_rule_priority(self, classifier_instance, text, category, urgency):
+        """Test the highest-priority matched rule decides category and urgency"""
+        result = classifier_instance._fallback_classification(text)
+        
+        assert (result.category, result.urgency) == (category, urgency)
+
     def test_extract_trigger_words(self, classifier_instance):
         """Test trigger word extraction"""
         text = "El sistema POS no funciona urgente en la tienda"
@@ -125,6 +137,29 @@ class TestMessageClassifier:
         assert "tienda" in words
         assert len(set(words)) == len(words)  # No duplicates
 
+    def test_extract_trigger_words_phrases_and_punctuation(self, classifier_instance):
+        """Test multi-word keywords and keywords next to punctuation are found"""
+        text = "¡URGENTE! La base de datos no funciona, ¿el servidor?"
+        words = classifier_instance._extract_trigger_words(text)
+        
+        assert "urgente" in words
+        assert "base de datos" in words
+        assert "no funciona" in words
+        assert "servidor" in words
+
+    def test_regex_matcher_matches_automaton(self, classifier_instance):
+        """Test the regex keyword matcher used without pyahocorasick agrees with the automaton"""
+        with patch('app.agents.classifier.ahocorasick', None):
+            regex_classifier = MessageClassifier()
+        
+        assert regex_classifier._keyword_patterns is not None
+        
+        text = "El sistema está caído urgente, no pueden vender ni cobrar la factura"
+        assert regex_classifier._match_keywords(text) == classifier_instance._match_keywords(text)
+        assert sorted(regex_classifier._extract_trigger_words(text)) == sorted(
+            classifier_instance._extract_trigger_words(text)
+        )
+
     @pytest.mark.asyncio
     async def test_convert_ai_result_success(self, classifier_instance):
         """Test successful AI result conversion"""
@@ -160,6 +195,18 @@ class TestMessageClassifier:
         assert isinstance(result, ClassificationResponse)
         assert result.is_support_incident is True  # Because of "sistema no funciona"
 
+    def test_convert_ai_result_validates_mistyped_fields(self, classifier_instance):
+        """Test well-typed results skip validation while mistyped ones are coerced"""
+        ai_result = {"is_support_incident": True, "confidence": 1, "category": "technical"}
+        trusted = classifier_instance._convert_ai_result(ai_result, "sistema")
+        assert trusted.confidence == 1.0 and isinstance(trusted.confidence, float)
+        
+        mistyped = classifier_instance._convert_ai_result(
+            {"is_support_incident": "true", "confidence": "0.75", "category": "billing"}, "factura"
+        )
+        assert mistyped.is_support_incident is True
+        assert mistyped.confidence == 0.75
+
     @pytest.mark.asyncio
     async def test_classify_empty_message(self, classifier_instance):
         """Test classification of empty message"""
@@ -169,6 +216,17 @@ class TestMessageClassifier:
         assert result.is_support_incident is False
         assert result.confidence < 0.5
 
+    @pytest.mark.asyncio
+    async def test_classify_blank_message_skips_ai(self, classifier_instance):
+        """Test blank text is answered from keywords without calling the model"""
+        with patch('app.agents.classifier.model_manager') as mock_manager:
+            mock_manager.classify_message = AsyncMock()
+            
+            result = await classifier_instance.classify("   ", None)
+            
+            assert result.category == "not_support"
+            mock_manager.classify_message.assert_not_called()
+
     @pytest.mark.asyncio
     async def test_classify_with_context(self, classifier_instance, sample_context):
         """Test classification with message context"""
@@ -194,6 +252,80 @@ class TestMessageClassifier:
             assert args[0][1]["message_id"] == "test-123"
 
 
+    @pytest.mark.asyncio
+    async def test_classify_caches_ai_result(self, classifier_instance):
+        """Test repeated messages reuse the cached AI result"""
+        ai_result = {
+            "is_support_incident": True,
+            "confidence": 0.9,
+            "category": "technical",
+            "urgency": "high",
+            "summary": "POS caído",
+            "requires_followup": False,
+            "suggested_response": "Test response",
+            "extracted_info": {}
+        }
+
+        with patch('app.agents.classifier.model_manager') as mock_manager:
+            mock_manager.classify_message = AsyncMock(return_value=ai_result)
+            
+            first = await classifier_instance.classify("El POS no funciona")
+            second = await classifier_instance.classify("  el pos   NO funciona ")
+            
+            mock_manager.classify_message.assert_called_once()
+            assert second.summary == first.summary == "POS caído"
+
+    @pytest.mark.asyncio
+    async def test_classify_cache_hits_are_isolated(self, classifier_instance):
+        """Test a caller mutating its response does not change later cache hits"""
+        ai_result = {
+            "is_support_incident": True,
+            "confidence": 0.9,
+            "category": "technical",
+            "urgency": "high",
+            "summary": "POS caído",
+            "requires_followup": False,
+            "suggested_response": "Test response",
+            "extracted_info": {"product_mentioned": "POS"}
+        }
+
+        with patch('app.agents.classifier.model_manager') as mock_manager:
+            mock_manager.classify_message = AsyncMock(return_value=ai_result)
+            
+            first = await classifier_instance.classify("El POS no funciona")
+            first.extracted_info["product_mentioned"] = "changed"
+            second = await classifier_instance.classify("El POS no funciona")
+            
+            mock_manager.classify_message.assert_called_once()
+            assert second.extracted_info == {"product_mentioned": "POS"}
+
+    @pytest.mark.asyncio
+    async def test_classify_does_not_cache_default_or_media(self, classifier_instance, sample_context):
+        """Test default results and media messages always go to the AI model"""
+        default_result = {
+            "is_support_incident": True,
+            "confidence": 0.1,
+            "category": "general_inquiry",
+            "urgency": "medium",
+            "summary": "Mensaje requiere revisión manual",
+            "requires_followup": True,
+            "suggested_response": "Test response",
+            "extracted_info": {"classification_method": "default"}
+        }
+        media_context = sample_context.model_copy(update={"has_media": True})
+
+        with patch('app.agents.classifier.model_manager') as mock_manager:
+            mock_manager.classify_message = AsyncMock(return_value=default_result)
+            
+            await classifier_instance.classify("El POS no funciona")
+            await classifier_instance.classify("El POS no funciona")
+            await classifier_instance.classify("Mira esta foto", media_context)
+            await classifier_instance.classify("Mira esta foto", media_context)
+            
+            assert mock_manager.classify_message.call_count == 4
+            assert len(classifier_instance._ai_cache) == 0
+
+
 class TestClassifierInstance:
     """Test the global classifier instance"""
 
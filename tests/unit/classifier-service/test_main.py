@@ -2,9 +2,12 @@ import pytest
 import sys
 import os
 from unittest.mock import AsyncMock, MagicMock, patch
+from dataclasses import dataclass, field, asdict
 from datetime import datetime
+from typing import Any, Dict, List
 from fastapi.testclient import TestClient
 import json
+import orjson
 
 # Add services to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'services', 'classifier-service'))
@@ -13,6 +16,27 @@ from app.main import app
 from app.models.schemas import ClassificationRequest, MessageData
 
 
+@dataclass
+class FakeClassification:
+    """Plain stand-in for ClassificationResponse, cheaper than a MagicMock tree"""
+    is_support_incident: bool
+    confidence: float
+    category: str
+    urgency: str = "medium"
+    summary: str = ""
+    requires_followup: bool = False
+    suggested_response: str = ""
+    extracted_info: Dict[str, Any] = field(default_factory=dict)
+    trigger_words: List[str] = field(default_factory=list)
+    processing_time: float = 0.0
+
+    def dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def model_dump_json(self) -> bytes:
+        return orjson.dumps(asdict(self))
+
+
 class TestClassifierServiceEndpoints:
     """Test suite for Classifier Service FastAPI endpoints"""
     
@@ -69,17 +93,18 @@ class TestClassifierServiceEndpoints:
     @patch('app.main.classifier.classify')
     def test_classify_endpoint_success(self, mock_classify, client, sample_classification_request):
         """Test successful classification endpoint"""
-        mock_classification_result = MagicMock()
-        mock_classification_result.is_support_incident = True
-        mock_classification_result.confidence = 0.85
-        mock_classification_result.category = "technical"
-        mock_classification_result.urgency = "high"
-        mock_classification_result.summary = "Sistema POS no funciona"
-        mock_classification_result.requires_followup = False
-        mock_classification_result.suggested_response = "Test response"
-        mock_classification_result.extracted_info = {"user_type": "customer"}
-        mock_classification_result.trigger_words = ["sistema", "pos"]
-        mock_classification_result.processing_time = 0.15
+        mock_classification_result = FakeClassification(
+            is_support_incident=True,
+            confidence=0.85,
+            category="technical",
+            urgency="high",
+            summary="Sistema POS no funciona",
+            requires_followup=False,
+            suggested_response="Test response",
+            extracted_info={"user_type": "customer"},
+            trigger_words=["sistema", "pos"],
+            processing_time=0.15
+        )
         
         mock_classify.return_value = mock_classification_result
         
@@ -152,23 +177,19 @@ class TestMessageHandling:
         }
     
     @patch('app.main.classifier.classify')
-    @patch('app.main.redis_client.publish_message')
+    @patch('app.main.redis_client.publish_messages')
     @pytest.mark.asyncio
     async def test_handle_whatsapp_message_incident(self, mock_publish, mock_classify, sample_whatsapp_message):
         """Test handling WhatsApp message that is classified as incident"""
         from app.main import handle_whatsapp_message
         
         # Mock classification result
-        mock_classification_result = MagicMock()
-        mock_classification_result.is_support_incident = True
-        mock_classification_result.confidence = 0.85
-        mock_classification_result.category = "technical"
-        mock_classification_result.suggested_response = "Test response"
-        mock_classification_result.dict.return_value = {
-            "is_support_incident": True,
-            "confidence": 0.85,
-            "category": "technical"
-        }
+        mock_classification_result = FakeClassification(
+            is_support_incident=True,
+            confidence=0.85,
+            category="technical",
+            suggested_response="Test response"
+        )
         
         mock_classify.return_value = mock_classification_result
         mock_publish.return_value = True
@@ -178,36 +199,34 @@ class TestMessageHandling:
         # Verify classification was called
         mock_classify.assert_called_once()
         
-        # Verify message was published to ticket service
-        mock_publish.assert_called()
-        publish_calls = mock_publish.call_args_list
+        # Verify both messages went out in a single pipelined publish
+        mock_publish.assert_called_once()
+        channels = [channel for channel, _ in mock_publish.call_args[0][0]]
         
         # Should publish to tickets:classify:result
-        ticket_publish_call = [call for call in publish_calls if call[0][0] == 'tickets:classify:result']
-        assert len(ticket_publish_call) > 0
+        assert 'tickets:classify:result' in channels
+        
+        # The pre-serialized classification is embedded as a JSON object
+        payload = orjson.loads(orjson.dumps(dict(mock_publish.call_args[0][0])['tickets:classify:result']))
+        assert payload['classification'] == mock_classification_result.dict()
         
         # If high confidence, should also publish suggested response
         if mock_classification_result.confidence > 0.7:
-            response_publish_call = [call for call in publish_calls if call[0][0] == 'agents:responses']
-            assert len(response_publish_call) > 0
+            assert 'agents:responses' in channels
     
     @patch('app.main.classifier.classify')
-    @patch('app.main.redis_client.publish_message')
+    @patch('app.main.redis_client.publish_messages')
     @pytest.mark.asyncio
     async def test_handle_whatsapp_message_non_incident(self, mock_publish, mock_classify, sample_whatsapp_message):
         """Test handling WhatsApp message that is not an incident"""
         from app.main import handle_whatsapp_message
         
         # Mock classification result - not an incident
-        mock_classification_result = MagicMock()
-        mock_classification_result.is_support_incident = False
-        mock_classification_result.confidence = 0.3
-        mock_classification_result.category = "general_inquiry"
-        mock_classification_result.dict.return_value = {
-            "is_support_incident": False,
-            "confidence": 0.3,
-            "category": "general_inquiry"
-        }
+        mock_classification_result = FakeClassification(
+            is_support_incident=False,
+            confidence=0.3,
+            category="general_inquiry"
+        )
         
         mock_classify.return_value = mock_classification_result
         
@@ -219,6 +238,20 @@ class TestMessageHandling:
         # Should not publish to ticket service for non-incidents
         mock_publish.assert_not_called()
     
+    @patch('app.main.classifier.classify')
+    @patch('app.main.redis_client.publish_messages')
+    @pytest.mark.asyncio
+    async def test_handle_whatsapp_message_sets_processing_time(self, mock_publish, mock_classify, sample_whatsapp_message):
+        """Test the handler records a positive processing time"""
+        from app.main import handle_whatsapp_message
+        
+        classification = FakeClassification(is_support_incident=False, confidence=0.3, category="general_inquiry")
+        mock_classify.return_value = classification
+        
+        await handle_whatsapp_message(sample_whatsapp_message)
+        
+        assert classification.processing_time > 0
+    
     @patch('app.main.classifier.classify')
     @pytest.mark.asyncio
     async def test_handle_whatsapp_message_error(self, mock_classify, sample_whatsapp_message):
@@ -264,8 +297,29 @@ class TestLifecycleEvents:
         
         # Test full lifecycle
         async with lifespan(app):
-            pass
+            from app.main import message_workers
+            workers = list(message_workers)
+            assert workers
         
         # Verify shutdown cleanup
         mock_task.cancel.assert_called_once()
-        mock_redis_disconnect.assert_called_once()
\ No newline at end of file
+        assert all(worker.cancelled() for worker in workers)
+        mock_redis_disconnect.assert_called_once()
+
+    @patch('app.main.handle_whatsapp_message', new_callable=AsyncMock)
+    @pytest.mark.asyncio
+    async def test_message_worker_processes_queue(self, mock_handle):
+        """Test workers drain the inbound queue even when handling fails"""
+        import asyncio
+        from app.main import message_worker
+        
+        mock_handle.side_effect = [Exception("boom"), None]
+        queue = asyncio.Queue()
+        worker = asyncio.create_task(message_worker(queue))
+        await queue.put({"id": "1"})
+        await queue.put({"id": "2"})
+        
+        await asyncio.wait_for(queue.join(), 1)
+        worker.cancel()
+        
+        assert mock_handle.await_count == 2
\ No newline at end of file
@@ -3,11 +3,27 @@ import sys
 import os
 from unittest.mock import AsyncMock, patch, MagicMock
 import json
+import orjson
+from dataclasses import dataclass
+from typing import Any, Dict
 
 # Add services to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'services', 'classifier-service'))
 
 from app.ai.model_manager import AIModelManager, ModelProvider
+from app.ai.semantic_cache import SemanticCache
+
+
+@dataclass
+class FakeResponse:
+    """Minimal httpx.Response stand-in"""
+    payload: Dict[str, Any]
+
+    def raise_for_status(self):
+        pass
+
+    def json(self) -> Dict[str, Any]:
+        return self.payload
 
 
 class TestAIModelManager:
@@ -53,7 +69,7 @@ class TestAIModelManager:
             result = await manager.classify_message("El sistema POS no funciona")
             
             assert result == expected_result
-            mock_call.assert_called_once_with(ModelProvider.OPENAI, manager._build_classification_prompt("El sistema POS no funciona", None))
+            mock_call.assert_called_once_with(ModelProvider.OPENAI, manager._dynamic_suffix("El sistema POS no funciona", None))
 
     @pytest.mark.asyncio
     async def test_classify_message_fallback_to_secondary(self, manager):
@@ -77,8 +93,8 @@ class TestAIModelManager:
             
             assert result == expected_result
             assert mock_call.call_count == 2
-            mock_call.assert_any_call(ModelProvider.OPENAI, manager._build_classification_prompt("Problema con el sistema", None))
-            mock_call.assert_any_call(ModelProvider.GOOGLE, manager._build_classification_prompt("Problema con el sistema", None))
+            mock_call.assert_any_call(ModelProvider.OPENAI, manager._dynamic_suffix("Problema con el sistema", None))
+            mock_call.assert_any_call(ModelProvider.GOOGLE, manager._dynamic_suffix("Problema con el sistema", None))
 
     @pytest.mark.asyncio
     async def test_classify_message_all_models_fail(self, manager):
@@ -113,6 +129,9 @@ class TestAIModelManager:
             
             assert result == mock_response
             mock_client.chat.completions.create.assert_called_once()
+            messages = mock_client.chat.completions.create.call_args.kwargs["messages"]
+            assert messages[0] == {"role": "system", "content": manager._static_prefix()}
+            assert messages[1]["content"] == "Test prompt"
 
     @pytest.mark.asyncio
     async def test_call_google_success(self, manager):
@@ -127,12 +146,12 @@ class TestAIModelManager:
         mock_gemini_response.text = json.dumps(mock_response)
 
         with patch.object(manager, 'google_client') as mock_client:
-            with patch('asyncio.get_event_loop') as mock_loop:
-                mock_loop.return_value.run_in_executor.return_value = mock_gemini_response
-                
-                result = await manager._call_google("Test prompt")
-                
-                assert result == mock_response
+            mock_client.generate_content_async = AsyncMock(return_value=mock_gemini_response)
+            
+            result = await manager._call_google("Test prompt")
+            
+            assert result == mock_response
+            mock_client.generate_content_async.assert_awaited_once()
 
     @pytest.mark.asyncio
     async def test_call_anthropic_success(self, manager):
@@ -147,12 +166,13 @@ class TestAIModelManager:
             "content": [{"text": json.dumps(mock_response)}]
         }
 
-        with patch('aiohttp.ClientSession') as mock_session:
-            mock_session.return_value.__aenter__.return_value.post.return_value.__aenter__.return_value.json = AsyncMock(return_value=mock_http_response)
-            
+        with patch.object(manager.http_client, 'post', AsyncMock(return_value=FakeResponse(mock_http_response))) as mock_post:
             result = await manager._call_anthropic("Test prompt")
-            
-            assert result == mock_response
+        
+        assert result == mock_response
+        content = mock_post.call_args.kwargs["json"]["messages"][0]["content"]
+        assert content[0]["cache_control"] == {"type": "ephemeral"}
+        assert content[1]["text"] == "Test prompt"
 
     def test_build_classification_prompt(self, manager):
         """Test prompt building"""
@@ -166,6 +186,8 @@ class TestAIModelManager:
         assert "is_support_incident" in prompt
         assert "confidence" in prompt
         assert "category" in prompt
+        assert prompt == manager._static_prefix() + manager._dynamic_suffix(message, context)
+        assert message not in manager._static_prefix()
 
     def test_build_classification_prompt_no_context(self, manager):
         """Test prompt building without context"""
@@ -235,4 +257,131 @@ class TestAIModelManager:
             # Verify context was included in prompt
             prompt = mock_call.call_args[0][1]
             assert "message_id" in prompt
-            assert "test-123" in prompt
\ No newline at end of file
+            assert "test-123" in prompt
+
+    @pytest.mark.asyncio
+    async def test_classify_message_semantic_cache_hit(self, manager):
+        """Test near-duplicate messages reuse the cached classification"""
+        cached = {"is_support_incident": True, "confidence": 0.95, "category": "technical"}
+
+        with patch.object(manager.semantic_cache, 'embed', AsyncMock(return_value=b'vec')), \
+             patch.object(manager.semantic_cache, 'lookup', AsyncMock(return_value=cached)), \
+             patch.object(manager, '_call_model') as mock_call:
+            result = await manager.classify_message("El sistema no funciona")
+
+            assert result == cached
+            mock_call.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_classify_message_stores_in_semantic_cache(self, manager):
+        """Test model results are offered to the semantic cache"""
+        result = {"is_support_incident": True, "confidence": 0.9, "category": "technical"}
+
+        with patch.object(manager.semantic_cache, 'embed', AsyncMock(return_value=b'vec')), \
+             patch.object(manager.semantic_cache, 'lookup', AsyncMock(return_value=None)), \
+             patch.object(manager.semantic_cache, 'store', AsyncMock()) as mock_store, \
+             patch.object(manager, '_call_model', AsyncMock(return_value=result)):
+            await manager.classify_message("El sistema no funciona")
+
+            mock_store.assert_awaited_once_with("El sistema no funciona", b'vec', result)
+
+    def test_semantic_cache_confidence_floors(self):
+        """Test per-category confidence floors gate reuse"""
+        with patch.dict(os.environ, {'SEMANTIC_CACHE_CONFIDENCE_FLOORS': 'billing=0.95'}):
+            cache = SemanticCache()
+
+        assert cache.is_reusable({"category": "technical", "confidence": 0.85})
+        assert not cache.is_reusable({"category": "technical", "confidence": 0.5})
+        assert not cache.is_reusable({"category": "billing", "confidence": 0.9})
+        assert not cache.is_reusable({
+            "category": "technical", "confidence": 0.9,
+            "extracted_info": {"classification_method": "default"}
+        })
+
+    @pytest.mark.asyncio
+    async def test_semantic_cache_store_pipelined(self):
+        """Test an entry and its TTL are written in one pipeline as orjson"""
+        cache = SemanticCache()
+        cache.model = MagicMock()
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        cache.redis = MagicMock()
+        cache.redis.pipeline.return_value.__aenter__ = AsyncMock(return_value=pipe)
+        cache.redis.pipeline.return_value.__aexit__ = AsyncMock(return_value=False)
+        classification = {"category": "technical", "confidence": 0.9}
+
+        await cache.store("El sistema no funciona", b'vec', classification)
+
+        cache.redis.pipeline.assert_called_once_with(transaction=False)
+        mapping = pipe.hset.call_args.kwargs["mapping"]
+        assert mapping["classification"] == orjson.dumps(classification)
+        pipe.expire.assert_called_once_with(pipe.hset.call_args[0][0], cache.ttl)
+        pipe.execute.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_classify_messages_batch(self, manager):
+        """Test several messages are classified with one model call"""
+        results = [{"category": "technical"}, {"category": "not_support"}]
+
+        with patch.object(manager, '_call_model', AsyncMock(return_value={"classifications": results})) as mock_call:
+            classified = await manager.classify_messages([("No funciona la caja", {}), ("Gracias", {})])
+
+            assert classified == results
+            mock_call.assert_awaited_once()
+            prompt = mock_call.call_args[0][1]
+            assert "No funciona la caja" in prompt and "Gracias" in prompt
+            assert mock_call.call_args.kwargs["max_tokens"] == manager.max_tokens * 2
+
+    @pytest.mark.asyncio
+    async def test_classify_messages_batch_budget_capped_per_provider(self, manager):
+        """Test large batches never ask a provider for more output than it allows"""
+        manager.primary_model = ModelProvider.ANTHROPIC
+        manager.fallback_model = ModelProvider.OPENAI
+        messages = [(f"mensaje {i}", {}) for i in range(20)]
+        results = [{"category": "technical"}] * len(messages)
+
+        with patch.object(manager, '_call_model', AsyncMock(side_effect=[None, {"classifications": results}])) as mock_call:
+            assert await manager.classify_messages(messages) == results
+
+            budgets = [call.kwargs["max_tokens"] for call in mock_call.call_args_list]
+            assert budgets == [4096, 16384]
+
+    @pytest.mark.asyncio
+    async def test_classify_messages_wrong_shape_falls_back(self, manager):
+        """Test a malformed batch answer falls back to per-message calls"""
+        single = {"category": "technical"}
+
+        with patch.object(manager, '_call_model', AsyncMock(return_value={"classifications": [single]})), \
+             patch.object(manager, 'classify_message', AsyncMock(return_value=single)) as mock_single:
+            classified = await manager.classify_messages([("uno", {}), ("dos", {})])
+
+            assert classified == [single, single]
+            assert mock_single.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_classify_message_local_model_confident(self, manager):
+        """Test a confident local model answer skips the cloud models"""
+        manager.local_model.session = MagicMock()
+        
+        with patch.object(manager.local_model, 'infer', return_value=("technical", 0.97)), \
+             patch.object(manager, '_call_model') as mock_call:
+            result = await manager.classify_message("El POS no imprime")
+            
+            assert result["category"] == "technical"
+            assert result["is_support_incident"] is True
+            assert result["confidence"] == 0.97
+            assert result["extracted_info"]["classification_method"] == "local_model"
+            mock_call.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_classify_message_local_model_low_confidence(self, manager):
+        """Test a low-confidence local answer falls through to the cloud models"""
+        manager.local_model.session = MagicMock()
+        cloud_result = {"is_support_incident": True, "confidence": 0.9, "category": "billing"}
+        
+        with patch.object(manager.local_model, 'infer', return_value=("technical", 0.5)), \
+             patch.object(manager, '_call_model', AsyncMock(return_value=cloud_result)) as mock_call:
+            result = await manager.classify_message("Me cobraron dos veces")
+            
+            assert result == cloud_result
+            mock_call.assert_awaited_once()
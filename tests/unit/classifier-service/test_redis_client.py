@@ -2,12 +2,14 @@ import pytest
 import sys
 import os
 from unittest.mock import AsyncMock, MagicMock, patch
-import json
+import msgpack
+import orjson
 
 # Add services to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'services', 'classifier-service'))
 
 from app.utils.redis_client import RedisClient
+from redis.asyncio.connection import _AsyncHiredisParser
 
 
 class TestRedisClient:
@@ -32,27 +34,64 @@ class TestRedisClient:
             assert client.password == 'test-password'
             assert "redis://:test-password@localhost:6379" == client.url
     
-    @patch('redis.asyncio.from_url')
+    @patch.dict('app.utils.redis_client._pools', clear=True)
+    @patch('app.utils.redis_client.HIREDIS_AVAILABLE', True)
+    @patch('redis.asyncio.BlockingConnectionPool.from_url')
+    @patch('redis.asyncio.Redis')
     @pytest.mark.asyncio
-    async def test_connect_success(self, mock_from_url, redis_client):
+    async def test_connect_success(self, mock_redis_class, mock_pool_from_url, redis_client):
         """Test successful Redis connection"""
         mock_redis = AsyncMock()
         mock_redis.ping.return_value = True
-        mock_from_url.return_value = mock_redis
+        mock_redis_class.return_value = mock_redis
         
         await redis_client.connect()
         
         assert redis_client.redis == mock_redis
-        mock_from_url.assert_called_once_with(redis_client.url, decode_responses=True)
+        mock_pool_from_url.assert_called_once_with(
+            redis_client.url, max_connections=32, decode_responses=False, parser_class=_AsyncHiredisParser
+        )
+        mock_redis_class.assert_called_once_with(connection_pool=mock_pool_from_url.return_value)
         mock_redis.ping.assert_called_once()
     
-    @patch('redis.asyncio.from_url')
+    @patch.dict('app.utils.redis_client._pools', clear=True)
+    @patch('app.utils.redis_client.HIREDIS_AVAILABLE', False)
+    @patch('redis.asyncio.BlockingConnectionPool.from_url')
+    @patch('redis.asyncio.Redis')
     @pytest.mark.asyncio
-    async def test_connect_failure(self, mock_from_url, redis_client):
+    async def test_connect_without_hiredis(self, mock_redis_class, mock_pool_from_url, redis_client):
+        """Test that the default parser is used when hiredis is missing"""
+        mock_redis_class.return_value = AsyncMock()
+        
+        await redis_client.connect()
+        
+        assert 'parser_class' not in mock_pool_from_url.call_args.kwargs
+    
+    @patch.dict('app.utils.redis_client._pools', clear=True)
+    @patch('redis.asyncio.BlockingConnectionPool.from_url')
+    @patch('redis.asyncio.Redis')
+    @pytest.mark.asyncio
+    async def test_connect_uses_shared_pool(self, mock_redis_class, mock_pool_from_url):
+        """Test that every client shares one process-wide pool"""
+        mock_redis_class.return_value = AsyncMock()
+        
+        first, second = RedisClient(), RedisClient()
+        await first.connect()
+        await second.connect()
+        
+        mock_pool_from_url.assert_called_once()
+        for call in mock_redis_class.call_args_list:
+            assert call.kwargs['connection_pool'] is mock_pool_from_url.return_value
+    
+    @patch.dict('app.utils.redis_client._pools', clear=True)
+    @patch('redis.asyncio.BlockingConnectionPool.from_url')
+    @patch('redis.asyncio.Redis')
+    @pytest.mark.asyncio
+    async def test_connect_failure(self, mock_redis_class, mock_pool_from_url, redis_client):
         """Test Redis connection failure"""
         mock_redis = AsyncMock()
         mock_redis.ping.side_effect = Exception("Connection failed")
-        mock_from_url.return_value = mock_redis
+        mock_redis_class.return_value = mock_redis
         
         with pytest.raises(Exception, match="Connection failed"):
             await redis_client.connect()
@@ -86,7 +125,7 @@ class TestRedisClient:
         result = await redis_client.publish_message("test-channel", message)
         
         assert result is True
-        mock_redis.publish.assert_called_once_with("test-channel", json.dumps(message))
+        mock_redis.publish.assert_called_once_with("test-channel", orjson.dumps(message))
     
     @pytest.mark.asyncio
     async def test_publish_message_failure(self, redis_client):
@@ -100,6 +139,26 @@ class TestRedisClient:
         
         assert result is False
     
+    @pytest.mark.asyncio
+    async def test_publish_messages_pipelined(self, redis_client):
+        """Test several messages are published in one pipeline"""
+        mock_pipe = MagicMock()
+        mock_pipe.execute = AsyncMock(return_value=[1, 1])
+        mock_redis = MagicMock()
+        mock_redis.pipeline.return_value.__aenter__.return_value = mock_pipe
+        redis_client.redis = mock_redis
+        
+        messages = [("channel-a", {"a": 1}), ("channel-b", {"b": 2})]
+        result = await redis_client.publish_messages(messages)
+        
+        assert result is True
+        mock_redis.pipeline.assert_called_once_with(transaction=False)
+        assert mock_pipe.publish.call_args_list == [
+            (("channel-a", orjson.dumps({"a": 1})),),
+            (("channel-b", orjson.dumps({"b": 2})),),
+        ]
+        mock_pipe.execute.assert_awaited_once()
+    
     @pytest.mark.asyncio
     async def test_subscribe_to_channel_success(self, redis_client):
         """Test successful channel subscription"""
@@ -139,7 +198,7 @@ class TestRedisClient:
         result = await redis_client.set_cache("test-key", data, 1800)
         
         assert result is True
-        mock_redis.setex.assert_called_once_with("test-key", 1800, json.dumps(data))
+        mock_redis.setex.assert_called_once_with("test-key", 1800, msgpack.packb(data, use_bin_type=True))
     
     @pytest.mark.asyncio
     async def test_set_cache_default_ttl(self, redis_client):
@@ -152,7 +211,7 @@ class TestRedisClient:
         result = await redis_client.set_cache("test-key", data)
         
         assert result is True
-        mock_redis.setex.assert_called_once_with("test-key", 3600, json.dumps(data))
+        mock_redis.setex.assert_called_once_with("test-key", 3600, msgpack.packb(data, use_bin_type=True))
     
     @pytest.mark.asyncio
     async def test_set_cache_failure(self, redis_client):
@@ -171,7 +230,7 @@ class TestRedisClient:
         """Test successful cache retrieval"""
         mock_redis = AsyncMock()
         cached_data = {"retrieved": "data", "value": 100}
-        mock_redis.get.return_value = json.dumps(cached_data)
+        mock_redis.get.return_value = msgpack.packb(cached_data, use_bin_type=True)
         redis_client.redis = mock_redis
         
         result = await redis_client.get_cache("test-key")
@@ -201,6 +260,66 @@ class TestRedisClient:
         
         assert result is None
     
+    @pytest.mark.asyncio
+    async def test_get_cache_path_fallback(self, redis_client):
+        """Test JSONPath selection on msgpack entries"""
+        mock_redis = AsyncMock()
+        mock_redis.get.return_value = msgpack.packb({"a": {"b": 1}}, use_bin_type=True)
+        redis_client.redis = mock_redis
+        
+        assert await redis_client.get_cache("test-key", path="$.a.b") == 1
+        assert await redis_client.get_cache("test-key", path="$.missing") is None
+    
+    @pytest.fixture
+    def rejson_available(self, redis_client):
+        """Redis client talking to a server with the RedisJSON module"""
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        mock_redis = AsyncMock()
+        mock_redis.pipeline = MagicMock()
+        mock_redis.pipeline.return_value.__aenter__ = AsyncMock(return_value=pipe)
+        mock_redis.pipeline.return_value.__aexit__ = AsyncMock(return_value=False)
+        redis_client.redis = mock_redis
+        redis_client._use_rejson = True
+        return pipe
+    
+    @pytest.mark.asyncio
+    async def test_detect_rejson(self, redis_client):
+        """Test RedisJSON detection from MODULE LIST"""
+        mock_redis = AsyncMock()
+        redis_client.redis = mock_redis
+        
+        mock_redis.module_list.return_value = [{b"name": b"search"}, {b"name": b"ReJSON"}]
+        assert await redis_client._detect_rejson() is True
+        
+        mock_redis.module_list.return_value = []
+        assert await redis_client._detect_rejson() is False
+        
+        mock_redis.module_list.side_effect = Exception("unknown command 'MODULE'")
+        assert await redis_client._detect_rejson() is False
+    
+    @pytest.mark.asyncio
+    async def test_set_cache_uses_json_set(self, redis_client, rejson_available):
+        """Test that cache entries are stored with JSON.SET plus EXPIRE"""
+        data = {"cached": "data", "count": 42}
+        
+        result = await redis_client.set_cache("test-key", data, 1800)
+        
+        assert result is True
+        rejson_available.execute_command.assert_called_once_with("JSON.SET", "test-key", "$", orjson.dumps(data))
+        rejson_available.expire.assert_called_once_with("test-key", 1800)
+        redis_client.redis.setex.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_get_cache_uses_json_get(self, redis_client, rejson_available):
+        """Test that reads go through JSON.GET with the requested path"""
+        redis_client.redis.execute_command.return_value = b'["2024-01-01T10:00:00"]'
+        
+        result = await redis_client.get_cache("test-key", path="$.timestamp")
+        
+        assert result == "2024-01-01T10:00:00"
+        redis_client.redis.execute_command.assert_called_once_with("JSON.GET", "test-key", "$.timestamp")
+    
     @pytest.mark.asyncio
     async def test_add_to_stream_success(self, redis_client):
         """Test successful stream addition"""
@@ -212,7 +331,27 @@ class TestRedisClient:
         result = await redis_client.add_to_stream("test-stream", stream_data)
         
         assert result == "1640995200000-0"
-        mock_redis.xadd.assert_called_once_with("test-stream", stream_data)
+        mock_redis.xadd.assert_called_once_with("test-stream", stream_data, maxlen=100000, approximate=True)
+    
+    @pytest.mark.asyncio
+    async def test_add_to_stream_batch(self, redis_client):
+        """Test that a batch of entries shares one pipeline"""
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(return_value=[b"1640995200000-0", b"1640995200000-1"])
+        mock_redis = AsyncMock()
+        mock_redis.pipeline = MagicMock()
+        mock_redis.pipeline.return_value.__aenter__ = AsyncMock(return_value=pipe)
+        mock_redis.pipeline.return_value.__aexit__ = AsyncMock(return_value=False)
+        redis_client.redis = mock_redis
+        
+        entries = [{"n": "1"}, {"n": "2"}]
+        result = await redis_client.add_to_stream_batch("test-stream", entries, maxlen=500)
+        
+        assert result == ["1640995200000-0", "1640995200000-1"]
+        mock_redis.pipeline.assert_called_once_with(transaction=False)
+        assert pipe.xadd.call_args_list == [
+            (("test-stream", entry), {"maxlen": 500, "approximate": True}) for entry in entries
+        ]
     
     @pytest.mark.asyncio
     async def test_add_to_stream_failure(self, redis_client):
@@ -228,82 +367,68 @@ class TestRedisClient:
 
 
 class TestRedisClientIntegration:
-    """Integration-style tests for Redis client (using mock Redis)"""
+    """Integration-style tests for Redis client (against an in-memory fake Redis)"""
     
     @pytest.fixture
-    async def connected_redis_client(self):
-        """Redis client with mocked connection"""
+    def connected_redis_client(self, fake_redis):
+        """Redis client wired to the fake server"""
         client = RedisClient()
-        
-        # Mock the Redis connection
-        mock_redis = AsyncMock()
-        mock_redis.ping.return_value = True
-        
-        with patch('redis.asyncio.from_url', return_value=mock_redis):
-            await client.connect()
-            
+        client.redis = fake_redis
         return client
     
     @pytest.mark.asyncio
     async def test_publish_subscribe_flow(self, connected_redis_client):
         """Test publish-subscribe message flow"""
-        # Mock pubsub behavior
-        mock_pubsub = AsyncMock()
-        mock_pubsub.subscribe = AsyncMock()
-        # Make redis object support both sync and async methods
-        connected_redis_client.redis.pubsub = MagicMock(return_value=mock_pubsub)
-        connected_redis_client.redis.publish.return_value = 1
-        
         # Subscribe to channel
         pubsub = await connected_redis_client.subscribe_to_channel("test-flow")
-        assert pubsub == mock_pubsub
+        assert pubsub is not None
         
         # Publish message
         message = {"flow": "test", "data": [1, 2, 3]}
         result = await connected_redis_client.publish_message("test-flow", message)
         assert result is True
         
-        # Verify calls
-        mock_pubsub.subscribe.assert_called_once_with("test-flow")
-        connected_redis_client.redis.publish.assert_called_once_with("test-flow", json.dumps(message))
+        # The subscriber receives the encoded payload
+        received = None
+        for _ in range(10):  # The subscribe confirmation is read (and skipped) first
+            received = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1)
+            if received:
+                break
+        assert received["channel"] == b"test-flow"
+        assert orjson.loads(received["data"]) == message
+        await pubsub.aclose()
     
     @pytest.mark.asyncio
-    async def test_cache_lifecycle(self, connected_redis_client):
+    async def test_cache_lifecycle(self, connected_redis_client, fake_redis):
         """Test complete cache lifecycle"""
-        # Mock cache operations
         test_data = {"lifecycle": "test", "items": ["a", "b", "c"]}
-        json_data = json.dumps(test_data)
-        
-        connected_redis_client.redis.setex.return_value = True
-        connected_redis_client.redis.get.return_value = json_data
         
         # Set cache
         set_result = await connected_redis_client.set_cache("lifecycle-key", test_data, 7200)
         assert set_result is True
         
+        # Stored as msgpack with the requested TTL
+        assert await fake_redis.get("lifecycle-key") == msgpack.packb(test_data, use_bin_type=True)
+        assert 0 < await fake_redis.ttl("lifecycle-key") <= 7200
+        
         # Get cache
         get_result = await connected_redis_client.get_cache("lifecycle-key")
         assert get_result == test_data
-        
-        # Verify calls
-        connected_redis_client.redis.setex.assert_called_once_with("lifecycle-key", 7200, json_data)
-        connected_redis_client.redis.get.assert_called_once_with("lifecycle-key")
+        assert await connected_redis_client.get_cache("missing-key") is None
     
     @pytest.mark.asyncio
-    async def test_stream_operations(self, connected_redis_client):
+    async def test_stream_operations(self, connected_redis_client, fake_redis):
         """Test Redis stream operations"""
-        # Mock stream operations
-        stream_id = "1640995200000-0"
-        connected_redis_client.redis.xadd.return_value = stream_id
-        
-        # Add to stream
         stream_data = {
             "message_id": "test-123",
             "classification": "technical",
             "confidence": "0.85"
         }
         
+        # Add to stream
         result = await connected_redis_client.add_to_stream("classification-stream", stream_data)
-        assert result == stream_id
+        assert isinstance(result, str)
         
-        connected_redis_client.redis.xadd.assert_called_once_with("classification-stream", stream_data)
\ No newline at end of file
+        entries = await fake_redis.xrange("classification-stream")
+        assert [entry_id.decode() for entry_id, _ in entries] == [result]
+        assert entries[0][1] == {key.encode(): value.encode() for key, value in stream_data.items()}
@@ -0,0 +1,208 @@
+import asyncio
+import fakeredis
+import httpx
+import orjson
+import pytest
+
+import whatsapp_to_zoho_integration as integration
+from whatsapp_to_zoho_integration import (
+    CONSUMER_GROUP, CONSUMER_NAME, DEAD_LETTER_STREAM, INBOUND_STREAM, MAX_DELIVERIES,
+    TICKET_BATCH_SIZE, classify_message, create_tickets, process_entries, read_entries,
+    retry_pending, sender_phone, ticket_data_for
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_classification_cache():
+    """Keep cached classifications from leaking between tests"""
+    classify_message.cache_clear()
+    yield
+    classify_message.cache_clear()
+
+
+@pytest.mark.parametrize("sender,phone", [
+    ('5215555@s.whatsapp.net', '5215555'),
+    ('5215555@c.us', '5215555'),
+    ('5215555', '5215555'),
+])
+def test_sender_parsing(sender, phone):
+    """Test that the phone number is everything before the @"""
+    assert sender_phone(sender) == phone
+
+
+@pytest.mark.parametrize("text,priority", [
+    ('La IMPRESORA no funciona', 'High'),
+    ('Error en el sistema', 'Medium'),
+])
+def test_classify_message_incident(text, priority):
+    """Test keyword classification and urgency detection"""
+    result = classify_message(text)
+
+    assert result['is_incident'] is True
+    assert result['priority'] == priority
+
+
+@pytest.mark.parametrize("text,is_incident,priority", [
+    ('El Sistema esta caido', True, 'Medium'),
+    ('Las impresoras estan apagadas', False, None),  # whole words only, no plurals
+    ('Es posible pasar hoy?', False, None),  # "pos" inside another word
+    ('La caja no-funciona', True, 'High'),
+    ('Error CRITICO en caja', True, 'High'),
+])
+def test_classify_message(text, is_incident, priority):
+    """Test whole-word, case-insensitive keyword matching"""
+    result = classify_message(text)
+
+    assert result['is_incident'] is is_incident
+    assert result.get('priority') == priority
+
+
+def test_classify_message_not_incident():
+    """Test that messages without keywords are not incidents"""
+    assert classify_message('hola, buenos días') == {'is_incident': False}
+
+
+def test_classify_message_cached():
+    """Test that repeated texts are served from the cache as read-only results"""
+    first = classify_message('ayuda')
+    second = classify_message('ayuda')
+
+    assert second is first
+    assert classify_message.cache_info().hits == 1
+    with pytest.raises(TypeError):
+        first['priority'] = 'Low'
+
+
+def ticket(n):
+    return ticket_data_for({'text': f'error {n}', 'from': f'52155{n:04d}@c.us', 'id': str(n)})
+
+
+def ticket_service(batch_status=200, fail=()):
+    """Ticket service stand-in that records requests and fails the given batch indexes"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.url.path == '/tickets/customer/batch':
+            if batch_status != 200:
+                return httpx.Response(batch_status)
+            tickets = orjson.loads(request.content)
+            return httpx.Response(200, json=[
+                {'success': i not in fail, 'customer_email': t['customer_email'], 'ticket_id': str(i)}
+                for i, t in enumerate(tickets)
+            ])
+        return httpx.Response(200, json={'success': True, 'ticket_id': 'single'})
+
+    client = httpx.AsyncClient(base_url='http://tickets', transport=httpx.MockTransport(handler))
+    return client, requests
+
+
+def test_ticket_data_for_non_incident():
+    """Test that messages without keywords produce no ticket"""
+    assert ticket_data_for('{"text": "hola"}') is None
+
+
+@pytest.mark.asyncio
+async def test_create_tickets_batched():
+    """Test that tickets go out in TICKET_BATCH_SIZE chunks with per-index results"""
+    client, requests = ticket_service(fail={1})
+    tickets = [ticket(n) for n in range(TICKET_BATCH_SIZE + 2)]
+
+    async with client:
+        results = await create_tickets(tickets, client)
+
+    assert [len(orjson.loads(r.content)) for r in requests] == [TICKET_BATCH_SIZE, 2]
+    assert len(results) == len(tickets)
+    assert results[1] is None
+    assert results[TICKET_BATCH_SIZE + 1] is None
+    assert results[0]['ticket_id'] == '0'
+
+
+@pytest.mark.asyncio
+async def test_create_tickets_falls_back_on_501():
+    """Test that a server without the batch endpoint gets one POST per ticket"""
+    client, requests = ticket_service(batch_status=501)
+
+    async with client:
+        results = await create_tickets([ticket(1), ticket(2)], client)
+
+    assert [r.url.path for r in requests] == ['/tickets/customer/batch'] + ['/tickets/customer'] * 2
+    assert [result['ticket_id'] for result in results] == ['single', 'single']
+
+
+@pytest.mark.asyncio
+async def test_create_tickets_batch_error():
+    """Test that a failed batch request marks every ticket in it as failed"""
+    client, _ = ticket_service(batch_status=500)
+
+    async with client:
+        results = await create_tickets([ticket(1), ticket(2)], client)
+
+    assert results == [None, None]
+
+
+@pytest.fixture
+async def stream():
+    """Fake Redis holding the inbound stream with one incident delivered to this consumer"""
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await integration._ensure_group(r)
+    entry_id = await r.xadd(INBOUND_STREAM, {'data': orjson.dumps({'text': 'error en caja', 'from': '5215555@c.us'}).decode()})
+    await r.xreadgroup(CONSUMER_GROUP, CONSUMER_NAME, {INBOUND_STREAM: '>'}, count=10)
+    yield r, entry_id
+    await r.aclose()
+
+
+async def pending_ids(r):
+    return [p['message_id'] for p in await r.xpending_range(INBOUND_STREAM, CONSUMER_GROUP, min='-', max='+', count=10)]
+
+
+@pytest.mark.asyncio
+async def test_backlog_read_moves_past_failing_entry(stream):
+    """Test that a pending entry whose ticket keeps failing does not stall the backlog read"""
+    r, entry_id = stream
+    client, _ = ticket_service(batch_status=500)
+
+    async with client:
+        entries, last_id = await read_entries(r, '0')
+        assert [entry[0] for entry in entries] == [entry_id]
+        assert await process_entries(r, entries, client, asyncio.Semaphore(1)) == []
+
+    assert last_id == entry_id
+    assert await read_entries(r, last_id) == ([], '>')
+    assert await pending_ids(r) == [entry_id]
+
+
+@pytest.mark.asyncio
+async def test_retry_pending_acknowledges_success(stream, monkeypatch):
+    """Test that a reclaimed entry is acknowledged once its ticket is created"""
+    r, entry_id = stream
+    monkeypatch.setattr(integration, 'RETRY_IDLE_MS', 0)
+    client, requests = ticket_service()
+
+    async with client:
+        await retry_pending(r, client, asyncio.Semaphore(1))
+
+    assert len(requests) == 1
+    assert await pending_ids(r) == []
+
+
+@pytest.mark.asyncio
+async def test_retry_pending_dead_letters_repeated_failures(stream, monkeypatch):
+    """Test that an entry failing MAX_DELIVERIES times moves to the dead-letter stream"""
+    r, entry_id = stream
+    monkeypatch.setattr(integration, 'RETRY_IDLE_MS', 0)
+    client, requests = ticket_service(batch_status=500)
+
+    async with client:
+        # The first delivery was the read; every sweep is one more
+        for _ in range(MAX_DELIVERIES - 1):
+            await retry_pending(r, client, asyncio.Semaphore(1))
+        assert await pending_ids(r) == [entry_id]
+
+        await retry_pending(r, client, asyncio.Semaphore(1))
+
+    assert len(requests) == MAX_DELIVERIES - 1
+    assert await pending_ids(r) == []
+    (_, fields), = await r.xrange(DEAD_LETTER_STREAM)
+    assert fields['entry_id'] == entry_id
+    assert fields['deliveries'] == str(MAX_DELIVERIES + 1)
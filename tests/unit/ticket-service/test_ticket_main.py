@@ -0,0 +1,97 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+from services.ticket_service.app import main
+
+
+def customer_ticket(email, name="Cliente"):
+    return {
+        'customer_email': email,
+        'customer_name': name,
+        'subject': 'Incidente technical - WhatsApp',
+        'description': 'La impresora no funciona'
+    }
+
+
+class TestCustomerTicketBatch:
+    """Test suite for POST /tickets/customer/batch"""
+
+    @pytest.fixture
+    def zoho(self):
+        """Zoho client whose contact lookup fails for addresses starting with 'bad'"""
+        async def get_or_create_contact(email, name):
+            if email.startswith('bad'):
+                raise RuntimeError("Zoho contact error")
+            return f"contact-{email}"
+
+        with patch.object(main.zoho_client, 'get_or_create_contact',
+                          AsyncMock(side_effect=get_or_create_contact)) as contacts, \
+             patch.object(main.zoho_client, 'create_ticket', AsyncMock(return_value='ZT-1')):
+            yield contacts
+
+    @pytest.fixture
+    def client(self, zoho):
+        """Test client without the lifespan, so no Redis or Zoho connection is made"""
+        with patch.object(main, 'redis_client', AsyncMock()):
+            yield TestClient(main.app)
+
+    def test_batch_results_follow_input_order(self, client):
+        """Test one result per ticket, in order"""
+        response = client.post('/tickets/customer/batch', json=[
+            customer_ticket('a@whatsapp.support.com'),
+            customer_ticket('b@whatsapp.support.com'),
+        ])
+
+        assert response.status_code == 200
+        results = response.json()
+        assert [result['customer_email'] for result in results] == [
+            'a@whatsapp.support.com', 'b@whatsapp.support.com'
+        ]
+        assert all(result['success'] and result['ticket_id'] == 'ZT-1' for result in results)
+
+    def test_batch_failure_reported_per_index(self, client):
+        """Test a failing ticket gets a validated failure result without failing the others"""
+        response = client.post('/tickets/customer/batch', json=[
+            customer_ticket('a@whatsapp.support.com'),
+            customer_ticket('bad@whatsapp.support.com'),
+        ])
+
+        assert response.status_code == 200
+        ok, failed = response.json()
+        assert ok['success'] is True
+        assert failed == {
+            'success': False,
+            'customer_email': 'bad@whatsapp.support.com',
+            'ticket_id': None,
+            'contact_id': None,
+            'message': None,
+            'error': 'Zoho contact error'
+        }
+
+    def test_batch_resolves_each_contact_once(self, client, zoho):
+        """Test messages from the same sender share one contact lookup"""
+        response = client.post('/tickets/customer/batch', json=[
+            customer_ticket('a@whatsapp.support.com'),
+            customer_ticket('a@whatsapp.support.com'),
+            customer_ticket('b@whatsapp.support.com'),
+        ])
+
+        assert response.status_code == 200
+        assert sorted(call.args[0] for call in zoho.await_args_list) == [
+            'a@whatsapp.support.com', 'b@whatsapp.support.com'
+        ]
+        assert [result['contact_id'] for result in response.json()] == [
+            'contact-a@whatsapp.support.com',
+            'contact-a@whatsapp.support.com',
+            'contact-b@whatsapp.support.com',
+        ]
+
+    def test_batch_size_capped(self, client, zoho):
+        """Test batches over the cap are rejected before any Zoho call"""
+        tickets = [customer_ticket(f'{i}@whatsapp.support.com') for i in range(main.MAX_CUSTOMER_TICKET_BATCH + 1)]
+
+        response = client.post('/tickets/customer/batch', json=tickets)
+
+        assert response.status_code == 413
+        zoho.assert_not_awaited()
@@ -1,31 +1,175 @@
+import itertools
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
-import json
-from datetime import datetime
+import msgpack
+from redis.exceptions import ResponseError
 
+from services.ticket_service.app.services import ticket_queue as ticket_queue_module
 from services.ticket_service.app.services.ticket_queue import TicketQueue
 from services.ticket_service.app.models.schemas import TicketRequest
 
 
+def _encode(value):
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis.asyncio connection used by TicketQueue"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.lists = {}
+        self.ttls = {}
+        self.calls = []
+        self.errors = {}
+        self.pipelines = []
+
+    def _run(self, name, *args, **kwargs):
+        self.calls.append((name, args, kwargs))
+        if name in self.errors:
+            raise self.errors[name]
+        return getattr(self, f"_{name}")(*args, **kwargs)
+
+    def _hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(
+            {field.encode(): _encode(value) for field, value in mapping.items()}
+        )
+        return len(mapping)
+
+    def _hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def _hincrby(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        value = int(fields.get(field.encode(), b'0')) + amount
+        fields[field.encode()] = _encode(value)
+        return value
+
+    def _expire(self, key, ttl):
+        self.ttls[key] = ttl
+        return key in self.hashes
+
+    def _lpush(self, key, *values):
+        items = self.lists.setdefault(key, [])
+        for value in values:
+            items.insert(0, _encode(value))
+        return len(items)
+
+    def _rpop(self, key):
+        items = self.lists.get(key)
+        return items.pop() if items else None
+
+    def _lmpop(self, numkeys, key, direction, count):
+        items = self.lists.get(key)
+        if not items:
+            return None
+        return [key.encode(), [items.pop() for _ in range(min(count, len(items)))]]
+
+    def _llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def _enqueue(self, keys, args):
+        """Python rendering of ticket_queue._ENQUEUE_SCRIPT"""
+        key, queue_key = keys
+        ttl, queue_id, *pairs = args
+        if b'id' in self.hashes.get(key, {}):
+            return 0
+        self._hset(key, dict(zip(['id', *pairs[::2]], [queue_id, *pairs[1::2]])))
+        self._expire(key, ttl)
+        self._lpush(queue_key, queue_id)
+        return 1
+
+    async def hgetall(self, key):
+        return self._run('hgetall', key)
+
+    async def lpush(self, key, *values):
+        return self._run('lpush', key, *values)
+
+    async def lmpop(self, numkeys, key, direction, count):
+        return self._run('lmpop', numkeys, key, direction=direction, count=count)
+
+    async def llen(self, key):
+        return self._run('llen', key)
+
+    def register_script(self, script):
+        async def run(keys, args):
+            return self._run('enqueue', keys, args)
+        return run
+
+    def pipeline(self, transaction=True):
+        self.calls.append(('pipeline', (), {'transaction': transaction}))
+        pipe = FakePipeline(self)
+        self.pipelines.append(pipe)
+        return pipe
+
+    def called(self, name):
+        """Recorded calls of one command, outside pipelines included"""
+        return [(args, kwargs) for command, args, kwargs in self.calls if command == name]
+
+
+class FakePipeline:
+    """Queues commands and runs them against the FakeRedis on execute"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+        self.executed = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return command
+
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        self.executed.extend(commands)
+        return [self.redis._run(name, *args, **kwargs) for name, args, kwargs in commands]
+
+
+class FakeRedisClient:
+    """Stand-in for the ticket-service RedisClient wrapper"""
+
+    def __init__(self):
+        self.redis = FakeRedis()
+        self.published = []
+        self.flushes = 0
+
+    def publish_message_nowait(self, channel, message):
+        self.published.append((channel, message))
+
+    async def flush_publishes(self):
+        self.flushes += 1
+
+
+def envelope(queue_item):
+    """Encode a queue item the way HGETALL returns it"""
+    fields = dict(queue_item, ticket_data=msgpack.packb(queue_item['ticket_data'], use_bin_type=True))
+    return {name.encode(): _encode(value) for name, value in fields.items()}
+
+
 class TestTicketQueue:
     """Test suite for TicketQueue"""
 
     @pytest.fixture
     def mock_redis_client(self):
-        """Mock Redis client for testing"""
-        mock_client = MagicMock()
-        mock_client.redis = MagicMock()
-        mock_client.redis.lpush = AsyncMock()
-        mock_client.redis.rpop = AsyncMock()
-        mock_client.redis.llen = AsyncMock()
-        mock_client.set_cache = AsyncMock()
-        mock_client.get_cache = AsyncMock()
-        mock_client.publish_message = AsyncMock()
-        return mock_client
+        """In-memory Redis client for testing"""
+        return FakeRedisClient()
+
+    @pytest.fixture
+    def redis(self, mock_redis_client):
+        """The fake Redis connection behind the client"""
+        return mock_redis_client.redis
 
     @pytest.fixture
     def ticket_queue(self, mock_redis_client):
-        """Create TicketQueue with mock Redis client"""
+        """Create TicketQueue with the fake Redis client"""
         return TicketQueue(mock_redis_client)
 
     @pytest.fixture
@@ -40,23 +184,45 @@ class TestTicketQueue:
             department_id="987654321"
         )
 
+    @pytest.fixture
+    def queue_item(self, sample_ticket_request):
+        """Queue item as stored by add_ticket"""
+        return {
+            'id': 'queue_12345678',
+            'ticket_data': sample_ticket_request.model_dump(),
+            'attempts': 0,
+            'max_attempts': 10,
+            'created_at': '2024-01-01T10:00:00',
+            'status': 'queued',
+            'last_updated': '2024-01-01T10:00:00'
+        }
+
+    @staticmethod
+    def enqueue(redis, *items):
+        """Store the items' hashes and push their ids, oldest first"""
+        for item in items:
+            redis.hashes[f"ticket:{item['id']}"] = envelope(item)
+            redis._lpush('pending_tickets', item['id'])
+
+    @staticmethod
+    def failing_zoho():
+        zoho = MagicMock()
+        zoho.create_ticket = AsyncMock(side_effect=Exception("Zoho API error"))
+        return zoho
+
     @pytest.mark.asyncio
-    async def test_add_ticket_success(self, ticket_queue, mock_redis_client, sample_ticket_request):
+    async def test_add_ticket_success(self, ticket_queue, redis, sample_ticket_request):
         """Test successful ticket addition to queue"""
         queue_id = await ticket_queue.add_ticket(sample_ticket_request)
-        
+
         assert queue_id.startswith("queue_")
         assert len(queue_id) == 14  # "queue_" + 8 hex chars
-        
-        # Verify Redis operations
-        mock_redis_client.redis.lpush.assert_called_once()
-        mock_redis_client.set_cache.assert_called_once()
-        
-        # Verify queue item structure
-        lpush_call = mock_redis_client.redis.lpush.call_args
-        queue_item_json = lpush_call[0][1]
-        queue_item = json.loads(queue_item_json)
-        
+
+        # The envelope hash expires and only the id is pushed on the list
+        assert redis.ttls[f"ticket:{queue_id}"] == 7 * 24 * 3600
+        assert redis.lists['pending_tickets'] == [queue_id.encode()]
+
+        queue_item = ticket_queue._decode_envelope(redis.hashes[f"ticket:{queue_id}"])
         assert queue_item['id'] == queue_id
         assert queue_item['attempts'] == 0
         assert queue_item['max_attempts'] == 10
@@ -64,222 +230,402 @@ class TestTicketQueue:
         assert queue_item['ticket_data']['subject'] == sample_ticket_request.subject
 
     @pytest.mark.asyncio
-    async def test_add_ticket_redis_failure(self, ticket_queue, mock_redis_client, sample_ticket_request):
+    async def test_add_ticket_single_round_trip(self, ticket_queue, redis, sample_ticket_request):
+        """Test that enqueueing a ticket costs exactly one pipelined round trip"""
+        await ticket_queue.add_ticket(sample_ticket_request)
+
+        # The enqueue script is the only command sent
+        assert [name for name, _, _ in redis.calls] == ['enqueue']
+
+    @pytest.mark.asyncio
+    async def test_add_ticket_monotonic_ids(self, ticket_queue, sample_ticket_request):
+        """Test that ids from one process share a prefix and increase until the counter wraps"""
+        with patch.object(ticket_queue_module, '_ID_COUNTER', itertools.count(1)):
+            first = await ticket_queue.add_ticket(sample_ticket_request)
+            second = await ticket_queue.add_ticket(sample_ticket_request)
+
+        assert first[:10] == second[:10]
+        assert second > first
+
+    @pytest.mark.asyncio
+    async def test_add_ticket_id_collision(self, ticket_queue, redis, queue_item, sample_ticket_request):
+        """Test that a wrapped id never overwrites a stored envelope"""
+        with patch.object(ticket_queue_module, '_ID_PREFIX', 0x1234), \
+             patch.object(ticket_queue_module, '_ID_COUNTER', itertools.count(0x10000)):
+            existing = dict(queue_item, id='queue_12340000')
+            redis.hashes['ticket:queue_12340000'] = envelope(existing)
+
+            queue_id = await ticket_queue.add_ticket(sample_ticket_request)
+
+            assert queue_id != 'queue_12340000'
+            assert ticket_queue_module._ID_PREFIX != 0x1234
+
+        assert redis.hashes['ticket:queue_12340000'] == envelope(existing)
+        assert redis.lists['pending_tickets'] == [queue_id.encode()]
+
+    @pytest.mark.asyncio
+    async def test_add_ticket_redis_failure(self, ticket_queue, redis, sample_ticket_request):
         """Test ticket addition with Redis failure"""
-        mock_redis_client.redis.lpush.side_effect = Exception("Redis error")
-        
+        redis.errors['enqueue'] = Exception("Redis error")
+
         with pytest.raises(Exception, match="Redis error"):
             await ticket_queue.add_ticket(sample_ticket_request)
 
     @pytest.mark.asyncio
-    async def test_get_ticket_status_found(self, ticket_queue, mock_redis_client):
+    async def test_get_ticket_status_found(self, ticket_queue, redis, queue_item):
         """Test getting status of existing queued ticket"""
-        mock_status = {
+        redis.hashes['ticket:queue_12345678'] = envelope(queue_item)
+
+        result = await ticket_queue.get_ticket_status('queue_12345678')
+
+        assert result == {
             'status': 'queued',
+            'attempts': 0,
             'created_at': '2024-01-01T10:00:00',
             'last_updated': '2024-01-01T10:00:00'
         }
-        mock_redis_client.get_cache.return_value = mock_status
-        
-        result = await ticket_queue.get_ticket_status('queue_12345678')
-        
-        assert result == mock_status
-        mock_redis_client.get_cache.assert_called_once_with('ticket_status:queue_12345678')
+        assert redis.called('hgetall') == [(('ticket:queue_12345678',), {})]
 
     @pytest.mark.asyncio
-    async def test_get_ticket_status_not_found(self, ticket_queue, mock_redis_client):
+    async def test_get_ticket_status_not_found(self, ticket_queue):
         """Test getting status of non-existent ticket"""
-        mock_redis_client.get_cache.return_value = None
-        
         result = await ticket_queue.get_ticket_status('queue_nonexistent')
-        
+
         assert result['status'] == 'not_found'
         assert 'last_updated' in result
 
     @pytest.mark.asyncio
-    async def test_get_ticket_status_redis_error(self, ticket_queue, mock_redis_client):
+    async def test_get_ticket_status_redis_error(self, ticket_queue, redis):
         """Test getting status with Redis error"""
-        mock_redis_client.get_cache.side_effect = Exception("Redis error")
-        
+        redis.errors['hgetall'] = Exception("Redis error")
+
         result = await ticket_queue.get_ticket_status('queue_12345678')
-        
+
         assert result['status'] == 'error'
         assert 'last_updated' in result
 
     @pytest.mark.asyncio
-    async def test_process_queue_empty(self, ticket_queue, mock_redis_client):
+    async def test_process_queue_empty(self, ticket_queue, redis):
         """Test processing empty queue"""
-        mock_redis_client.redis.rpop.return_value = None
-        
         result = await ticket_queue.process_queue()
-        
+
         assert result == 0
-        mock_redis_client.redis.rpop.assert_called_once()
+        assert redis.called('lmpop') == [
+            ((1, 'pending_tickets'), {'direction': 'RIGHT', 'count': 32})
+        ]
 
     @pytest.mark.asyncio
-    async def test_process_queue_success(self, ticket_queue, mock_redis_client, sample_ticket_request):
-        """Test successful queue processing"""
-        # Mock queue item
-        queue_item = {
-            'id': 'queue_12345678',
-            'ticket_data': sample_ticket_request.dict(),
-            'attempts': 0,
-            'max_attempts': 10,
-            'created_at': '2024-01-01T10:00:00',
-            'status': 'queued'
-        }
-        
-        mock_redis_client.redis.rpop.side_effect = [
-            json.dumps(queue_item),
-            None  # Empty queue after first item
-        ]
-        
+    async def test_process_queue_uses_hash_envelope(self, ticket_queue, mock_redis_client, redis, queue_item, sample_ticket_request):
+        """Test successful queue processing from the per-ticket hash"""
+        self.enqueue(redis, queue_item)
+
         # Mock Zoho client
+        mock_zoho = MagicMock()
+        mock_zoho.create_ticket = AsyncMock(return_value='TICKET-123')
+        ticket_queue._zoho = mock_zoho
+
+        result = await ticket_queue.process_queue()
+
+        assert result == 1
+        mock_zoho.create_ticket.assert_called_once_with(sample_ticket_request)
+
+        stored = ticket_queue._decode_envelope(redis.hashes['ticket:queue_12345678'])
+        assert stored['status'] == 'completed'
+        assert stored['ticket_id'] == 'TICKET-123'
+        assert redis.ttls['ticket:queue_12345678'] == 3600
+
+        assert mock_redis_client.flushes == 1
+        assert mock_redis_client.published == [(
+            'tickets:created',
+            {
+                'ticket_id': 'TICKET-123',
+                'queue_id': 'queue_12345678',
+                'subject': sample_ticket_request.subject,
+                'priority': sample_ticket_request.priority,
+                'contact_id': sample_ticket_request.contact_id,
+                'timestamp': mock_redis_client.published[0][1]['timestamp']
+            }
+        )]
+
+    @pytest.mark.asyncio
+    async def test_process_queue_batch(self, ticket_queue, mock_redis_client, redis, queue_item):
+        """Test that a popped batch is processed together with one status write"""
+        self.enqueue(redis, *(dict(queue_item, id=f'queue_0000000{i}') for i in range(3)))
+
+        mock_zoho = MagicMock()
+        mock_zoho.create_ticket = AsyncMock(side_effect=['TICKET-1', 'TICKET-2', 'TICKET-3'])
+        ticket_queue._zoho = mock_zoho
+
+        result = await ticket_queue.process_queue()
+
+        assert result == 3
+        # A short batch ends the run without another LMPOP
+        assert len(redis.called('lmpop')) == 1
+        # One pipeline to read the envelopes, one to write their statuses
+        assert len(redis.pipelines) == 2
+        assert len(mock_redis_client.published) == 3
+
+    @staticmethod
+    def tracking_zoho(calls):
+        """Zoho client whose create_ticket records the peak number of overlapping calls"""
+        import asyncio
+
+        async def create_ticket(ticket_request):
+            calls['active'] += 1
+            calls['peak'] = max(calls['peak'], calls['active'])
+            await asyncio.sleep(0.01)
+            calls['active'] -= 1
+            return 'TICKET-1'
+
+        zoho = MagicMock()
+        zoho.create_ticket = AsyncMock(side_effect=create_ticket)
+        return zoho
+
+    @pytest.mark.asyncio
+    async def test_process_queue_concurrent(self, ticket_queue, redis, queue_item):
+        """Test that the Zoho calls of a popped batch overlap"""
+        calls = {'active': 0, 'peak': 0}
+        self.enqueue(redis, *(dict(queue_item, id=f'queue_0000000{i}') for i in range(4)))
+        ticket_queue._zoho = self.tracking_zoho(calls)
+
+        result = await ticket_queue.process_queue()
+
+        assert result == 4
+        assert ticket_queue._zoho.create_ticket.await_count == 4
+        assert calls['peak'] == 4
+
+    @pytest.mark.asyncio
+    async def test_process_queue_respects_concurrency_limit(self, ticket_queue, redis, queue_item):
+        """Test that no more than the configured number of Zoho calls run at once"""
+        calls = {'active': 0, 'peak': 0}
+        self.enqueue(redis, *(dict(queue_item, id=f'queue_{i:08x}') for i in range(16)))
+        ticket_queue._zoho = self.tracking_zoho(calls)
+
+        result = await ticket_queue.process_queue()
+
+        assert ticket_queue.concurrency == 8
+        assert result == 16
+        assert calls['peak'] == 8
+
+    @pytest.mark.asyncio
+    async def test_get_zoho_initializes_once(self, ticket_queue):
+        """Test concurrent callers share one lazily initialized Zoho client"""
+        import asyncio
+
         with patch('services.ticket_service.app.services.ticket_queue.ZohoClient') as mock_zoho_class:
             mock_zoho = MagicMock()
-            mock_zoho.initialize = AsyncMock()
-            mock_zoho.create_ticket = AsyncMock(return_value='TICKET-123')
+            connected = {'value': False}
+            mock_zoho.is_connected = MagicMock(side_effect=lambda: connected['value'])
+
+            async def initialize():
+                await asyncio.sleep(0)
+                connected['value'] = True
+
+            mock_zoho.initialize = AsyncMock(side_effect=initialize)
             mock_zoho_class.return_value = mock_zoho
-            
-            result = await ticket_queue.process_queue()
-            
-            assert result == 1
-            mock_zoho.create_ticket.assert_called_once()
-            mock_redis_client.set_cache.assert_called()
-            mock_redis_client.publish_message.assert_called_once_with(
-                'tickets:created',
-                {
-                    'ticket_id': 'TICKET-123',
-                    'queue_id': 'queue_12345678',
-                    'subject': sample_ticket_request.subject,
-                    'priority': sample_ticket_request.priority,
-                    'contact_id': sample_ticket_request.contact_id,
-                    'timestamp': mock_redis_client.publish_message.call_args[0][1]['timestamp']
-                }
-            )
+
+            clients = await asyncio.gather(*(ticket_queue._get_zoho() for _ in range(5)))
+
+            assert all(client is mock_zoho for client in clients)
+            mock_zoho_class.assert_called_once()
+            mock_zoho.initialize.assert_called_once()
 
     @pytest.mark.asyncio
-    async def test_process_queue_retry_on_failure(self, ticket_queue, mock_redis_client, sample_ticket_request):
+    async def test_pop_batch_falls_back_to_pipeline(self, ticket_queue, redis):
+        """Test RPOP pipeline fallback when LMPOP is not supported"""
+        redis.errors['lmpop'] = ResponseError("unknown command 'LMPOP'")
+        redis._lpush('pending_tickets', b'first', b'second')
+
+        items = await ticket_queue._pop_batch(4)
+
+        assert items == [b'first', b'second']
+        assert len(redis.called('rpop')) == 4
+
+    @pytest.mark.asyncio
+    async def test_process_queue_retry_on_failure(self, ticket_queue, redis, queue_item):
         """Test queue processing with retry on failure"""
-        queue_item = {
-            'id': 'queue_12345678',
-            'ticket_data': sample_ticket_request.dict(),
-            'attempts': 0,
-            'max_attempts': 10,
-            'created_at': '2024-01-01T10:00:00',
-            'status': 'queued'
-        }
-        
-        mock_redis_client.redis.rpop.side_effect = [
-            json.dumps(queue_item),
-            None
+        self.enqueue(redis, queue_item)
+        original_payload = redis.hashes['ticket:queue_12345678'][b'ticket_data']
+        ticket_queue._zoho = self.failing_zoho()
+
+        result = await ticket_queue.process_queue()
+
+        assert result == 0  # No successful processing
+
+        # Attempts are bumped in place instead of re-serializing the item
+        stored = redis.hashes['ticket:queue_12345678']
+        assert stored[b'status'] == b'retrying'
+        assert stored[b'error'] == b'Zoho API error'
+        assert stored[b'attempts'] == b'1'
+
+        # The serialized ticket is left untouched by the retry
+        assert stored[b'ticket_data'] is original_payload
+
+        # Only the id goes back on the list
+        assert redis.called('lpush') == [(('pending_tickets', 'queue_12345678'), {})]
+        assert redis.lists['pending_tickets'] == [b'queue_12345678']
+
+    @pytest.mark.asyncio
+    async def test_process_queue_retries_batched(self, ticket_queue, redis, queue_item):
+        """Test that retries from every batch are re-queued with a single LPUSH"""
+        self.enqueue(redis, *(dict(queue_item, id=f'queue_0000000{i}') for i in range(2)))
+        ticket_queue._zoho = self.failing_zoho()
+
+        result = await ticket_queue.process_queue(batch_size=1)
+
+        assert result == 0
+        assert redis.called('lpush') == [
+            (('pending_tickets', 'queue_00000000', 'queue_00000001'), {})
         ]
-        
-        # Mock Zoho client failure
-        with patch('services.ticket_service.app.services.ticket_queue.ZohoClient') as mock_zoho_class:
-            mock_zoho = MagicMock()
-            mock_zoho.initialize = AsyncMock()
-            mock_zoho.create_ticket = AsyncMock(side_effect=Exception("Zoho API error"))
-            mock_zoho_class.return_value = mock_zoho
-            
-            result = await ticket_queue.process_queue()
-            
-            assert result == 0  # No successful processing
-            
-            # Verify item was re-queued with incremented attempts
-            lpush_calls = mock_redis_client.redis.lpush.call_args_list
-            assert len(lpush_calls) == 1
-            
-            requeued_item = json.loads(lpush_calls[0][0][1])
-            assert requeued_item['attempts'] == 1
-            assert requeued_item['error'] == 'Zoho API error'
 
     @pytest.mark.asyncio
-    async def test_process_queue_max_attempts_reached(self, ticket_queue, mock_redis_client, sample_ticket_request):
+    async def test_process_queue_max_attempts_reached(self, ticket_queue, redis, queue_item):
         """Test queue processing when max attempts reached"""
-        queue_item = {
-            'id': 'queue_12345678',
-            'ticket_data': sample_ticket_request.dict(),
-            'attempts': 9,  # One less than max
-            'max_attempts': 10,
-            'created_at': '2024-01-01T10:00:00',
-            'status': 'retrying'
-        }
-        
-        mock_redis_client.redis.rpop.side_effect = [
-            json.dumps(queue_item),
-            None
-        ]
-        
-        # Mock Zoho client failure
-        with patch('services.ticket_service.app.services.ticket_queue.ZohoClient') as mock_zoho_class:
-            mock_zoho = MagicMock()
-            mock_zoho.initialize = AsyncMock()
-            mock_zoho.create_ticket = AsyncMock(side_effect=Exception("Zoho API error"))
-            mock_zoho_class.return_value = mock_zoho
-            
-            result = await ticket_queue.process_queue()
-            
-            assert result == 0
-            
-            # Verify item was not re-queued (max attempts reached)
-            mock_redis_client.redis.lpush.assert_not_called()
-            
-            # Verify status was set to failed
-            set_cache_calls = mock_redis_client.set_cache.call_args_list
-            failed_status = set_cache_calls[0][0][1]
-            assert failed_status['status'] == 'failed'
-            assert failed_status['attempts'] == 10
+        self.enqueue(redis, dict(queue_item, attempts=9, status='retrying'))
+        ticket_queue._zoho = self.failing_zoho()
+
+        result = await ticket_queue.process_queue()
+
+        assert result == 0
+
+        # Verify item was not re-queued (max attempts reached)
+        assert redis.called('lpush') == []
+
+        # Verify status was set to failed and the envelope now expires
+        stored = ticket_queue._decode_envelope(redis.hashes['ticket:queue_12345678'])
+        assert stored['status'] == 'failed'
+        assert stored['attempts'] == 10
+        assert redis.ttls['ticket:queue_12345678'] == 3600
 
     @pytest.mark.asyncio
-    async def test_get_queue_length_success(self, ticket_queue, mock_redis_client):
+    @pytest.mark.parametrize("command", ['hgetall', 'hset'])
+    async def test_process_queue_requeues_on_redis_failure(self, ticket_queue, redis, queue_item, command):
+        """Test that popped ids go back on the queue when their outcome cannot be stored"""
+        ids = [f'queue_0000000{i}' for i in range(3)]
+        self.enqueue(redis, *(dict(queue_item, id=queue_id) for queue_id in ids))
+        ticket_queue._zoho = MagicMock(create_ticket=AsyncMock(return_value='ZT-1'))
+        redis.errors[command] = ConnectionError("Redis went away")
+
+        with pytest.raises(ConnectionError):
+            await ticket_queue.process_queue()
+
+        assert sorted(redis.lists['pending_tickets']) == [queue_id.encode() for queue_id in ids]
+
+    @pytest.mark.asyncio
+    async def test_process_queue_missing_envelope(self, ticket_queue, redis):
+        """Test queue processing when an id has no stored envelope"""
+        redis._lpush('pending_tickets', 'queue_expired0')
+
+        # Should not raise exception, just continue processing
+        result = await ticket_queue.process_queue()
+
+        assert result == 0
+
+    @pytest.mark.asyncio
+    async def test_get_queue_length_success(self, ticket_queue, redis):
         """Test successful queue length retrieval"""
-        mock_redis_client.redis.llen.return_value = 5
-        
+        redis._lpush('pending_tickets', *(f'queue_{i:08x}' for i in range(5)))
+
         length = await ticket_queue.get_queue_length()
-        
+
         assert length == 5
-        mock_redis_client.redis.llen.assert_called_once_with('pending_tickets')
+        assert redis.called('llen') == [(('pending_tickets',), {})]
 
     @pytest.mark.asyncio
-    async def test_get_queue_length_error(self, ticket_queue, mock_redis_client):
+    async def test_get_queue_length_error(self, ticket_queue, redis):
         """Test queue length retrieval with error"""
-        mock_redis_client.redis.llen.side_effect = Exception("Redis error")
-        
+        redis.errors['llen'] = Exception("Redis error")
+
         length = await ticket_queue.get_queue_length()
-        
+
         assert length == 0
 
     @pytest.mark.asyncio
-    async def test_get_queue_stats_success(self, ticket_queue, mock_redis_client):
+    async def test_get_queue_stats_success(self, ticket_queue, redis):
         """Test successful queue stats retrieval"""
-        mock_redis_client.redis.llen.return_value = 3
-        
+        redis._lpush('pending_tickets', *(f'queue_{i:08x}' for i in range(3)))
+
         stats = await ticket_queue.get_queue_stats()
-        
+
         assert stats['queue_length'] == 3
         assert 'last_check' in stats
 
     @pytest.mark.asyncio
-    async def test_get_queue_stats_error(self, ticket_queue, mock_redis_client):
+    async def test_get_queue_stats_error(self, ticket_queue, redis):
         """Test queue stats retrieval with error"""
-        mock_redis_client.redis.llen.side_effect = Exception("Redis error")
-        
+        redis.errors['llen'] = Exception("Redis error")
+
         stats = await ticket_queue.get_queue_stats()
-        
+
         assert stats['queue_length'] == -1
         assert 'error' in stats
         assert 'last_check' in stats
 
+
+class TestEnqueueScript:
+    """Run the real Lua enqueue script on fakeredis (needs fakeredis[lua])"""
+
+    @pytest.fixture
+    async def redis_client(self):
+        pytest.importorskip("lupa")
+        fakeredis = pytest.importorskip("fakeredis")
+        client = MagicMock()
+        client.redis = fakeredis.FakeAsyncRedis()
+        yield client
+        await client.redis.aclose()
+
+    @pytest.fixture
+    def sample_ticket_request(self):
+        return TicketRequest(
+            subject="Sistema POS no funciona",
+            description="El sistema está caído en la tienda principal",
+            priority="urgent",
+            classification="technical",
+            contact_id="123456789",
+            department_id="987654321"
+        )
+
     @pytest.mark.asyncio
-    async def test_process_queue_json_parse_error(self, ticket_queue, mock_redis_client):
-        """Test queue processing with invalid JSON"""
-        mock_redis_client.redis.rpop.side_effect = [
-            "invalid json",
-            None
-        ]
-        
-        # Should not raise exception, just continue processing
-        result = await ticket_queue.process_queue()
-        
-        assert result == 0
\ No newline at end of file
+    async def test_script_stores_envelope_once(self, redis_client):
+        """Test HSETNX guard, field write, EXPIRE and LPUSH, and that a taken key is left alone"""
+        script = redis_client.redis.register_script(ticket_queue_module._ENQUEUE_SCRIPT)
+        keys = ['ticket:queue_00000001', 'pending_tickets']
+
+        assert await script(keys=keys, args=[60, 'queue_00000001', 'status', 'queued']) == 1
+        assert await script(keys=keys, args=[60, 'queue_00000001', 'status', 'overwritten']) == 0
+
+        assert await redis_client.redis.hgetall(keys[0]) == {b'id': b'queue_00000001', b'status': b'queued'}
+        assert 0 < await redis_client.redis.ttl(keys[0]) <= 60
+        assert await redis_client.redis.lrange(keys[1], 0, -1) == [b'queue_00000001']
+
+    @pytest.mark.asyncio
+    async def test_add_ticket_with_real_script(self, redis_client, sample_ticket_request):
+        """Test add_ticket end to end through the Lua script"""
+        ticket_queue = TicketQueue(redis_client)
+
+        queue_id = await ticket_queue.add_ticket(sample_ticket_request)
+
+        key = f"ticket:{queue_id}"
+        stored = ticket_queue._decode_envelope(await redis_client.redis.hgetall(key))
+        assert stored['id'] == queue_id
+        assert stored['status'] == 'queued'
+        assert stored['attempts'] == 0
+        assert stored['ticket_data']['subject'] == sample_ticket_request.subject
+        assert 0 < await redis_client.redis.ttl(key) <= 7 * 24 * 3600
+        assert await redis_client.redis.lrange('pending_tickets', 0, -1) == [queue_id.encode()]
+
+    @pytest.mark.asyncio
+    async def test_add_ticket_repeated_id_with_real_script(self, redis_client, sample_ticket_request):
+        """Test that a wrapped id leaves the stored envelope untouched and gets a new prefix"""
+        await redis_client.redis.hset('ticket:queue_12340000', mapping={'id': 'queue_12340000', 'status': 'queued'})
+        ticket_queue = TicketQueue(redis_client)
+
+        with patch.object(ticket_queue_module, '_ID_PREFIX', 0x1234), \
+             patch.object(ticket_queue_module, '_ID_COUNTER', itertools.count(0x10000)):
+            queue_id = await ticket_queue.add_ticket(sample_ticket_request)
+
+        assert not queue_id.startswith('queue_1234')
+        assert await redis_client.redis.hgetall('ticket:queue_12340000') == {
+            b'id': b'queue_12340000', b'status': b'queued'
+        }
+        assert await redis_client.redis.lrange('pending_tickets', 0, -1) == [queue_id.encode()]
@@ -0,0 +1,56 @@
+import pytest
+
+from services.ticket_service.app.utils.redis_client import RedisClient
+
+
+class RecordingRedis:
+    """Records PUBLISH payloads exactly as they would go on the wire"""
+
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, channel, payload):
+        if channel == 'broken':
+            raise ConnectionError('connection lost')
+        self.published.append((channel, payload))
+        return 1
+
+
+class TestRedisClient:
+    """Test suite for the ticket-service RedisClient"""
+
+    @pytest.fixture
+    def redis_client(self):
+        client = RedisClient()
+        client.redis = RecordingRedis()
+        return client
+
+    def test_redis_client_has_slots(self, redis_client):
+        """Test that client instances carry no per-instance __dict__"""
+        assert not hasattr(redis_client, '__dict__')
+
+    @pytest.mark.asyncio
+    async def test_publish_message_compact_encoding(self, redis_client):
+        """Test that published payloads carry no separator whitespace"""
+        await redis_client.publish_message('tickets:created', {'a': 1, 'b': 2})
+
+        channel, payload = redis_client.redis.published[0]
+        assert channel == 'tickets:created'
+        assert payload == '{"a":1,"b":2}'
+        assert len(payload) == 13
+
+    @pytest.mark.asyncio
+    async def test_publish_message_keeps_unicode(self, redis_client):
+        """Test that non-ASCII text is sent as UTF-8 rather than escaped"""
+        await redis_client.publish_message('tickets:created', {'subject': 'Sistema caído'})
+
+        _, payload = redis_client.redis.published[0]
+        assert payload == '{"subject":"Sistema caído"}'
+
+    @pytest.mark.asyncio
+    async def test_publish_propagates_errors(self, redis_client):
+        """Test that publish re-raises failures while publish_message swallows them"""
+        with pytest.raises(ConnectionError):
+            await redis_client.publish('broken', {'a': 1})
+
+        await redis_client.publish_message('broken', {'a': 1})
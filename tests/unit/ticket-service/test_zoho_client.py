@@ -1,25 +1,75 @@
 import pytest
-from unittest.mock import AsyncMock, patch, MagicMock
+from unittest.mock import AsyncMock, patch
 from datetime import datetime, timedelta
 import httpx
+import orjson
 
 from services.ticket_service.app.services.zoho_client import ZohoClient
 from services.ticket_service.app.models.schemas import TicketRequest, Department
 
+TOKEN_URL = 'https://accounts.zoho.com/oauth/v2/token'
+API_URL = 'https://desk.zoho.com/api/v1'
+
+# Unpatched client class, so routes still work while httpx.AsyncClient is patched
+_AsyncClient = httpx.AsyncClient
+
+
+class ZohoRoutes:
+    """Route table served to httpx through a MockTransport"""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+
+    def add(self, method, url, status=200, **response):
+        self.routes[(method, url)] = (status, response)
+
+    def handler(self, request):
+        self.requests.append(request)
+        status, response = self.routes.get(
+            (request.method, str(request.url).split('?')[0]), (404, {})
+        )
+        return httpx.Response(status, **response)
+
+    def client(self, **kwargs):
+        return _AsyncClient(transport=httpx.MockTransport(self.handler), **kwargs)
+
+
+@pytest.fixture(scope="module")
+def shared_zoho_client():
+    """Build one ZohoClient with test configuration for the whole module"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('ZOHO_CLIENT_ID', 'test_client_id')
+        mp.setenv('ZOHO_CLIENT_SECRET', 'test_client_secret')
+        mp.setenv('ZOHO_REDIRECT_URI', 'http://localhost:8003/callback')
+        mp.setenv('ZOHO_AUTHORIZATION_CODE', 'test_auth_code')
+        return ZohoClient()
+
 
 class TestZohoClient:
     """Test suite for ZohoClient"""
 
+    @pytest.fixture(autouse=True)
+    def zoho_client(self, shared_zoho_client):
+        """Hand each test the shared client with no tokens and no HTTP client"""
+        shared_zoho_client._reset_auth_state()
+        shared_zoho_client._client = None
+        return shared_zoho_client
+
+    @pytest.fixture
+    async def zoho_http(self, zoho_client):
+        """Serve the Zoho client's HTTP requests from an in-memory route table"""
+        routes = ZohoRoutes()
+        zoho_client._client = routes.client()
+        yield routes
+        await zoho_client.aclose()
+
     @pytest.fixture
-    def zoho_client(self):
-        """Create ZohoClient with test configuration"""
-        with patch.dict('os.environ', {
-            'ZOHO_CLIENT_ID': 'test_client_id',
-            'ZOHO_CLIENT_SECRET': 'test_client_secret',
-            'ZOHO_REDIRECT_URI': 'http://localhost:8003/callback',
-            'ZOHO_AUTHORIZATION_CODE': 'test_auth_code'
-        }):
-            return ZohoClient()
+    def mock_make_request(self, zoho_client):
+        """Patch _make_request on the shared client for API-level tests"""
+        with patch.object(zoho_client, '_make_request', new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = {'id': 'test_ticket'}
+            yield mock_request
 
     @pytest.fixture
     def sample_ticket_request(self):
@@ -34,7 +84,7 @@ class TestZohoClient:
         )
 
     @pytest.mark.asyncio
-    async def test_initialization_success(self, zoho_client):
+    async def test_initialization_success(self, zoho_client, zoho_http):
         """Test successful client initialization"""
         mock_token_response = {
             'access_token': 'test_access_token',
@@ -46,23 +96,20 @@ class TestZohoClient:
             'data': [{'id': 'test_org_id'}]
         }
 
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_response = MagicMock()
-            mock_response.json.side_effect = [mock_token_response, mock_org_response]
-            mock_response.raise_for_status.return_value = None
-            
-            mock_client.return_value.__aenter__.return_value.post.return_value = mock_response
-            mock_client.return_value.__aenter__.return_value.get.return_value = mock_response
-            
+        zoho_http.add('POST', TOKEN_URL, json=mock_token_response)
+        zoho_http.add('GET', f'{API_URL}/organizations', json=mock_org_response)
+        
+        with patch.object(zoho_client, '_load_saved_tokens', AsyncMock(return_value=False)), \
+                patch.object(zoho_client, '_save_tokens', AsyncMock()):
             await zoho_client.initialize()
-            
-            assert zoho_client.access_token == 'test_access_token'
-            assert zoho_client.refresh_token == 'test_refresh_token'
-            assert zoho_client.org_id == 'test_org_id'
-            assert zoho_client.is_connected()
+        
+        assert zoho_client.access_token == 'test_access_token'
+        assert zoho_client.refresh_token == 'test_refresh_token'
+        assert zoho_client.org_id == 'test_org_id'
+        assert zoho_client.is_connected()
 
     @pytest.mark.asyncio
-    async def test_get_tokens_from_code_success(self, zoho_client):
+    async def test_get_tokens_from_code_success(self, zoho_client, zoho_http):
         """Test successful token exchange"""
         mock_response_data = {
             'access_token': 'new_access_token',
@@ -70,39 +117,29 @@ class TestZohoClient:
             'expires_in': 3600
         }
 
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_response = MagicMock()
-            mock_response.json.return_value = mock_response_data
-            mock_response.raise_for_status.return_value = None
-            
-            mock_client.return_value.__aenter__.return_value.post.return_value = mock_response
-            
-            await zoho_client._get_tokens_from_code()
-            
-            assert zoho_client.access_token == 'new_access_token'
-            assert zoho_client.refresh_token == 'new_refresh_token'
-            assert zoho_client.token_expires_at is not None
+        zoho_http.add('POST', TOKEN_URL, json=mock_response_data)
+        
+        await zoho_client._get_tokens_from_code()
+        
+        assert zoho_client.access_token == 'new_access_token'
+        assert zoho_client.refresh_token == 'new_refresh_token'
+        assert zoho_client.token_expires_at is not None
 
     @pytest.mark.asyncio
-    async def test_get_tokens_missing_access_token(self, zoho_client):
+    async def test_get_tokens_missing_access_token(self, zoho_client, zoho_http):
         """Test token exchange with missing access token"""
         mock_response_data = {
             'refresh_token': 'test_refresh_token'
             # Missing access_token
         }
 
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_response = MagicMock()
-            mock_response.json.return_value = mock_response_data
-            mock_response.raise_for_status.return_value = None
-            
-            mock_client.return_value.__aenter__.return_value.post.return_value = mock_response
-            
-            with pytest.raises(KeyError, match="access_token not found"):
-                await zoho_client._get_tokens_from_code()
+        zoho_http.add('POST', TOKEN_URL, json=mock_response_data)
+        
+        with pytest.raises(KeyError, match="access_token not found"):
+            await zoho_client._get_tokens_from_code()
 
     @pytest.mark.asyncio
-    async def test_refresh_access_token(self, zoho_client):
+    async def test_refresh_access_token(self, zoho_client, zoho_http):
         """Test access token refresh"""
         zoho_client.refresh_token = 'existing_refresh_token'
         
@@ -111,22 +148,29 @@ class TestZohoClient:
             'expires_in': 3600
         }
 
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_response = MagicMock()
-            mock_response.json.return_value = mock_response_data
-            mock_response.raise_for_status.return_value = None
-            
-            mock_client.return_value.__aenter__.return_value.post.return_value = mock_response
-            
-            await zoho_client._refresh_access_token()
-            
-            assert zoho_client.access_token == 'refreshed_access_token'
-            assert zoho_client.token_expires_at is not None
+        zoho_http.add('POST', TOKEN_URL, json=mock_response_data)
+        
+        await zoho_client._refresh_access_token()
+        
+        assert zoho_client.access_token == 'refreshed_access_token'
+        assert zoho_client.token_expires_at is not None
+        params = zoho_http.requests[0].url.params
+        assert params['grant_type'] == 'refresh_token'
+        assert params['refresh_token'] == 'existing_refresh_token'
 
     @pytest.mark.asyncio
     async def test_ensure_valid_token_refresh_needed(self, zoho_client):
         """Test token refresh when expired"""
-        zoho_client.token_expires_at = datetime.now() - timedelta(minutes=1)  # Expired
+        zoho_client._set_token_expiry(-60)  # Expired
+        
+        with patch.object(zoho_client, '_refresh_access_token') as mock_refresh:
+            await zoho_client._ensure_valid_token()
+            mock_refresh.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_ensure_valid_token_refresh_within_margin(self, zoho_client):
+        """Test token refresh ahead of expiry once inside the safety margin"""
+        zoho_client._set_token_expiry(30)  # About to expire
         
         with patch.object(zoho_client, '_refresh_access_token') as mock_refresh:
             await zoho_client._ensure_valid_token()
@@ -135,16 +179,42 @@ class TestZohoClient:
     @pytest.mark.asyncio
     async def test_ensure_valid_token_no_refresh_needed(self, zoho_client):
         """Test token validation when still valid"""
-        zoho_client.token_expires_at = datetime.now() + timedelta(hours=1)  # Still valid
+        # Beyond the margin plus the largest jitter
+        zoho_client._set_token_expiry(91)
         
         with patch.object(zoho_client, '_refresh_access_token') as mock_refresh:
             await zoho_client._ensure_valid_token()
             mock_refresh.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_get_org_id_success(self, zoho_client):
+    async def test_ensure_valid_token_wall_clock_fallback(self, zoho_client):
+        """Test that an expiry set only as a datetime is still honoured"""
+        zoho_client.token_expires_at = datetime.now() - timedelta(minutes=1)
+        
+        with patch.object(zoho_client, '_refresh_access_token') as mock_refresh:
+            await zoho_client._ensure_valid_token()
+            mock_refresh.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_ensure_valid_token_single_flight(self, zoho_client):
+        """Test that concurrent callers share one refresh"""
+        import asyncio
+
+        zoho_client._set_token_expiry(-60)
+
+        async def refresh():
+            await asyncio.sleep(0)
+            zoho_client._set_token_expiry(3600)
+
+        with patch.object(zoho_client, '_refresh_access_token', AsyncMock(side_effect=refresh)) as mock_refresh:
+            await asyncio.gather(*(zoho_client._ensure_valid_token() for _ in range(5)))
+            mock_refresh.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_get_org_id_success(self, zoho_client, zoho_http):
         """Test successful organization ID retrieval"""
         zoho_client.access_token = 'test_token'
+        zoho_client._set_token_expiry(3600)
         
         mock_response_data = {
             'data': [
@@ -152,36 +222,27 @@ class TestZohoClient:
             ]
         }
 
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_response = MagicMock()
-            mock_response.json.return_value = mock_response_data
-            mock_response.raise_for_status.return_value = None
-            
-            mock_client.return_value.__aenter__.return_value.get.return_value = mock_response
-            
-            await zoho_client._get_org_id()
-            
-            assert zoho_client.org_id == 'org_123'
+        zoho_http.add('GET', f'{API_URL}/organizations', json=mock_response_data)
+        
+        await zoho_client._get_org_id()
+        
+        assert zoho_client.org_id == 'org_123'
 
     @pytest.mark.asyncio
-    async def test_get_org_id_no_organizations(self, zoho_client):
+    async def test_get_org_id_no_organizations(self, zoho_client, zoho_http):
         """Test organization ID retrieval with no organizations"""
         zoho_client.access_token = 'test_token'
+        zoho_client._set_token_expiry(3600)
         
         mock_response_data = {'data': []}
 
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_response = MagicMock()
-            mock_response.json.return_value = mock_response_data
-            mock_response.raise_for_status.return_value = None
-            
-            mock_client.return_value.__aenter__.return_value.get.return_value = mock_response
-            
-            with pytest.raises(ValueError, match="No organizations found"):
-                await zoho_client._get_org_id()
+        zoho_http.add('GET', f'{API_URL}/organizations', json=mock_response_data)
+        
+        with pytest.raises(ValueError, match="No organizations found"):
+            await zoho_client._get_org_id()
 
     @pytest.mark.asyncio
-    async def test_list_departments_success(self, zoho_client):
+    async def test_list_departments_success(self, zoho_client, mock_make_request):
         """Test successful department listing"""
         zoho_client.access_token = 'test_token'
         zoho_client.org_id = 'test_org'
@@ -193,136 +254,104 @@ class TestZohoClient:
             ]
         }
 
-        with patch.object(zoho_client, '_make_request') as mock_request:
-            mock_request.return_value = mock_response_data
-            
-            departments = await zoho_client.list_departments()
-            
-            assert len(departments) == 2
-            assert isinstance(departments[0], Department)
-            assert departments[0].id == 'dept_1'
-            assert departments[0].name == 'Technical Support'
-            assert departments[0].email == 'tech@example.com'
-
-    @pytest.mark.asyncio
-    async def test_create_contact_success(self, zoho_client):
-        """Test successful contact creation"""
-        mock_response_data = {'id': 'contact_123'}
-
-        with patch.object(zoho_client, '_make_request') as mock_request:
-            mock_request.return_value = mock_response_data
-            
-            contact_id = await zoho_client.create_contact('test@example.com', 'John Doe')
-            
-            assert contact_id == 'contact_123'
-            mock_request.assert_called_once_with(
-                'POST', 
-                '/contacts',
-                json={
-                    'firstName': 'John',
-                    'lastName': 'Doe',
-                    'email': 'test@example.com'
-                }
-            )
+        mock_make_request.return_value = mock_response_data
+        
+        departments = await zoho_client.list_departments()
+        
+        assert len(departments) == 2
+        assert isinstance(departments[0], Department)
+        assert departments[0].id == 'dept_1'
+        assert departments[0].name == 'Technical Support'
+        assert departments[0].email == 'tech@example.com'
 
     @pytest.mark.asyncio
-    async def test_create_contact_single_name(self, zoho_client):
-        """Test contact creation with single name"""
-        mock_response_data = {'id': 'contact_456'}
-
-        with patch.object(zoho_client, '_make_request') as mock_request:
-            mock_request.return_value = mock_response_data
-            
-            contact_id = await zoho_client.create_contact('test@example.com', 'John')
-            
-            assert contact_id == 'contact_456'
-            mock_request.assert_called_once_with(
-                'POST', 
-                '/contacts',
-                json={
-                    'firstName': 'John',
-                    'lastName': '',
-                    'email': 'test@example.com'
-                }
-            )
+    @pytest.mark.parametrize("name,first_name,last_name", [
+        ('John Doe', 'John', 'Doe'),
+        ('John', 'John', ''),
+    ])
+    async def test_create_contact_success(self, zoho_client, mock_make_request, name, first_name, last_name):
+        """Test successful contact creation for full and single names"""
+        mock_make_request.return_value = {'id': 'contact_123'}
+        
+        contact_id = await zoho_client.create_contact('test@example.com', name)
+        
+        assert contact_id == 'contact_123'
+        mock_make_request.assert_called_once_with(
+            'POST', 
+            '/contacts',
+            json={
+                'firstName': first_name,
+                'lastName': last_name,
+                'email': 'test@example.com'
+            }
+        )
 
     @pytest.mark.asyncio
-    async def test_create_ticket_success(self, zoho_client, sample_ticket_request):
+    async def test_create_ticket_success(self, zoho_client, mock_make_request, sample_ticket_request):
         """Test successful ticket creation"""
-        mock_response_data = {'id': 'ticket_789'}
-
-        with patch.object(zoho_client, '_make_request') as mock_request:
-            mock_request.return_value = mock_response_data
-            
-            ticket_id = await zoho_client.create_ticket(sample_ticket_request)
-            
-            assert ticket_id == 'ticket_789'
-            
-            # Verify request payload
-            call_args = mock_request.call_args
-            assert call_args[0][0] == 'POST'
-            assert call_args[0][1] == '/tickets'
-            
-            payload = call_args[1]['json']
-            assert payload['subject'] == sample_ticket_request.subject
-            assert payload['description'] == sample_ticket_request.description
-            assert payload['priority'] == 'High'  # urgent -> High
-            assert payload['departmentId'] == sample_ticket_request.department_id
-            assert payload['contactId'] == sample_ticket_request.contact_id
+        mock_make_request.return_value = {'id': 'ticket_789'}
+        
+        ticket_id = await zoho_client.create_ticket(sample_ticket_request)
+        
+        assert ticket_id == 'ticket_789'
+        
+        # Verify request payload
+        call_args = mock_make_request.call_args
+        assert call_args[0][0] == 'POST'
+        assert call_args[0][1] == '/tickets'
+        
+        payload = call_args[1]['json']
+        assert payload['subject'] == sample_ticket_request.subject
+        assert payload['description'] == sample_ticket_request.description
+        assert payload['priority'] == 'High'  # urgent -> High
+        assert payload['departmentId'] == sample_ticket_request.department_id
+        assert payload['contactId'] == sample_ticket_request.contact_id
 
     @pytest.mark.asyncio
-    async def test_create_ticket_priority_mapping(self, zoho_client):
+    @pytest.mark.parametrize("priority_in,priority_out", [
+        ('urgent', 'High'),
+        ('normal', 'Medium'),
+        ('low', 'Low'),
+        ('High', 'High'),
+        ('weird', 'Medium'),
+    ])
+    async def test_create_ticket_priority_mapping(self, zoho_client, mock_make_request, priority_in, priority_out):
         """Test ticket priority mapping"""
-        test_cases = [
-            ('urgent', 'High'),
-            ('normal', 'Medium'),
-            ('low', 'Low')
-        ]
-
-        for priority_in, priority_out in test_cases:
-            ticket_request = TicketRequest(
-                subject="Test",
-                description="Test description",
-                priority=priority_in,
-                classification="technical",
-                contact_id="123",
-                department_id="456"
-            )
-
-            with patch.object(zoho_client, '_make_request') as mock_request:
-                mock_request.return_value = {'id': 'test_ticket'}
-                
-                await zoho_client.create_ticket(ticket_request)
-                
-                payload = mock_request.call_args[1]['json']
-                assert payload['priority'] == priority_out
+        ticket_request = TicketRequest(
+            subject="Test",
+            description="Test description",
+            priority=priority_in,
+            classification="technical",
+            contact_id="123",
+            department_id="456"
+        )
+        
+        await zoho_client.create_ticket(ticket_request)
+        
+        payload = mock_make_request.call_args[1]['json']
+        assert payload['priority'] == priority_out
 
     @pytest.mark.asyncio
-    async def test_get_ticket_status_success(self, zoho_client):
+    async def test_get_ticket_status_success(self, zoho_client, mock_make_request):
         """Test successful ticket status retrieval"""
-        mock_response_data = {'statusType': 'Open'}
-
-        with patch.object(zoho_client, '_make_request') as mock_request:
-            mock_request.return_value = mock_response_data
-            
-            status = await zoho_client.get_ticket_status('ticket_123')
-            
-            assert status == 'Open'
-            mock_request.assert_called_once_with('GET', '/tickets/ticket_123')
+        mock_make_request.return_value = {'statusType': 'Open'}
+        
+        status = await zoho_client.get_ticket_status('ticket_123')
+        
+        assert status == 'Open'
+        mock_make_request.assert_called_once_with('GET', '/tickets/ticket_123')
 
     @pytest.mark.asyncio
-    async def test_update_ticket_success(self, zoho_client):
+    async def test_update_ticket_success(self, zoho_client, mock_make_request):
         """Test successful ticket update"""
         updates = {'status': 'In Progress', 'assigneeId': 'agent_123'}
         mock_response_data = {'id': 'ticket_123', 'status': 'In Progress'}
-
-        with patch.object(zoho_client, '_make_request') as mock_request:
-            mock_request.return_value = mock_response_data
-            
-            result = await zoho_client.update_ticket('ticket_123', updates)
-            
-            assert result == mock_response_data
-            mock_request.assert_called_once_with('PATCH', '/tickets/ticket_123', json=updates)
+        mock_make_request.return_value = mock_response_data
+        
+        result = await zoho_client.update_ticket('ticket_123', updates)
+        
+        assert result == mock_response_data
+        mock_make_request.assert_called_once_with('PATCH', '/tickets/ticket_123', json=updates)
 
     def test_generate_authorization_url(self, zoho_client):
         """Test authorization URL generation"""
@@ -346,28 +375,72 @@ class TestZohoClient:
         assert zoho_client.is_connected() is False
 
     @pytest.mark.asyncio
-    async def test_make_request_with_auth_headers(self, zoho_client):
+    async def test_make_request_with_auth_headers(self, zoho_client, zoho_http):
         """Test _make_request includes proper authentication headers"""
         zoho_client.access_token = 'test_token'
         zoho_client.org_id = 'test_org'
-        zoho_client.token_expires_at = datetime.now() + timedelta(hours=1)
+        zoho_client._set_token_expiry(3600)
         
         mock_response = {'data': 'test'}
 
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_http_response = MagicMock()
-            mock_http_response.json.return_value = mock_response
-            mock_http_response.raise_for_status.return_value = None
-            
-            mock_client.return_value.__aenter__.return_value.get.return_value = mock_http_response
-            
-            result = await zoho_client._make_request('GET', '/test')
-            
-            assert result == mock_response
-            
-            # Verify headers were set correctly
-            call_args = mock_client.return_value.__aenter__.return_value.get.call_args
-            headers = call_args[1]['headers']
-            assert headers['Authorization'] == 'Zoho-oauthtoken test_token'
-            assert headers['orgId'] == 'test_org'
-            assert headers['Content-Type'] == 'application/json'
\ No newline at end of file
+        zoho_http.add('GET', f'{API_URL}/test', json=mock_response)
+        
+        result = await zoho_client._make_request('GET', '/test')
+        
+        assert result == mock_response
+        
+        # Verify headers were set correctly
+        headers = zoho_http.requests[0].headers
+        assert headers['Authorization'] == 'Zoho-oauthtoken test_token'
+        assert headers['orgId'] == 'test_org'
+        assert headers['Content-Type'] == 'application/json'
+
+    @pytest.mark.asyncio
+    async def test_make_request_serializes_json_body(self, zoho_client, zoho_http):
+        """Test that JSON payloads are sent pre-serialized with a JSON content type"""
+        zoho_client.access_token = 'test_token'
+        zoho_client.org_id = 'test_org'
+        zoho_client._set_token_expiry(3600)
+        payload = {'subject': 'Sistema caído', 'priority': 'High'}
+        zoho_http.add('POST', f'{API_URL}/tickets', json={'id': 'ticket_1'})
+        
+        result = await zoho_client._make_request('POST', '/tickets', json=payload)
+        
+        assert result == {'id': 'ticket_1'}
+        request = zoho_http.requests[0]
+        assert request.headers['Content-Type'] == 'application/json'
+        assert request.content == orjson.dumps(payload)
+
+    @pytest.mark.asyncio
+    async def test_client_is_reused(self, zoho_client):
+        """Test that consecutive requests share one pooled HTTP client"""
+        zoho_client.access_token = 'test_token'
+        zoho_client.org_id = 'test_org'
+        zoho_client._set_token_expiry(3600)
+
+        routes = ZohoRoutes()
+        routes.add('GET', f'{API_URL}/first', json={'data': 1})
+        routes.add('GET', f'{API_URL}/second', json={'data': 2})
+
+        with patch('httpx.AsyncClient', side_effect=routes.client) as mock_client_class:
+            assert await zoho_client._make_request('GET', '/first') == {'data': 1}
+            assert await zoho_client._make_request('GET', '/second') == {'data': 2}
+
+            mock_client_class.assert_called_once()
+            assert len(routes.requests) == 2
+
+        await zoho_client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_aclose_releases_client(self, zoho_client):
+        """Test that aclose closes the pooled client and a later request opens a new one"""
+        first = zoho_client._http()
+        assert zoho_client._http() is first
+
+        await zoho_client.aclose()
+
+        assert first.is_closed
+        assert zoho_client._client is None
+        second = zoho_client._http()
+        assert second is not first
+        await zoho_client.aclose()
\ No newline at end of file
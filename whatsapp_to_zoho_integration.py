@@ -3,75 +3,129 @@
 Real-time WhatsApp to Zoho Desk Integration
 Monitors WhatsApp messages and creates tickets automatically
 """
-import redis
-import json
-import requests
+import asyncio
+import redis.asyncio as aioredis
+import re
+import logging
+import logging.handlers
+import queue
+import httpx
+import orjson
+import socket
 import time
 from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
 
 # Service configuration
 TICKET_SERVICE_URL = "http://localhost:8005"
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
 
+logger = logging.getLogger("wa2zoho")
+
+# Inbound messages are read from the stream the WhatsApp service mirrors them into
+INBOUND_STREAM = "whatsapp:messages:inbound:stream"
+CONSUMER_GROUP = "ticket-workers"
+CONSUMER_NAME = socket.gethostname()
+BATCH_SIZE = 100
+BLOCK_MS = 1000
+
+# Entries whose ticket failed stay pending. Once idle this long they are reclaimed and
+# retried, and after MAX_DELIVERIES deliveries they move to the dead-letter stream.
+DEAD_LETTER_STREAM = "whatsapp:messages:inbound:dead"
+RETRY_IDLE_MS = 30000
+RETRY_INTERVAL = 10.0  # seconds between pending-entry sweeps
+MAX_DELIVERIES = 5
+
+# Tickets being created at once within a batch
+MAX_IN_FLIGHT = 64
+
+# Tickets sent per /tickets/customer/batch request (the ticket service caps it at 50)
+TICKET_BATCH_SIZE = 50
+
+# Classification cache stats are logged every this many messages
+CACHE_STATS_EVERY = 1000
+
 # Technical keywords for classification
 TECHNICAL_KEYWORDS = ['impresora', 'sistema', 'pos', 'computadora', 'servidor', 'error', 
                      'no funciona', 'ayuda', 'urgente', 'problema', 'falla']
+URGENT_KEYWORDS = ['urgente', 'critico', 'no funciona']
+
+# Keywords match whole words only, case-insensitively ("sistema" matches "Sistema"
+# but not "sistemas"). Single words are looked up in the message's word set; multi-word
+# phrases are searched in the words re-joined by single spaces, so any separator
+# counts ("no funciona", "no-funciona").
+_WORD_RE = re.compile(r'\w+')
+
+TECHNICAL_SET = frozenset(k for k in TECHNICAL_KEYWORDS if ' ' not in k)
+URGENT_SET = frozenset(k for k in URGENT_KEYWORDS if ' ' not in k)
+_TECH_PHRASES = tuple(f' {k} ' for k in TECHNICAL_KEYWORDS if ' ' in k)
+_URGENT_PHRASES = tuple(f' {k} ' for k in URGENT_KEYWORDS if ' ' in k)
 
+def _has_keyword(words, joined, keywords, phrases):
+    return not keywords.isdisjoint(words) or any(phrase in joined for phrase in phrases)
+
+@lru_cache(maxsize=4096)
 def classify_message(text):
-    """Simple keyword-based classification"""
-    text_lower = text.lower()
-    
+    """Simple keyword-based classification, cached per distinct text"""
     # Check if message contains technical keywords
-    is_technical = any(keyword in text_lower for keyword in TECHNICAL_KEYWORDS)
+    tokens = _WORD_RE.findall(text.lower())
+    words = set(tokens)
+    joined = f" {' '.join(tokens)} "
+    is_technical = _has_keyword(words, joined, TECHNICAL_SET, _TECH_PHRASES)
     
     if is_technical:
         # Determine priority
-        priority = 'High' if any(word in text_lower for word in ['urgente', 'critico', 'no funciona']) else 'Medium'
+        priority = 'High' if _has_keyword(words, joined, URGENT_SET, _URGENT_PHRASES) else 'Medium'
         
-        return {
+        # Cached results are shared between callers, so hand out read-only views
+        return MappingProxyType({
             'is_incident': True,
             'category': 'technical',
             'priority': priority,
             'confidence': 0.9
-        }
+        })
     
-    return {'is_incident': False}
+    return MappingProxyType({'is_incident': False})
 
-def create_ticket_from_whatsapp(message_data):
-    """Create a Zoho ticket from WhatsApp message data"""
-    try:
-        # Parse message data
-        data = json.loads(message_data) if isinstance(message_data, str) else message_data
-        
-        # Extract message info
-        text = data.get('text', '')
-        sender = data.get('from', 'unknown')
-        timestamp = data.get('timestamp', datetime.now().isoformat())
-        message_id = data.get('id', 'unknown')
-        
-        print(f"\nProcessing WhatsApp message:")
-        print(f"  From: {sender}")
-        print(f"  Text: {text}")
-        print(f"  ID: {message_id}")
-        
-        # Classify the message
-        classification = classify_message(text)
-        
-        if not classification['is_incident']:
-            print("  -> Not classified as support incident, skipping")
-            return None
-        
-        print(f"  -> Classified as: {classification['category']} incident, Priority: {classification['priority']}")
-        
-        # Extract phone number from sender
-        phone = sender.replace('@s.whatsapp.net', '').replace('@c.us', '')
-        customer_email = f"{phone}@whatsapp.support.com"
-        customer_name = f"WhatsApp User {phone[-4:]}"
-        
-        # Create ticket description
-        description = f"""
-Mensaje recibido via WhatsApp:
+def sender_phone(sender):
+    """Phone number part of a WhatsApp sender id such as 5215555@s.whatsapp.net"""
+    return sender.partition('@')[0]
+
+def ticket_data_for(message_data):
+    """Ticket service payload for a WhatsApp message, or None when it is not an incident"""
+    # Parse message data
+    data = orjson.loads(message_data) if isinstance(message_data, (str, bytes)) else message_data
+    
+    # Extract message info
+    text = data.get('text', '')
+    sender = data.get('from', 'unknown')
+    timestamp = data.get('timestamp', datetime.now().isoformat())
+    message_id = data.get('id', 'unknown')
+    
+    logger.info("Processing WhatsApp message %s from %s", message_id, sender)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("  Text: %s", text)
+    
+    # Classify the message
+    classification = classify_message(text)
+    
+    if not classification['is_incident']:
+        logger.info("  -> Not classified as support incident, skipping")
+        return None
+    
+    logger.info("  -> Classified as: %s incident, Priority: %s",
+                classification['category'], classification['priority'])
+    
+    # Extract phone number from sender
+    phone = sender_phone(sender)
+    customer_email = f"{phone}@whatsapp.support.com"
+    customer_name = f"WhatsApp User {phone[-4:]}"
+    
+    # Create ticket description
+    # The literal is already trimmed, so no .strip() copy is needed
+    description = f"""Mensaje recibido via WhatsApp:
 "{text}"
 
 Informacion del remitente:
@@ -84,71 +138,231 @@ Clasificacion automatica:
 - Prioridad: {classification['priority']}
 - Confianza: {classification['confidence']}
 
-Canal: WhatsApp Bot Real-Time
-        """.strip()
-        
-        # Prepare ticket data
-        ticket_data = {
-            "customer_email": customer_email,
-            "customer_name": customer_name,
-            "subject": f"Incidente {classification['category']} - WhatsApp",
-            "description": description,
-            "priority": classification['priority']
-        }
-        
-        print("\nCreating ticket in Zoho Desk...")
+Canal: WhatsApp Bot Real-Time"""
+    
+    # Prepare ticket data
+    return {
+        "customer_email": customer_email,
+        "customer_name": customer_name,
+        "subject": f"Incidente {classification['category']} - WhatsApp",
+        "description": description,
+        "priority": classification['priority']
+    }
+
+def _log_created(result):
+    logger.info("SUCCESS! Ticket %s created for %s (contact %s)",
+                result.get('ticket_id'), result.get('customer_email'), result.get('contact_id'))
+
+async def post_ticket(ticket_data, client):
+    """Create one ticket through the ticket service; returns its result or None"""
+    try:
+        logger.debug("Creating ticket in Zoho Desk for %s", ticket_data['customer_email'])
         
         # Call ticket service
-        response = requests.post(
-            f"{TICKET_SERVICE_URL}/tickets/customer",
-            params=ticket_data,
-            timeout=10
-        )
+        response = await client.post("/tickets/customer", params=ticket_data)
         
         if response.status_code == 200:
             result = response.json()
-            print(f"\nSUCCESS! Ticket created automatically!")
-            print(f"   Ticket ID: {result.get('ticket_id')}")
-            print(f"   Contact ID: {result.get('contact_id')}")
-            print(f"   Customer: {customer_email}")
-            print("-" * 60)
+            _log_created(result)
             return result
         else:
-            print(f"\nFailed to create ticket: {response.status_code}")
-            print(f"   Response: {response.text}")
+            logger.error("Failed to create ticket: %s", response.status_code)
+            logger.error("   Response: %s", response.text)
             return None
             
     except Exception as e:
-        print(f"\nError processing message: {e}")
+        logger.error("Error creating ticket: %s", e)
         return None
 
-def monitor_whatsapp_messages():
+async def create_ticket_from_whatsapp(message_data, client):
+    """Create a Zoho ticket from WhatsApp message data"""
+    try:
+        ticket_data = ticket_data_for(message_data)
+    except Exception as e:
+        logger.error("Error processing message: %s", e)
+        return None
+    
+    if ticket_data is None:
+        return None
+    return await post_ticket(ticket_data, client)
+
+async def _post_ticket_chunk(chunk, client, slots):
+    """One batched POST; falls back to per-ticket posts when the endpoint is not implemented"""
+    try:
+        response = await client.post(
+            "/tickets/customer/batch",
+            content=orjson.dumps(chunk),
+            headers={"Content-Type": "application/json"}
+        )
+    except Exception as e:
+        logger.error("Error creating ticket batch: %s", e)
+        return [None] * len(chunk)
+    
+    if response.status_code == 501:
+        async def post_one(ticket_data):
+            async with slots:
+                return await post_ticket(ticket_data, client)
+        return await asyncio.gather(*(post_one(ticket_data) for ticket_data in chunk))
+    
+    if response.status_code != 200:
+        logger.error("Failed to create ticket batch: %s", response.status_code)
+        logger.error("   Response: %s", response.text)
+        return [None] * len(chunk)
+    
+    results = []
+    for result in orjson.loads(response.content):
+        if result.get('success'):
+            _log_created(result)
+            results.append(result)
+        else:
+            logger.error("Failed to create ticket for %s: %s",
+                         result.get('customer_email'), result.get('error'))
+            results.append(None)
+    return results
+
+async def create_tickets(tickets, client, slots=None):
+    """Create tickets with one request per TICKET_BATCH_SIZE chunk; results follow the input, None marks a failure"""
+    slots = slots or asyncio.Semaphore(MAX_IN_FLIGHT)
+    chunks = await asyncio.gather(*(
+        _post_ticket_chunk(tickets[i:i + TICKET_BATCH_SIZE], client, slots)
+        for i in range(0, len(tickets), TICKET_BATCH_SIZE)
+    ))
+    return [result for chunk in chunks for result in chunk]
+
+async def _ensure_group(r):
+    """Create the consumer group (and the stream) unless it already exists"""
+    try:
+        await r.xgroup_create(INBOUND_STREAM, CONSUMER_GROUP, id='0', mkstream=True)
+    except aioredis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+async def process_entries(r, entries, client, slots):
+    """Create tickets for a batch of stream entries; acknowledges and returns the ids that are done"""
+    # Entries that need no ticket are acknowledged straight away
+    done, incident_ids, tickets = [], [], []
+    for entry_id, fields in entries:
+        try:
+            ticket_data = ticket_data_for(fields.get('data', '{}'))
+        except Exception as e:
+            logger.error("Error processing message: %s", e)
+            ticket_data = None
+        if ticket_data is None:
+            done.append(entry_id)
+        else:
+            incident_ids.append(entry_id)
+            tickets.append(ticket_data)
+    
+    if tickets:
+        results = await create_tickets(tickets, client, slots)
+        # Failed tickets stay pending until retry_pending reclaims them
+        done.extend(entry_id for entry_id, result in zip(incident_ids, results) if result is not None)
+    
+    if done:
+        await r.xack(INBOUND_STREAM, CONSUMER_GROUP, *done)
+    return done
+
+async def _dead_letter(r, entries, deliveries):
+    """Move entries that keep failing to the dead-letter stream and acknowledge them"""
+    async with r.pipeline(transaction=True) as pipe:
+        for entry_id, fields in entries:
+            pipe.xadd(DEAD_LETTER_STREAM, {**fields, 'entry_id': entry_id, 'deliveries': deliveries[entry_id]})
+        pipe.xack(INBOUND_STREAM, CONSUMER_GROUP, *(entry_id for entry_id, _ in entries))
+        await pipe.execute()
+    for entry_id, _ in entries:
+        logger.error("Message %s failed %d times, moved to %s",
+                     entry_id, deliveries[entry_id], DEAD_LETTER_STREAM)
+
+async def retry_pending(r, client, slots):
+    """Reclaim entries left pending for RETRY_IDLE_MS and retry them, dead-lettering repeated failures"""
+    start_id = '0-0'
+    while True:
+        start_id, entries, *_ = await r.xautoclaim(
+            INBOUND_STREAM, CONSUMER_GROUP, CONSUMER_NAME,
+            min_idle_time=RETRY_IDLE_MS, start_id=start_id, count=BATCH_SIZE
+        )
+        if entries:
+            # The claim counts as a delivery, so these counts include this attempt
+            pending = await r.xpending_range(
+                INBOUND_STREAM, CONSUMER_GROUP, min=entries[0][0], max=entries[-1][0],
+                count=len(entries), consumername=CONSUMER_NAME
+            )
+            deliveries = {p['message_id']: p['times_delivered'] for p in pending}
+            dead = [entry for entry in entries if deliveries.get(entry[0], 0) > MAX_DELIVERIES]
+            retry = [entry for entry in entries if deliveries.get(entry[0], 0) <= MAX_DELIVERIES]
+            
+            if dead:
+                await _dead_letter(r, dead, deliveries)
+            if retry:
+                logger.info("Retrying %d pending WhatsApp message(s)", len(retry))
+                await process_entries(r, retry, client, slots)
+        
+        if start_id == '0-0':
+            break
+
+async def read_entries(r, last_id):
+    """Read the next batch after last_id; returns the entries and the id to read from next"""
+    response = await r.xreadgroup(
+        CONSUMER_GROUP, CONSUMER_NAME, {INBOUND_STREAM: last_id},
+        count=BATCH_SIZE, block=BLOCK_MS
+    )
+    entries = response[0][1] if response else []
+    if last_id == '>':
+        return entries, last_id
+    # Walk the pending backlog past each batch, so entries that fail again are left
+    # to retry_pending instead of being re-read forever; once drained, read new ones
+    return entries, entries[-1][0] if entries else '>'
+
+async def monitor_whatsapp_messages():
     """Monitor Redis for WhatsApp messages and create tickets"""
-    print("WhatsApp to Zoho Integration Started")
-    print("=" * 60)
-    print("Monitoring WhatsApp messages in real-time...")
-    print("Send a message with keywords like: impresora, error, urgente, ayuda")
-    print("-" * 60)
+    logger.info("WhatsApp to Zoho Integration Started")
+    logger.info("Monitoring WhatsApp messages in real-time...")
+    logger.info("Send a message with keywords like: impresora, error, urgente, ayuda")
     
     # Connect to Redis
-    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    r = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    await _ensure_group(r)
     
-    # Subscribe to WhatsApp messages
-    pubsub = r.pubsub()
-    pubsub.subscribe('whatsapp:messages:inbound')
+    slots = asyncio.Semaphore(MAX_IN_FLIGHT)
     
-    try:
-        # Listen for messages
-        for message in pubsub.listen():
-            if message['type'] == 'message':
-                print(f"\nNew WhatsApp message received!")
-                create_ticket_from_whatsapp(message['data'])
+    async with httpx.AsyncClient(base_url=TICKET_SERVICE_URL, timeout=10.0) as client:
+        try:
+            # Start with entries delivered to this consumer but never acknowledged
+            last_id = '0'
+            received = 0
+            next_retry = time.monotonic() + RETRY_INTERVAL
+            while True:
+                if time.monotonic() >= next_retry:
+                    await retry_pending(r, client, slots)
+                    next_retry = time.monotonic() + RETRY_INTERVAL
                 
-    except KeyboardInterrupt:
-        print("\n\nIntegration stopped by user")
-    finally:
-        pubsub.close()
-        r.close()
+                entries, last_id = await read_entries(r, last_id)
+                if not entries:
+                    continue
+                
+                logger.info("%d new WhatsApp message(s) received!", len(entries))
+                await process_entries(r, entries, client, slots)
+                
+                if (received + len(entries)) // CACHE_STATS_EVERY > received // CACHE_STATS_EVERY:
+                    logger.info("Classification cache: %s", classify_message.cache_info())
+                received += len(entries)
+        finally:
+            await r.close()
+
+def configure_logging(level=logging.INFO) -> logging.handlers.QueueListener:
+    """Send log records through a queue so stdout writes happen off the event loop"""
+    records = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(records, logging.StreamHandler())
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.setLevel(level)
+    listener.start()
+    return listener
 
 if __name__ == "__main__":
-    monitor_whatsapp_messages()
\ No newline at end of file
+    listener = configure_logging()
+    try:
+        asyncio.run(monitor_whatsapp_messages())
+    except KeyboardInterrupt:
+        logger.info("Integration stopped by user")
+    finally:
+        listener.stop()